@@ -1,7 +1,14 @@
+import json
+import os
 import random
 import time
-import os
 import platform
+import shutil
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
 
 # Constantes
 NUMERO_JUGADORES = 4
@@ -25,21 +32,298 @@ COLORES = {
 # Nombres de los jugadores
 NOMBRES_JUGADORES = ["Rojo", "Verde", "Azul", "Amarillo"]
 
+# Eventos que emite el juego a sus oyentes
+EVENTO_TURNO = "turno"
+EVENTO_DADOS = "dados"
+EVENTO_TRES_PARES = "tres_pares"
+EVENTO_BONUS = "bonus"
+EVENTO_SALIDA = "salida"
+EVENTO_MOVIMIENTO = "movimiento"
+EVENTO_MOVIMIENTO_INVALIDO = "movimiento_invalido"
+EVENTO_LLEGADA = "llegada"
+EVENTO_CAPTURA = "captura"
+EVENTO_SIN_MOVIMIENTOS = "sin_movimientos"
+EVENTO_TURNO_EXTRA = "turno_extra"
+EVENTO_VICTORIA = "victoria"
+EVENTO_ELECCION = "eleccion"  # Movimiento elegido (índice en la lista, o None para pasar)
+EVENTO_BONUS_USADO = "bonus_usado"  # Un movimiento gastó el bonus pendiente
+EVENTO_BLOQUEO = "bloqueo"  # Un bloqueo le quitó movimientos al jugador (una vez por turno)
+
+# Distribución del estado compacto: un solo arreglo de bytes con signo.
+# Por ficha (índice = id_jugador * NUMERO_FICHAS + id_ficha) se guarda la posición
+# (-1 cárcel, -2 recta final), la casilla de la recta final y si terminó.
+# Por casilla se guarda cuántas fichas tiene cada jugador.
+FICHAS_TOTALES = NUMERO_JUGADORES * NUMERO_FICHAS
+OFFSET_POSICION = 0
+OFFSET_LLEGADA = OFFSET_POSICION + FICHAS_TOTALES
+OFFSET_TERMINADA = OFFSET_LLEGADA + FICHAS_TOTALES
+OFFSET_OCUPACION = OFFSET_TERMINADA + FICHAS_TOTALES
+OFFSET_TURNO = OFFSET_OCUPACION + TAMANO_TABLERO * NUMERO_JUGADORES
+OFFSET_DADOS = OFFSET_TURNO + 1
+OFFSET_PARES = OFFSET_DADOS + 2
+OFFSET_BONUS = OFFSET_PARES + 1
+OFFSET_ULTIMA = OFFSET_BONUS + 1
+TAMANO_ESTADO = OFFSET_ULTIMA + 1
+# Sin la ocupación de las casillas, que se puede calcular a partir de las fichas
+TAMANO_ESTADO_COMPACTO = TAMANO_ESTADO - (OFFSET_TURNO - OFFSET_OCUPACION)
+
+class EstadoJuego:
+    __slots__ = ("datos",)
+
+    def __init__(self, datos=None):
+        if datos is None:
+            datos = _ESTADO_INICIAL[:]
+        self.datos = datos
+
+    def clonar(self):
+        # Copiar el estado es copiar el arreglo
+        return EstadoJuego(self.datos[:])
+
+    def copiar_de(self, otro):
+        # Se copia en el mismo arreglo para que las fichas y el tablero
+        # que lo referencian sigan siendo válidos
+        self.datos[:] = otro.datos
+
+    def reiniciar(self):
+        self.datos[:] = _ESTADO_INICIAL
+
+    def a_bytes(self):
+        return self.datos.tobytes()
+
+    @classmethod
+    def desde_bytes(cls, contenido):
+        datos = array('b')
+        datos.frombytes(contenido)
+        if len(datos) != TAMANO_ESTADO:
+            raise ValueError(f"Se esperaban {TAMANO_ESTADO} bytes de estado y llegaron {len(datos)}")
+        return cls(datos)
+
+    def a_bytes_compactos(self):
+        # El estado sin la ocupación de las casillas
+        return self.datos[:OFFSET_OCUPACION].tobytes() + self.datos[OFFSET_TURNO:].tobytes()
+
+    @classmethod
+    def desde_bytes_compactos(cls, contenido):
+        estado = cls()
+        estado.cargar_bytes_compactos(contenido)
+        return estado
+
+    def cargar_bytes_compactos(self, contenido):
+        # Como desde_bytes_compactos, pero en el mismo arreglo (ver copiar_de)
+        if len(contenido) != TAMANO_ESTADO_COMPACTO:
+            raise ValueError(f"Se esperaban {TAMANO_ESTADO_COMPACTO} bytes de estado y llegaron {len(contenido)}")
+        datos = array('b', contenido[:OFFSET_OCUPACION])
+        datos.frombytes(_OCUPACION_VACIA)
+        datos.frombytes(contenido[OFFSET_OCUPACION:])
+        # Volver a contar las fichas de cada casilla
+        for indice in range(FICHAS_TOTALES):
+            posicion = datos[OFFSET_POSICION + indice]
+            if posicion >= 0:
+                datos[OFFSET_OCUPACION + posicion * NUMERO_JUGADORES + indice // NUMERO_FICHAS] += 1
+        self.datos[:] = datos
+
+def _crear_estado_inicial():
+    datos = array('b', bytes(TAMANO_ESTADO))
+    for i in range(FICHAS_TOTALES):
+        datos[OFFSET_POSICION + i] = -1  # Todas las fichas en la cárcel
+        datos[OFFSET_LLEGADA + i] = -1
+    datos[OFFSET_ULTIMA] = -1  # Ninguna ficha movida todavía
+    return datos
+
+_ESTADO_INICIAL = _crear_estado_inicial()
+_OCUPACION_VACIA = bytes(OFFSET_TURNO - OFFSET_OCUPACION)
+
+# Instantánea de una partida en curso, de tamaño fijo: número de jugadores, turnos
+# jugados y el estado compacto (fichas, turno, dados, pares, bonus y última ficha)
+FORMATO_INSTANTANEA = struct.Struct(f"<BI{TAMANO_ESTADO_COMPACTO}s")
+TAMANO_INSTANTANEA = FORMATO_INSTANTANEA.size
+
+# Hash de Zobrist de la ubicación de las fichas. Cada ficha tiene una clave
+# aleatoria de 64 bits por ubicación: casillas 0-67 del tablero, 68-75 de la
+# recta final, cárcel (clave 0, así la partida inicial tiene hash 0) y meta.
+# El hash es el XOR de las claves de todas las fichas y se actualiza con dos
+# XOR cada vez que una ficha cambia de ubicación.
+UBICACION_RECTA = TAMANO_TABLERO
+UBICACION_CARCEL = UBICACION_RECTA + TAMANO_LLEGADA
+UBICACION_META = UBICACION_CARCEL + 1
+UBICACIONES = UBICACION_META + 1
+
+def _crear_claves_zobrist():
+    azar = random.Random(0x5A0B)  # Semilla fija: el mismo hash en todos los procesos
+    claves = [[azar.getrandbits(64) for _ in range(UBICACIONES)] for _ in range(FICHAS_TOTALES)]
+    for claves_ficha in claves:
+        claves_ficha[UBICACION_CARCEL] = 0
+    return claves
+
+CLAVES_ZOBRIST = _crear_claves_zobrist()
+
+# Casillas del tablero: seguros cada 17 casillas empezando en 0, salidas 5 casillas
+# después de cada seguro y entradas a las rectas finales justo antes de cada salida
+SEGUROS = [0, 17, 34, 51]
+SALIDAS = [(s + 5) % TAMANO_TABLERO for s in SEGUROS]
+ENTRADAS_LLEGADA = [(s - 1) % TAMANO_TABLERO for s in SALIDAS]
+
+# Tablas de recorrido, calculadas una vez al importar. Para una ficha del jugador j
+# en la casilla p que avanza n pasos (n < PASOS_TABLA):
+# - DESTINOS[(j * TAMANO_TABLERO + p) * PASOS_TABLA + n] es la casilla de destino,
+#   UBICACION_RECTA + k si termina en la casilla k de la recta final, o -1 si se
+#   pasaría de la meta
+# - CAMINOS[p * PASOS_TABLA + n] es la máscara (como Tablero.bloqueos) de las casillas
+#   p + 1 ... p + n del tablero, dando la vuelta; se revisan todas aunque la ficha
+#   entre antes a la recta final
+# Con PASOS_TABLA pasos o más una ficha siempre se pasa de la meta.
+PASOS_TABLA = TAMANO_TABLERO + TAMANO_LLEGADA
+
+def _crear_tablas_recorrido():
+    destinos = []
+    for entrada in ENTRADAS_LLEGADA:
+        for posicion in range(TAMANO_TABLERO):
+            distancia_a_entrada = (entrada - posicion) % TAMANO_TABLERO
+            for pasos in range(PASOS_TABLA):
+                if distancia_a_entrada > pasos:
+                    destinos.append((posicion + pasos) % TAMANO_TABLERO)
+                elif pasos - distancia_a_entrada < TAMANO_LLEGADA:
+                    destinos.append(UBICACION_RECTA + pasos - distancia_a_entrada)
+                else:
+                    destinos.append(-1)
+    todas = (1 << TAMANO_TABLERO) - 1
+    caminos = []
+    for posicion in range(TAMANO_TABLERO):
+        inicio = (posicion + 1) % TAMANO_TABLERO
+        for pasos in range(PASOS_TABLA):
+            tramo = (1 << min(pasos, TAMANO_TABLERO)) - 1
+            caminos.append(((tramo << inicio) | (tramo >> (TAMANO_TABLERO - inicio))) & todas)
+    return destinos, caminos
+
+DESTINOS, CAMINOS = _crear_tablas_recorrido()
+
+# Registro para deshacer movimientos: cada entrada ocupa ANCHO_DESHACER enteros
+# con lo necesario para volver atrás (ver Juego.aplicar)
+DESHACER_FICHA = 0
+DESHACER_POSICION = 1
+DESHACER_LLEGADA = 2
+DESHACER_TERMINADA = 3
+DESHACER_CAPTURADA = 4
+DESHACER_BONUS = 5
+DESHACER_ULTIMA = 6
+DESHACER_VALIDO = 7
+ANCHO_DESHACER = 8
+
+class CacheMovimientos:
+    # Caché LRU acotada de listas de movimientos, indexada por
+    # (hash, fichas del jugador, valores de los dados)
+    def __init__(self, capacidad=65536):
+        self.capacidad = capacidad
+        self.entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        movimientos = self.entradas.get(clave)
+        if movimientos is None:
+            self.fallos += 1
+            return None
+        self.entradas.move_to_end(clave)
+        self.aciertos += 1
+        return movimientos
+
+    def guardar(self, clave, movimientos):
+        self.entradas[clave] = movimientos
+        if len(self.entradas) > self.capacidad:
+            self.entradas.popitem(last=False)
+
+    def redimensionar(self, capacidad):
+        # Al achicarla se descartan de una vez las entradas menos usadas;
+        # guardar solo expulsa una por inserción
+        self.capacidad = capacidad
+        while len(self.entradas) > capacidad:
+            self.entradas.popitem(last=False)
+
+    def limpiar(self):
+        self.entradas.clear()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def tasa_aciertos(self):
+        consultas = self.aciertos + self.fallos
+        return self.aciertos / consultas if consultas else 0.0
+
+    def estadisticas(self):
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.tasa_aciertos(),
+            "tamano": len(self.entradas),
+            "capacidad": self.capacidad,
+        }
+
+# Caché que pueden compartir todas las partidas del proceso
+CACHE_MOVIMIENTOS = CacheMovimientos()
+
 class Ficha:
-    def __init__(self, id_jugador, id_ficha):
+    # La ficha no guarda datos propios: es una vista sobre el estado compacto
+    __slots__ = ("id_jugador", "id_ficha", "indice", "datos")
+
+    def __init__(self, id_jugador, id_ficha, estado=None):
         self.id_jugador = id_jugador
         self.id_ficha = id_ficha
-        self.posicion = -1  # -1 indica en la cárcel
-        self.en_recta_final = False
-        self.posicion_llegada = -1  # -1 indica que no está en la recta final
-        self.terminada = False
+        self.indice = id_jugador * NUMERO_FICHAS + id_ficha
+        if estado is None:
+            estado = EstadoJuego()
+        self.datos = estado.datos
+
+    @property
+    def posicion(self):
+        return self.datos[OFFSET_POSICION + self.indice]
+
+    @posicion.setter
+    def posicion(self, valor):
+        self.datos[OFFSET_POSICION + self.indice] = valor
+
+    @property
+    def posicion_llegada(self):
+        return self.datos[OFFSET_LLEGADA + self.indice]
+
+    @posicion_llegada.setter
+    def posicion_llegada(self, valor):
+        self.datos[OFFSET_LLEGADA + self.indice] = valor
+
+    @property
+    def terminada(self):
+        return self.datos[OFFSET_TERMINADA + self.indice] == 1
+
+    @terminada.setter
+    def terminada(self, valor):
+        self.datos[OFFSET_TERMINADA + self.indice] = 1 if valor else 0
+
+    @property
+    def en_recta_final(self):
+        return self.datos[OFFSET_POSICION + self.indice] == -2
 
     def esta_en_carcel(self):
         return self.posicion == -1 and not self.terminada
 
+    def ubicacion(self):
+        # Código de ubicación para el hash de Zobrist
+        if self.terminada:
+            return UBICACION_META
+        posicion = self.posicion
+        if posicion == -1:
+            return UBICACION_CARCEL
+        if posicion == -2:
+            return UBICACION_RECTA + self.posicion_llegada
+        return posicion
+
+    def clave_zobrist(self):
+        return CLAVES_ZOBRIST[self.indice][self.ubicacion()]
+
     def esta_en_salida(self, tablero):
         return self.posicion == tablero.obtener_posicion_salida(self.id_jugador)
 
+    def enviar_a_carcel(self):
+        self.posicion = -1
+        self.posicion_llegada = -1
+
     def mover(self, pasos, tablero):
         if self.esta_en_carcel():
             # Si la ficha está en la cárcel, colocarla en la posición de salida
@@ -56,28 +340,22 @@ class Ficha:
             else:
                 return False  # No se puede mover, se pasaría de la llegada
         else:
-            # Verificar si está a punto de entrar en la recta final
-            posicion_actual = self.posicion
-            posicion_entrada = tablero.obtener_entrada_llegada(self.id_jugador)
-            
-            # Calcular distancia a la entrada de la recta final
-            distancia_a_entrada = (posicion_entrada - posicion_actual) % TAMANO_TABLERO
-            
-            if distancia_a_entrada <= pasos:
+            # El destino sale de la tabla de recorrido del jugador
+            if pasos >= PASOS_TABLA:
+                return False
+            destino = DESTINOS[(self.id_jugador * TAMANO_TABLERO + self.posicion) * PASOS_TABLA + pasos]
+            if destino < 0:
+                return False  # No se puede mover, se pasaría de la llegada
+            if destino >= UBICACION_RECTA:
                 # Entrar en la recta final
-                pasos_restantes = pasos - distancia_a_entrada
-                if pasos_restantes < TAMANO_LLEGADA:
-                    self.en_recta_final = True
-                    self.posicion_llegada = pasos_restantes
-                    self.posicion = -2  # Marcador para "en recta final"
-                    return True
-                else:
-                    return False  # No se puede mover, se pasaría de la llegada
-            else:
-                # Movimiento normal en el tablero
-                nueva_posicion = (posicion_actual + pasos) % TAMANO_TABLERO
-                self.posicion = nueva_posicion
+                self.posicion = -2  # Marcador para "en recta final"
+                self.posicion_llegada = destino - UBICACION_RECTA
+                if self.posicion_llegada == TAMANO_LLEGADA - 1:
+                    self.terminada = True
                 return True
+            # Movimiento normal en el tablero
+            self.posicion = destino
+            return True
     
     def __str__(self):
         if self.terminada:
@@ -90,14 +368,23 @@ class Ficha:
             return f"Jugador {self.id_jugador} Ficha {self.id_ficha} (Posición: {self.posicion})"
 
 class Tablero:
-    def __init__(self):
-        self.casillas = [{} for _ in range(TAMANO_TABLERO)]
-        # Configurar posiciones de seguro (cada 17 casillas, empezando en 0)
-        self.seguros = [0, 17, 34, 51]
-        # Configurar salidas (5 casillas después de cada seguro)
-        self.salidas = [(s + 5) % TAMANO_TABLERO for s in self.seguros]
-        # Configurar entradas a las rectas finales (cada 17 casillas, antes de cada salida)
-        self.entradas_llegada = [(s - 1) % TAMANO_TABLERO for s in self.salidas]
+    def __init__(self, estado=None):
+        # La ocupación de cada casilla vive en el estado compacto
+        if estado is None:
+            estado = EstadoJuego()
+        self.datos = estado.datos
+        # Posiciones de seguro, salidas y entradas a las rectas finales
+        self.seguros = list(SEGUROS)
+        self.salidas = list(SALIDAS)
+        self.entradas_llegada = list(ENTRADAS_LLEGADA)
+        self.especiales = set(self.seguros) | set(self.salidas)
+        # Fichas que hay en cada casilla del tablero principal
+        self.fichas_casilla = [[] for _ in range(TAMANO_TABLERO)]
+        # Máscara de 68 bits con las casillas bloqueadas (bit i = casilla i).
+        # Se mantiene al agregar y remover fichas; se recalcula si el estado
+        # se reemplaza por completo.
+        self.bloqueos = 0
+        self.recalcular_bloqueos()
     
     def obtener_posicion_salida(self, id_jugador):
         return self.salidas[id_jugador]
@@ -111,101 +398,589 @@ class Tablero:
     def es_salida(self, posicion):
         return posicion in self.salidas
     
+    def es_especial(self, posicion):
+        return posicion in self.especiales
+    
     def agregar_ficha(self, ficha):
-        if ficha.posicion >= 0:  # Solo si la ficha está en el tablero principal
-            if ficha.posicion not in self.casillas:
-                self.casillas[ficha.posicion] = {}
-            self.casillas[ficha.posicion][ficha.id_jugador] = self.casillas[ficha.posicion].get(ficha.id_jugador, 0) + 1
+        posicion = ficha.posicion
+        if posicion >= 0:  # Solo si la ficha está en el tablero principal
+            self.datos[OFFSET_OCUPACION + posicion * NUMERO_JUGADORES + ficha.id_jugador] += 1
+            self.fichas_casilla[posicion].append(ficha)
+            self.actualizar_bloqueo(posicion)
     
     def remover_ficha(self, ficha):
-        if ficha.posicion >= 0:  # Solo si la ficha está en el tablero principal
-            if ficha.posicion in self.casillas and ficha.id_jugador in self.casillas[ficha.posicion]:
-                self.casillas[ficha.posicion][ficha.id_jugador] -= 1
-                if self.casillas[ficha.posicion][ficha.id_jugador] == 0:
-                    del self.casillas[ficha.posicion][ficha.id_jugador]
+        posicion = ficha.posicion
+        if posicion >= 0:  # Solo si la ficha está en el tablero principal
+            indice = OFFSET_OCUPACION + posicion * NUMERO_JUGADORES + ficha.id_jugador
+            if self.datos[indice] > 0:
+                self.datos[indice] -= 1
+                if ficha in self.fichas_casilla[posicion]:
+                    self.fichas_casilla[posicion].remove(ficha)
+                self.actualizar_bloqueo(posicion)
     
-    def hay_bloqueo(self, posicion):
-        if posicion < 0:  # Posiciones especiales (cárcel, recta final)
-            return False
-        
-        if posicion not in self.casillas:
-            return False
+    def obtener_fichas_en_casilla(self, posicion):
+        if posicion < 0:
+            return []
+        return self.fichas_casilla[posicion]
+    
+    def contar_fichas(self, posicion, id_jugador):
+        return self.datos[OFFSET_OCUPACION + posicion * NUMERO_JUGADORES + id_jugador]
+    
+    def calcular_bloqueo(self, posicion):
+        inicio = OFFSET_OCUPACION + posicion * NUMERO_JUGADORES
+        conteos = self.datos[inicio:inicio + NUMERO_JUGADORES]
         
         # Verificar si hay dos fichas del mismo jugador en la posición
-        for jugador, num_fichas in self.casillas[posicion].items():
-            if num_fichas >= 2:
-                return True
+        if max(conteos) >= 2:
+            return True
         
         # Verificar si es seguro o salida con fichas de diferentes jugadores
-        if (self.es_seguro(posicion) or self.es_salida(posicion)) and len(self.casillas[posicion]) > 1:
+        if posicion in self.especiales and sum(conteos) > 1:
             return True
         
         return False
     
+    def actualizar_bloqueo(self, posicion):
+        if self.calcular_bloqueo(posicion):
+            self.bloqueos |= 1 << posicion
+        else:
+            self.bloqueos &= ~(1 << posicion)
+    
+    def recalcular_bloqueos(self):
+        self.bloqueos = 0
+        for posicion in range(TAMANO_TABLERO):
+            if self.calcular_bloqueo(posicion):
+                self.bloqueos |= 1 << posicion
+    
+    def reconstruir_indices(self, fichas):
+        # Volver a calcular los índices a partir del estado (después de restaurarlo).
+        # Solo una casilla con dos fichas o más puede estar bloqueada, así que no hace
+        # falta revisar todo el tablero.
+        casillas = self.fichas_casilla = [[] for _ in range(TAMANO_TABLERO)]
+        dobles = []
+        for ficha in fichas:
+            posicion = ficha.posicion
+            if posicion >= 0:
+                casilla = casillas[posicion]
+                casilla.append(ficha)
+                if len(casilla) == 2:
+                    dobles.append(posicion)
+        self.bloqueos = 0
+        for posicion in dobles:
+            if self.calcular_bloqueo(posicion):
+                self.bloqueos |= 1 << posicion
+    
+    def hay_bloqueo(self, posicion):
+        if posicion < 0:  # Posiciones especiales (cárcel, recta final)
+            return False
+        return (self.bloqueos >> posicion) & 1 == 1
+    
+    def hay_bloqueo_en_camino(self, posicion, pasos):
+        # Revisa las casillas posicion + 1 ... posicion + pasos (dando la vuelta
+        # al tablero) con una sola prueba contra la máscara del camino
+        if pasos >= PASOS_TABLA:
+            return self.bloqueos != 0
+        return self.bloqueos & CAMINOS[posicion * PASOS_TABLA + pasos] != 0
+    
+    def casillas_bloqueadas(self):
+        mascara = self.bloqueos
+        while mascara:
+            bit = mascara & -mascara
+            yield bit.bit_length() - 1
+            mascara ^= bit
+    
     def obtener_jugadores_en_casilla(self, posicion):
-        if posicion < 0 or posicion not in self.casillas:
+        if posicion < 0:
             return {}
-        return self.casillas[posicion]
+        inicio = OFFSET_OCUPACION + posicion * NUMERO_JUGADORES
+        return {jugador: n for jugador, n in enumerate(self.datos[inicio:inicio + NUMERO_JUGADORES]) if n > 0}
     
     def reiniciar(self):
-        self.casillas = [{} for _ in range(TAMANO_TABLERO)]
+        inicio = OFFSET_OCUPACION
+        fin = OFFSET_OCUPACION + TAMANO_TABLERO * NUMERO_JUGADORES
+        self.datos[inicio:fin] = _ESTADO_INICIAL[inicio:fin]
+        self.fichas_casilla = [[] for _ in range(TAMANO_TABLERO)]
+        self.bloqueos = 0
+
+class Renderizador:
+    # Dibuja el tablero en la terminal. El cuadro se arma en memoria y se escribe de
+    # una sola vez; en una terminal solo se reescriben las líneas que cambiaron
+    # (con códigos ANSI para mover el cursor). Si la salida no es una terminal
+    # (una tubería, un archivo) cada cuadro se agrega completo al final.
+    def __init__(self, salida=None):
+        self.salida = salida if salida is not None else sys.stdout
+        try:
+            self.terminal = self.salida.isatty()
+        except (AttributeError, ValueError):
+            self.terminal = False
+        # Líneas del último cuadro dibujado (None si hay que redibujar todo)
+        self.anterior = None
+        # Líneas escritas debajo del cuadro desde que se dibujó
+        self.lineas_extra = 0
+
+    def _contar(self, texto):
+        # Líneas que ocupa el texto, contando las que la terminal parte por ancho
+        columnas = max(shutil.get_terminal_size().columns, 1)
+        self.lineas_extra += sum(len(linea) // columnas + 1 for linea in texto.split("\n"))
+        # Si el texto hizo desplazar la pantalla, el cuadro ya no está arriba
+        if self.anterior is not None and len(self.anterior) + self.lineas_extra >= shutil.get_terminal_size().lines:
+            self.anterior = None
+
+    def escribir(self, texto=""):
+        self.salida.write(texto + "\n")
+        self.salida.flush()
+        if self.terminal:
+            self._contar(texto)
+
+    def leer(self, mensaje=""):
+        if self.terminal:
+            self._contar(mensaje)
+        return input(mensaje)
+
+    def limpiar(self):
+        if self.terminal:
+            self.salida.write("\033[H\033[2J")
+            self.salida.flush()
+        self.anterior = None
+        self.lineas_extra = 0
+
+    def dibujar(self, lineas):
+        if not self.terminal:
+            self.salida.write("\n".join(lineas) + "\n")
+            self.salida.flush()
+            return
+        
+        partes = []
+        if self.anterior is None:
+            partes.append("\033[H\033[2J")
+            partes.extend(linea + "\n" for linea in lineas)
+        else:
+            # Reescribir solo las líneas distintas (\033[fila;1H mueve el cursor, \033[K borra el resto)
+            for fila, linea in enumerate(lineas):
+                if fila >= len(self.anterior) or self.anterior[fila] != linea:
+                    partes.append(f"\033[{fila + 1};1H{linea}\033[K")
+            partes.append(f"\033[{len(lineas) + 1};1H")
+        # Borrar lo que quedó debajo (mensajes del turno anterior o un cuadro más largo)
+        partes.append("\033[J")
+        self.salida.write("".join(partes))
+        self.salida.flush()
+        self.anterior = list(lineas)
+        self.lineas_extra = 0
+
+class ConsolaEventos:
+    # Oyente que muestra los eventos del juego en la terminal
+    def __init__(self, renderizador=None):
+        self.renderizador = renderizador
+
+    def __call__(self, evento, datos):
+        mensaje = self.formatear(evento, datos)
+        if mensaje is not None:
+            if self.renderizador is not None:
+                self.renderizador.escribir(mensaje)
+            else:
+                print(mensaje)
+
+    def formatear(self, evento, datos):
+        reset = COLORES['RESET']
+        if evento == EVENTO_TURNO:
+            jugador = datos["jugador"]
+            return f"\n{COLORES[jugador]}{COLORES['NEGRITA']}TURNO DEL JUGADOR {NOMBRES_JUGADORES[jugador]}{reset}"
+        if evento == EVENTO_DADOS:
+            dados = datos["dados"]
+            return f"Dados: {dados[0]} y {dados[1]}"
+        if evento == EVENTO_TRES_PARES:
+            return f"{COLORES[datos['jugador']]}¡Tres pares consecutivos! La última ficha movida regresa a la cárcel.{reset}"
+        if evento == EVENTO_BONUS:
+            return f"{COLORES[datos['jugador']]}¡Bonus de {datos['valor']} movimientos disponibles!{reset}"
+        if evento == EVENTO_SALIDA:
+            ficha = datos["ficha"]
+            return f"{COLORES[ficha.id_jugador]}Sacando ficha {ficha.id_ficha} del jugador {NOMBRES_JUGADORES[ficha.id_jugador]} de la cárcel{reset}"
+        if evento == EVENTO_MOVIMIENTO:
+            ficha = datos["ficha"]
+            return f"{COLORES[ficha.id_jugador]}Moviendo ficha {ficha.id_ficha} del jugador {NOMBRES_JUGADORES[ficha.id_jugador]} {datos['pasos']} casillas{reset}"
+        if evento == EVENTO_MOVIMIENTO_INVALIDO:
+            ficha = datos["ficha"]
+            return f"{COLORES[ficha.id_jugador]}¡Movimiento no válido! La ficha no puede moverse {datos['pasos']} casillas{reset}"
+        if evento == EVENTO_LLEGADA:
+            ficha = datos["ficha"]
+            return f"{COLORES[ficha.id_jugador]}¡La ficha {ficha.id_ficha} del jugador {NOMBRES_JUGADORES[ficha.id_jugador]} ha llegado a la meta!{reset}"
+        if evento == EVENTO_CAPTURA:
+            jugador = datos["jugador"]
+            capturada = datos["ficha"]
+            return f"{COLORES[jugador]}¡El jugador {NOMBRES_JUGADORES[jugador]} ha capturado una ficha del jugador {NOMBRES_JUGADORES[capturada.id_jugador]}!{reset}"
+        if evento == EVENTO_SIN_MOVIMIENTOS:
+            return f"{COLORES[datos['jugador']]}No hay movimientos posibles. Perdiendo turno...{reset}"
+        if evento == EVENTO_TURNO_EXTRA:
+            return f"{COLORES[datos['jugador']]}¡Dados pares! Tienes otro turno.{reset}"
+        if evento == EVENTO_VICTORIA:
+            ganador = datos["jugador"]
+            return f"\n{COLORES[ganador]}{COLORES['NEGRITA']}¡EL JUGADOR {NOMBRES_JUGADORES[ganador]} HA GANADO!{reset}"
+        return None
+
+# Fuentes de dados. Una fuente tiene tirar(), que devuelve los dos dados. Los 36
+# resultados posibles se numeran 0-35 y cada uno se guarda como una tupla.
+TIRADAS_POSIBLES = [(d1, d2) for d1 in range(1, 7) for d2 in range(1, 7)]
+# Para convertir bytes al azar en tiradas: se descartan los bytes 252-255 (así
+# 0-251 se reparte por igual entre las 36 tiradas) y el resto se toma módulo 36
+_TABLA_TIRADAS = bytes(valor % 36 for valor in range(256))
+_BYTES_DESCARTADOS = bytes(range(252, 256))
+
+class FuenteDados:
+    def tirar(self):
+        raise NotImplementedError
+
+class DadosGlobales(FuenteDados):
+    # Dos llamadas a random.randint del módulo global, como siempre lo hizo el juego
+    def tirar(self):
+        return [random.randint(1, 6), random.randint(1, 6)]
+
+class DadosEnBloques(FuenteDados):
+    # Genera las tiradas por bloques de bytes y las entrega una a una. Cada subclase
+    # sabe generar un bloque y crear subflujos independientes con partida(indice),
+    # de modo que cada partida se reproduce desde la semilla y su índice sin importar
+    # qué proceso la juegue ni cuántas tiradas usaron las demás.
+    def __init__(self, bloque):
+        self.bloque = bloque
+        self.pendientes = iter(())
+
+    def generar_bloque(self):
+        raise NotImplementedError
+
+    def tirar(self):
+        for valor in self.pendientes:
+            return TIRADAS_POSIBLES[valor]
+        self.pendientes = iter(self.generar_bloque())
+        return self.tirar()
+
+class DadosAleatorios(DadosEnBloques):
+    # Bloques de random.Random(semilla).randbytes
+    def __init__(self, semilla=None, bloque=1024):
+        super().__init__(bloque)
+        if semilla is None:
+            semilla = random.SystemRandom().getrandbits(64)
+        self.semilla = semilla
+        self.azar = random.Random(semilla)
+
+    def generar_bloque(self):
+        return self.azar.randbytes(self.bloque).translate(_TABLA_TIRADAS, _BYTES_DESCARTADOS)
+
+    def partida(self, indice):
+        return DadosAleatorios(f"{self.semilla}:{indice}", self.bloque)
+
+class DadosNumpy(DadosEnBloques):
+    # Bloques de numpy.random.Generator; los subflujos usan SeedSequence, que garantiza
+    # que sean independientes entre sí. Requiere numpy.
+    def __init__(self, semilla=None, bloque=65536, clave=()):
+        import numpy as np
+        super().__init__(bloque)
+        secuencia = np.random.SeedSequence(semilla, spawn_key=clave)
+        self.semilla = secuencia.entropy
+        self.clave = clave
+        self.azar = np.random.default_rng(secuencia)
+
+    def generar_bloque(self):
+        return self.azar.integers(0, 36, self.bloque, dtype="u1").tobytes()
+
+    def partida(self, indice):
+        return DadosNumpy(self.semilla, self.bloque, self.clave + (indice,))
+
+class DadosGuionizados(FuenteDados):
+    # Entrega las tiradas de una lista en orden. Al agotarse sigue con la fuente de
+    # respaldo o, si no hay, lanza IndexError.
+    def __init__(self, tiradas, respaldo=None):
+        self.tiradas = []
+        for dado1, dado2 in tiradas:
+            if not (1 <= dado1 <= 6 and 1 <= dado2 <= 6):
+                raise ValueError(f"Tirada no válida: {dado1} y {dado2}")
+            self.tiradas.append((dado1, dado2))
+        self.indice = 0
+        self.respaldo = respaldo
+
+    @classmethod
+    def desde_texto(cls, texto, respaldo=None):
+        # Tiradas separadas por comas, por ejemplo "5 5, 3 4, 6 1"
+        tiradas = []
+        for parte in texto.split(","):
+            if parte.strip():
+                valores = [int(valor) for valor in parte.split()]
+                if len(valores) != 2:
+                    raise ValueError(f"Cada tirada lleva dos dados: {parte.strip()}")
+                tiradas.append(valores)
+        return cls(tiradas, respaldo)
+
+    def restantes(self):
+        return len(self.tiradas) - self.indice
+
+    def tirar(self):
+        if self.indice < len(self.tiradas):
+            self.indice += 1
+            return self.tiradas[self.indice - 1]
+        if self.respaldo is None:
+            raise IndexError("No quedan tiradas en el guion")
+        return self.respaldo.tirar()
+
+class DadosManuales(FuenteDados):
+    # Modo desarrollador: antes de cada tirada pregunta si lanzar al azar (con la
+    # fuente de respaldo), escribir los dos dados o cargar un guion de tiradas que
+    # se usa sin preguntar hasta que se acabe
+    def __init__(self, renderizador, respaldo):
+        self.renderizador = renderizador
+        self.respaldo = respaldo
+        self.guion = None
+
+    def tirar(self):
+        if self.guion is not None and self.guion.restantes():
+            return self.guion.tirar()
+        self.guion = None
+        while True:
+            opcion = self.renderizador.leer("¿Desea lanzar dados al azar (1), ingresar valores manualmente (2) "
+                                            "o cargar una secuencia de tiradas (3)? ")
+            if opcion == "2":
+                return [self.leer_dado("primer"), self.leer_dado("segundo")]
+            if opcion != "3":
+                return self.respaldo.tirar()
+            try:
+                guion = DadosGuionizados.desde_texto(
+                    self.renderizador.leer("Ingrese las tiradas separadas por comas (por ejemplo: 5 5, 3 4): "))
+            except ValueError as error:
+                self.renderizador.escribir(f"Tiradas no válidas: {error}")
+                continue
+            if guion.restantes():
+                self.guion = guion
+                return guion.tirar()
+
+    def leer_dado(self, cual):
+        # Se vuelve a preguntar hasta que el valor sea el de un dado
+        texto = self.renderizador.leer(f"Ingrese el valor del {cual} dado (1-6): ").strip()
+        while not (texto.isdigit() and 1 <= int(texto) <= 6):
+            texto = self.renderizador.leer("Valor no válido. Ingrese un número entre 1 y 6: ").strip()
+        return int(texto)
+
+class Jugador:
+    # Política base: decide qué movimiento hacer entre los posibles.
+    # elegir() devuelve el índice del movimiento o None para pasar.
+    # Las políticas costosas (que buscan durante decenas de milisegundos) el
+    # servidor las ejecuta fuera de su bucle de eventos.
+    costosa = False
+
+    def antes_de_lanzar(self, juego):
+        pass
+
+    def elegir(self, juego, movimientos, valores_dados):
+        raise NotImplementedError
+
+class JugadorHumano(Jugador):
+    def antes_de_lanzar(self, juego):
+        juego.renderizador.leer("Presione Enter para lanzar los dados...")
+
+    def elegir(self, juego, movimientos, valores_dados):
+        # Mostrar movimientos posibles
+        juego.renderizador.escribir("\nMovimientos posibles:")
+        for i, (ficha, pasos, indices_dados) in enumerate(movimientos):
+            dados_usados = [valores_dados[idx] for idx in indices_dados]
+            juego.renderizador.escribir(f"{i+1}. Mover ficha {ficha.id_ficha} {pasos} casillas usando {dados_usados}")
+        
+        # Sugerencia de la tabla de finales, si está cargada y cubre la posición
+        if juego.tabla_finales is not None:
+            sugerencia = juego.tabla_finales.sugerir(juego, movimientos, valores_dados)
+            if sugerencia is not None:
+                eleccion, turnos = sugerencia
+                texto = "pasar" if eleccion is None else f"movimiento {eleccion + 1}"
+                juego.renderizador.escribir(f"Sugerencia de la tabla de finales: {texto} "
+                                            f"({turnos:.1f} turnos esperados sin rivales)")
+
+        # Solicitar movimiento al jugador hasta que sea válido
+        while True:
+            seleccion = juego.renderizador.leer("Seleccione un movimiento (o presione Enter para pasar): ")
+            if not seleccion:
+                return None
+            try:
+                seleccion = int(seleccion) - 1
+                if 0 <= seleccion < len(movimientos):
+                    return seleccion
+                juego.renderizador.escribir("Selección no válida.")
+            except ValueError:
+                juego.renderizador.escribir("Por favor, ingrese un número válido.")
+
+class JugadorAleatorio(Jugador):
+    def __init__(self, semilla=None):
+        self.azar = random.Random(semilla)
+
+    def elegir(self, juego, movimientos, valores_dados):
+        return self.azar.randrange(len(movimientos))
+
+class JugadorPrimero(Jugador):
+    # Siempre toma el primer movimiento de la lista
+    def elegir(self, juego, movimientos, valores_dados):
+        return 0
 
 class Juego:
-    def __init__(self, numero_jugadores=NUMERO_JUGADORES, modo_desarrollador=False):
+    def __init__(self, numero_jugadores=NUMERO_JUGADORES, modo_desarrollador=False, politicas=None, silencioso=False,
+                 fuente_dados=None):
         self.numero_jugadores = numero_jugadores
         self.modo_desarrollador = modo_desarrollador
-        self.tablero = Tablero()
+        # En modo silencioso no se imprime, no se limpia la pantalla ni se espera entre turnos
+        self.silencioso = silencioso
+        if politicas is None:
+            politicas = [JugadorHumano() for _ in range(numero_jugadores)]
+        self.politicas = list(politicas)
+        self.renderizador = Renderizador()
+        self.oyentes = [] if silencioso else [ConsolaEventos(self.renderizador)]
+        # Si se revisa en cada turno si un bloqueo quitó movimientos (EVENTO_BLOQUEO).
+        # Cuesta una generación de movimientos extra, así que solo lo activa Instrumentacion.
+        self.contar_bloqueos = False
+        # De dónde salen los dados (FuenteDados); por defecto, el módulo random global
+        self.fuente_dados = fuente_dados if fuente_dados is not None else DadosGlobales()
+        if modo_desarrollador:
+            self.fuente_dados = DadosManuales(self.renderizador, self.fuente_dados)
+        self.turnos_jugados = 0
+        # Caché de movimientos (CacheMovimientos), desactivada por defecto: en partidas
+        # al azar casi nunca se repite una posición y la caché no compensa su costo
+        self.cache_movimientos = None
+        # Tabla de finales (tablas_finales.TablaFinales) para las sugerencias, si se cargó
+        self.tabla_finales = None
+        # Todo el estado de la partida vive en un único arreglo compacto
+        self.estado = EstadoJuego()
+        self.tablero = Tablero(self.estado)
+        self.registro_deshacer = array('h')
         self.jugadores = []
         self.fichas = []
-        self.turno_actual = 0
-        self.dados = [0, 0]
-        self.pares_consecutivos = 0
-        self.ultima_ficha_movida = None
-        self.bonus_pendiente = 0
         
         # Inicializar jugadores y fichas
         for i in range(numero_jugadores):
             self.jugadores.append(i)
             for j in range(NUMERO_FICHAS):
-                ficha = Ficha(i, j)
+                ficha = Ficha(i, j, self.estado)
                 self.fichas.append(ficha)
+        self.reconstruir_indices()
+    
+    # Los datos del turno se guardan en el estado compacto
+    @property
+    def turno_actual(self):
+        return self.estado.datos[OFFSET_TURNO]
+    
+    @turno_actual.setter
+    def turno_actual(self, valor):
+        self.estado.datos[OFFSET_TURNO] = valor
+    
+    @property
+    def dados(self):
+        return self.estado.datos[OFFSET_DADOS:OFFSET_DADOS + 2].tolist()
+    
+    @dados.setter
+    def dados(self, valores):
+        self.estado.datos[OFFSET_DADOS] = valores[0]
+        self.estado.datos[OFFSET_DADOS + 1] = valores[1]
+    
+    @property
+    def pares_consecutivos(self):
+        return self.estado.datos[OFFSET_PARES]
+    
+    @pares_consecutivos.setter
+    def pares_consecutivos(self, valor):
+        self.estado.datos[OFFSET_PARES] = valor
+    
+    @property
+    def bonus_pendiente(self):
+        return self.estado.datos[OFFSET_BONUS]
+    
+    @bonus_pendiente.setter
+    def bonus_pendiente(self, valor):
+        self.estado.datos[OFFSET_BONUS] = valor
+    
+    @property
+    def ultima_ficha_movida(self):
+        indice = self.estado.datos[OFFSET_ULTIMA]
+        return self.fichas[indice] if indice >= 0 else None
+    
+    @ultima_ficha_movida.setter
+    def ultima_ficha_movida(self, ficha):
+        self.estado.datos[OFFSET_ULTIMA] = -1 if ficha is None else ficha.indice
+    
+    def guardar_estado(self):
+        # Instantánea de la partida: una copia del arreglo de estado
+        return self.estado.clonar()
+    
+    def restaurar_estado(self, estado):
+        self.estado.copiar_de(estado)
+        self.reconstruir_indices()
+    
+    def instantanea(self):
+        # La partida en TAMANO_INSTANTANEA bytes, para guardarla y seguirla después
+        # (por ejemplo en instantaneas.AlmacenInstantaneas)
+        return FORMATO_INSTANTANEA.pack(self.numero_jugadores, self.turnos_jugados,
+                                        self.estado.a_bytes_compactos())
+    
+    def restaurar_instantanea(self, contenido):
+        numero_jugadores, turnos_jugados, compacto = FORMATO_INSTANTANEA.unpack(contenido)
+        if numero_jugadores != self.numero_jugadores:
+            raise ValueError(f"La instantánea es de una partida de {numero_jugadores} jugadores, "
+                             f"no de {self.numero_jugadores}")
+        self.estado.cargar_bytes_compactos(compacto)
+        self.turnos_jugados = turnos_jugados
+        self.reconstruir_indices()
+    
+    @classmethod
+    def desde_instantanea(cls, contenido, **opciones):
+        # Una partida nueva con el número de jugadores de la instantánea; las opciones
+        # (políticas, fuente de dados...) son las de Juego
+        juego = cls(contenido[0], **opciones)
+        juego.restaurar_instantanea(contenido)
+        return juego
+    
+    def reconstruir_indices(self):
+        # Índices derivados del estado: fichas por jugador, fichas por casilla,
+        # bloqueos y cuántas fichas ha terminado cada jugador
+        self.fichas_por_jugador = [self.fichas[i * NUMERO_FICHAS:(i + 1) * NUMERO_FICHAS]
+                                   for i in range(self.numero_jugadores)]
+        self.fichas_terminadas = [sum(ficha.terminada for ficha in fichas) for fichas in self.fichas_por_jugador]
+        self.tablero.reconstruir_indices(self.fichas)
+        self.hash = self.calcular_hash()
+        # Las marcas de aplicar ya no sirven con otro estado
+        del self.registro_deshacer[:]
+    
+    def calcular_hash(self):
+        # Hash de Zobrist calculado desde cero; normalmente se mantiene incrementalmente
+        valor = 0
+        for ficha in self.fichas:
+            valor ^= ficha.clave_zobrist()
+        return valor
+    
+    def clonar(self):
+        copia = Juego(self.numero_jugadores, self.modo_desarrollador, self.politicas, silencioso=True)
+        copia.restaurar_estado(self.estado)
+        copia.turnos_jugados = self.turnos_jugados
+        return copia
+    
+    def agregar_oyente(self, oyente):
+        # Un oyente es cualquier función oyente(evento, datos)
+        self.oyentes.append(oyente)
+    
+    def notificar(self, evento, **datos):
+        for oyente in self.oyentes:
+            oyente(evento, datos)
     
     def limpiar_pantalla(self):
-        sistema = platform.system()
-        if sistema == 'Windows':
-            os.system('cls')
-        else:
-            os.system('clear')
+        self.renderizador.limpiar()
     
     def obtener_fichas_jugador(self, id_jugador):
-        return [ficha for ficha in self.fichas if ficha.id_jugador == id_jugador]
+        return self.fichas_por_jugador[id_jugador]
     
     def obtener_ficha_por_id(self, id_jugador, id_ficha):
-        for ficha in self.fichas:
-            if ficha.id_jugador == id_jugador and ficha.id_ficha == id_ficha:
-                return ficha
+        if 0 <= id_jugador < self.numero_jugadores and 0 <= id_ficha < NUMERO_FICHAS:
+            return self.fichas_por_jugador[id_jugador][id_ficha]
         return None
     
     def lanzar_dados(self):
-        if self.modo_desarrollador:
-            opcion = input("¿Desea lanzar dados al azar (1) o ingresar valores manualmente (2)? ")
-            if opcion == "2":
-                dado1 = int(input("Ingrese el valor del primer dado (1-6): "))
-                dado2 = int(input("Ingrese el valor del segundo dado (1-6): "))
-                self.dados = [dado1, dado2]
-                return
-        
-        self.dados = [random.randint(1, 6), random.randint(1, 6)]
+        self.dados = self.fuente_dados.tirar()
     
     def verificar_pares(self):
         if self.dados[0] == self.dados[1]:
             self.pares_consecutivos += 1
-            if self.pares_consecutivos == 3 and self.ultima_ficha_movida:
-                print(f"{COLORES[self.turno_actual]}¡Tres pares consecutivos! La última ficha movida regresa a la cárcel.{COLORES['RESET']}")
-                self.tablero.remover_ficha(self.ultima_ficha_movida)
-                self.ultima_ficha_movida.posicion = -1
-                self.ultima_ficha_movida.en_recta_final = False
-                self.ultima_ficha_movida.posicion_llegada = -1
+            # Una ficha que ya llegó a la meta no regresa a la cárcel
+            if self.pares_consecutivos == 3 and self.ultima_ficha_movida and not self.ultima_ficha_movida.terminada:
+                self.notificar(EVENTO_TRES_PARES, jugador=self.turno_actual, ficha=self.ultima_ficha_movida)
+                self.enviar_a_carcel(self.ultima_ficha_movida)
                 self.pares_consecutivos = 0
             return True
         else:
@@ -213,20 +988,30 @@ class Juego:
             return False
     
     def verificar_victoria(self, id_jugador):
-        fichas_jugador = self.obtener_fichas_jugador(id_jugador)
-        return all(ficha.terminada for ficha in fichas_jugador)
+        return self.fichas_terminadas[id_jugador] == NUMERO_FICHAS
+    
+    def buscar_captura(self, posicion, id_jugador):
+        # Ficha rival que se capturaría en la posición (la de menor índice,
+        # como al recorrer self.fichas en orden), o None
+        capturable = None
+        for ficha in self.tablero.obtener_fichas_en_casilla(posicion):
+            if ficha.id_jugador != id_jugador and (capturable is None or ficha.indice < capturable.indice):
+                capturable = ficha
+        return capturable
+    
+    def enviar_a_carcel(self, ficha):
+        self.tablero.remover_ficha(ficha)
+        self.hash ^= ficha.clave_zobrist()
+        ficha.enviar_a_carcel()
     
     def capturar_ficha(self, posicion, id_jugador):
         # Buscar fichas en la posición que no sean del jugador actual
-        for ficha in self.fichas:
-            if ficha.posicion == posicion and ficha.id_jugador != id_jugador:
-                print(f"{COLORES[id_jugador]}¡El jugador {NOMBRES_JUGADORES[id_jugador]} ha capturado una ficha del jugador {NOMBRES_JUGADORES[ficha.id_jugador]}!{COLORES['RESET']}")
-                self.tablero.remover_ficha(ficha)
-                ficha.posicion = -1
-                ficha.en_recta_final = False
-                ficha.posicion_llegada = -1
-                return True
-        return False
+        ficha = self.buscar_captura(posicion, id_jugador)
+        if ficha is None:
+            return False
+        self.notificar(EVENTO_CAPTURA, jugador=id_jugador, ficha=ficha)
+        self.enviar_a_carcel(ficha)
+        return True
     
     def ficha_puede_moverse(self, ficha, pasos):
         # Si la ficha está en la cárcel, solo puede salir con un 5
@@ -237,27 +1022,58 @@ class Juego:
         if ficha.en_recta_final:
             return ficha.posicion_llegada + pasos < TAMANO_LLEGADA
         
-        # Verificar si hay bloqueos en el camino
+        # Verificar si hay bloqueos en el camino: solo se puede avanzar hasta el bloqueo - 1
         posicion_actual = ficha.posicion
-        for i in range(1, pasos + 1):
-            posicion_siguiente = (posicion_actual + i) % TAMANO_TABLERO
-            
-            # Si hay un bloqueo, solo podemos avanzar hasta el bloqueo - 1
-            if self.tablero.hay_bloqueo(posicion_siguiente):
-                return False
-        
-        # Verificar si está por entrar a la recta final
-        posicion_entrada = self.tablero.obtener_entrada_llegada(ficha.id_jugador)
-        distancia_a_entrada = (posicion_entrada - posicion_actual) % TAMANO_TABLERO
-        
-        if distancia_a_entrada <= pasos:
-            # Si entraría a la recta final, verificar que no se pase
-            pasos_restantes = pasos - distancia_a_entrada
-            return pasos_restantes < TAMANO_LLEGADA
+        if self.tablero.hay_bloqueo_en_camino(posicion_actual, pasos):
+            return False
         
-        return True
+        # Verificar en la tabla de recorrido que no se pase de la meta
+        if pasos >= PASOS_TABLA:
+            return False
+        return DESTINOS[(ficha.id_jugador * TAMANO_TABLERO + posicion_actual) * PASOS_TABLA + pasos] >= 0
     
     def obtener_movimientos_posibles(self, fichas, valores_dados):
+        # Los movimientos solo dependen de dónde están las fichas (el hash), de qué
+        # fichas se mueven y de los dados, así que se guardan en la caché como
+        # (índice de ficha, pasos, índices de dados)
+        cache = self.cache_movimientos
+        if cache is None:
+            return self.calcular_movimientos_posibles(fichas, valores_dados)
+        clave = (self.hash, tuple(ficha.indice for ficha in fichas), tuple(valores_dados))
+        guardados = cache.obtener(clave)
+        if guardados is None:
+            movimientos = self.calcular_movimientos_posibles(fichas, valores_dados)
+            cache.guardar(clave, tuple((ficha.indice, pasos, tuple(indices)) for ficha, pasos, indices in movimientos))
+            return movimientos
+        # Listas nuevas de índices: pasos_turno las ordena en el sitio
+        return [(self.fichas[indice], pasos, list(indices)) for indice, pasos, indices in guardados]
+    
+    def bloqueo_quita_movimientos(self, fichas, valores_dados):
+        # Si un bloqueo impide alguno de los movimientos que habría sin bloqueos. Se
+        # prueba contra la máscara directamente para no contar como consultas de
+        # bloqueo del motor.
+        bloqueos = self.tablero.bloqueos
+        if not bloqueos:
+            return False
+        if any(f.esta_en_carcel() for f in fichas) and (SALIDA_FICHAS in valores_dados or
+                                                         sum(valores_dados) == SALIDA_FICHAS):
+            # Con un 5 la única opción es sacar una ficha, haya o no bloqueos
+            return False
+        candidatos = set(valores_dados)
+        if len(valores_dados) > 1 and valores_dados[0] != valores_dados[1]:
+            candidatos.add(sum(valores_dados))
+        for ficha in fichas:
+            if ficha.terminada or ficha.esta_en_carcel() or ficha.en_recta_final:
+                continue
+            posicion = ficha.posicion
+            base = (ficha.id_jugador * TAMANO_TABLERO + posicion) * PASOS_TABLA
+            for pasos in candidatos:
+                if (pasos < PASOS_TABLA and DESTINOS[base + pasos] >= 0
+                        and bloqueos & CAMINOS[posicion * PASOS_TABLA + pasos]):
+                    return True
+        return False
+    
+    def calcular_movimientos_posibles(self, fichas, valores_dados):
         movimientos = []
         
         # Primero, verificar si hay fichas en la cárcel que pueden salir
@@ -286,43 +1102,49 @@ class Juego:
         
         return movimientos
     
-    def realizar_movimiento(self, ficha, pasos):
-        # Guardar la posición actual para verificar capturas después
-        posicion_anterior = ficha.posicion
+    def aplicar(self, movimiento):
+        # Hace el movimiento (ficha, pasos, índices de dados) sin emitir eventos y
+        # devuelve una marca para deshacerlo. Los movimientos se deshacen en orden inverso.
+        ficha, pasos = movimiento[0], movimiento[1]
+        registro = self.registro_deshacer
+        marca = len(registro)
+        registro.append(ficha.indice)
+        registro.append(ficha.posicion)
+        registro.append(ficha.posicion_llegada)
+        registro.append(ficha.terminada)
+        registro.append(-1)
+        registro.append(self.bonus_pendiente)
+        registro.append(self.estado.datos[OFFSET_ULTIMA])
+        registro.append(0)
         
         # Remover la ficha del tablero temporalmente
         self.tablero.remover_ficha(ficha)
+        self.hash ^= ficha.clave_zobrist()
         
-        # Mover la ficha
-        if ficha.esta_en_carcel():
-            print(f"{COLORES[ficha.id_jugador]}Sacando ficha {ficha.id_ficha} del jugador {NOMBRES_JUGADORES[ficha.id_jugador]} de la cárcel{COLORES['RESET']}")
-        else:
-            print(f"{COLORES[ficha.id_jugador]}Moviendo ficha {ficha.id_ficha} del jugador {NOMBRES_JUGADORES[ficha.id_jugador]} {pasos} casillas{COLORES['RESET']}")
-        
-        puede_moverse = ficha.mover(pasos, self.tablero)
+        if not ficha.mover(pasos, self.tablero):
+            # Si no pudo moverse, la ficha queda donde estaba
+            self.tablero.agregar_ficha(ficha)
+            self.hash ^= ficha.clave_zobrist()
+            return marca
         
-        if not puede_moverse:
-            print(f"{COLORES[ficha.id_jugador]}¡Movimiento no válido! La ficha no puede moverse {pasos} casillas{COLORES['RESET']}")
-            # Si no pudo moverse, restaurar su posición
-            if not ficha.esta_en_carcel():
-                ficha.posicion = posicion_anterior
-                self.tablero.agregar_ficha(ficha)
-            return False
+        registro[marca + DESHACER_VALIDO] = 1
+        self.hash ^= ficha.clave_zobrist()
         
         # Verificar si ha llegado a la meta
         if ficha.terminada:
-            print(f"{COLORES[ficha.id_jugador]}¡La ficha {ficha.id_ficha} del jugador {NOMBRES_JUGADORES[ficha.id_jugador]} ha llegado a la meta!{COLORES['RESET']}")
+            self.fichas_terminadas[ficha.id_jugador] += 1
             # Otorgar bonus por llegar a la meta
             self.bonus_pendiente += BONUS_LLEGADA
-            return True
+            return marca
         
         # Agregar la ficha en su nueva posición si no está en la recta final
         if not ficha.en_recta_final:
             # Verificar si hay capturas en la nueva posición
-            hay_captura = False
-            if not self.tablero.es_seguro(ficha.posicion) and not self.tablero.es_salida(ficha.posicion):
-                hay_captura = self.capturar_ficha(ficha.posicion, ficha.id_jugador)
-                if hay_captura:
+            if not self.tablero.es_especial(ficha.posicion):
+                capturada = self.buscar_captura(ficha.posicion, ficha.id_jugador)
+                if capturada is not None:
+                    registro[marca + DESHACER_CAPTURADA] = capturada.indice
+                    self.enviar_a_carcel(capturada)
                     # Otorgar bonus por captura
                     self.bonus_pendiente += BONUS_CAPTURA
             
@@ -330,17 +1152,173 @@ class Juego:
             self.tablero.agregar_ficha(ficha)
         
         self.ultima_ficha_movida = ficha
+        return marca
+    
+    def movimiento_valido(self, marca):
+        return self.registro_deshacer[marca + DESHACER_VALIDO] == 1
+    
+    def ficha_capturada(self, marca):
+        indice = self.registro_deshacer[marca + DESHACER_CAPTURADA]
+        return self.fichas[indice] if indice >= 0 else None
+    
+    def deshacer(self, marca):
+        registro = self.registro_deshacer
+        if marca + ANCHO_DESHACER != len(registro):
+            raise ValueError("Los movimientos se deben deshacer en orden inverso")
+        
+        if registro[marca + DESHACER_VALIDO]:
+            ficha = self.fichas[registro[marca + DESHACER_FICHA]]
+            
+            # Devolver la ficha capturada a la casilla de destino
+            indice_capturada = registro[marca + DESHACER_CAPTURADA]
+            if indice_capturada >= 0:
+                capturada = self.fichas[indice_capturada]
+                self.hash ^= capturada.clave_zobrist()
+                capturada.posicion = ficha.posicion
+                self.tablero.agregar_ficha(capturada)
+                self.hash ^= capturada.clave_zobrist()
+            
+            if ficha.terminada and not registro[marca + DESHACER_TERMINADA]:
+                self.fichas_terminadas[ficha.id_jugador] -= 1
+            
+            # Devolver la ficha a donde estaba
+            self.tablero.remover_ficha(ficha)
+            self.hash ^= ficha.clave_zobrist()
+            ficha.posicion = registro[marca + DESHACER_POSICION]
+            ficha.posicion_llegada = registro[marca + DESHACER_LLEGADA]
+            ficha.terminada = registro[marca + DESHACER_TERMINADA]
+            self.tablero.agregar_ficha(ficha)
+            self.hash ^= ficha.clave_zobrist()
+            
+            self.bonus_pendiente = registro[marca + DESHACER_BONUS]
+            self.estado.datos[OFFSET_ULTIMA] = registro[marca + DESHACER_ULTIMA]
+        
+        del registro[marca:]
+    
+    def iterar_planes_turno(self, valores_dados, jugador=None, permitir_pasar=True, al_expandir=None):
+        # Genera los planes completos de un turno con estos valores: tuplas de
+        # movimientos (ficha, pasos, índices de dados) en el orden en que se eligen en
+        # pasos_turno, con los índices de los valores que quedan en ese momento. Un plan
+        # termina al pasar (si permitir_pasar), al acabarse los valores o los
+        # movimientos, o al ganar. Se generan bajo demanda, así una búsqueda puede
+        # detenerse en cualquier momento.
+        #
+        # Se descartan los planes equivalentes: las fichas del jugador en la misma
+        # ubicación son intercambiables, así que de ellas se prueba una sola; de los
+        # planes que dejan el mismo estado solo sale el primero, y un estado al que se
+        # llega otra vez con los mismos valores por usar no se vuelve a recorrer. El
+        # estado se compara por las ubicaciones de las fichas del jugador (sin importar
+        # cuál es cuál), el hash de las demás, el bonus pendiente y, si la tirada es
+        # par, la ubicación de la última ficha movida (sin pares solo importaría si
+        # después vinieran tres pares seguidos sin ningún movimiento).
+        #
+        # Mientras el generador está detenido en un plan, la partida queda en la
+        # posición que resulta de ese plan (para evaluarla sin volver a aplicarlo); al
+        # pedir el siguiente, o al cerrar el generador, se deshace con deshacer().
+        #
+        # al_expandir, si se da, se llama antes de expandir cada estado; entre dos
+        # planes puede haber muchos estados sin plan nuevo, y una búsqueda con plazo
+        # puede lanzar una excepción desde ahí (lo aplicado se deshace igual).
+        if jugador is None:
+            jugador = self.turno_actual
+        fichas = self.obtener_fichas_jugador(jugador)
+        distinguir_ultima = self.dados[0] == self.dados[1]
+        return self._planes_desde(fichas, jugador, list(valores_dados), [], set(), set(), permitir_pasar,
+                                  distinguir_ultima, al_expandir)
+    
+    def _clave_plan(self, fichas, ubicaciones, distinguir_ultima):
+        otras = self.hash
+        for ficha, ubicacion in zip(fichas, ubicaciones):
+            otras ^= CLAVES_ZOBRIST[ficha.indice][ubicacion]
+        clave = (otras, tuple(sorted(ubicaciones)), self.bonus_pendiente)
+        if distinguir_ultima:
+            ultima = self.ultima_ficha_movida
+            clave += (None if ultima is None else ultima.ubicacion(),)
+        return clave
+    
+    def _planes_desde(self, fichas, jugador, valores_dados, plan, vistos, expandidos, permitir_pasar,
+                      distinguir_ultima, al_expandir):
+        if al_expandir is not None:
+            al_expandir()
+        ubicaciones = [ficha.ubicacion() for ficha in fichas]
+        clave = self._clave_plan(fichas, ubicaciones, distinguir_ultima)
+        # Desde el mismo estado y con los mismos valores salen los mismos planes
+        nodo = (clave, tuple(sorted(valores_dados)))
+        if nodo in expandidos:
+            return
+        expandidos.add(nodo)
+        
+        movimientos = self.obtener_movimientos_posibles(fichas, valores_dados) if valores_dados else []
+        if (permitir_pasar or not movimientos) and clave not in vistos:
+            vistos.add(clave)
+            yield tuple(plan)
+        
+        # De las fichas en la misma ubicación solo se mueve la primera
+        primeras = {}
+        for ficha, ubicacion in zip(fichas, ubicaciones):
+            primeras.setdefault(ubicacion, ficha.indice)
+        representantes = set(primeras.values())
+        for movimiento in movimientos:
+            ficha, pasos, indices = movimiento
+            if ficha.indice not in representantes:
+                continue
+            marca = self.aplicar(movimiento)
+            try:
+                if not self.movimiento_valido(marca):
+                    continue
+                plan.append(movimiento)
+                if self.verificar_victoria(jugador):
+                    final = self._clave_plan(fichas, [ficha.ubicacion() for ficha in fichas], distinguir_ultima)
+                    if final not in vistos:
+                        vistos.add(final)
+                        yield tuple(plan)
+                else:
+                    restantes = [valor for i, valor in enumerate(valores_dados) if i not in indices]
+                    yield from self._planes_desde(fichas, jugador, restantes, plan, vistos, expandidos,
+                                                  permitir_pasar, distinguir_ultima, al_expandir)
+                plan.pop()
+            finally:
+                self.deshacer(marca)
+    
+    def obtener_planes_turno(self, valores_dados, jugador=None, permitir_pasar=True):
+        # Todos los planes de iterar_planes_turno; al volver, la partida está como antes
+        return list(self.iterar_planes_turno(valores_dados, jugador, permitir_pasar))
+    
+    def realizar_movimiento(self, ficha, pasos):
+        if ficha.esta_en_carcel():
+            self.notificar(EVENTO_SALIDA, ficha=ficha)
+        else:
+            self.notificar(EVENTO_MOVIMIENTO, ficha=ficha, pasos=pasos)
+        
+        marca = self.aplicar((ficha, pasos))
+        valido = self.movimiento_valido(marca)
+        capturada = self.ficha_capturada(marca)
+        # Fuera de una búsqueda no hace falta conservar el registro
+        del self.registro_deshacer[marca:]
+        
+        if not valido:
+            self.notificar(EVENTO_MOVIMIENTO_INVALIDO, ficha=ficha, pasos=pasos)
+            return False
+        if ficha.terminada:
+            self.notificar(EVENTO_LLEGADA, ficha=ficha)
+        elif capturada is not None:
+            self.notificar(EVENTO_CAPTURA, jugador=ficha.id_jugador, ficha=capturada)
         return True
     
-    def jugar_turno(self):
+    def pasos_turno(self, dados=None):
+        # Generador con la lógica de un turno. Produce (movimientos, valores_dados)
+        # cada vez que hace falta una decisión y recibe con send() el índice del
+        # movimiento elegido (o None para pasar). Al terminar devuelve True si hubo victoria.
+        # Con dados se usan esos valores en lugar de lanzar (para reproducir partidas).
         jugador_actual = self.jugadores[self.turno_actual]
         fichas_jugador = self.obtener_fichas_jugador(jugador_actual)
+        self.turnos_jugados += 1
         
-        print(f"\n{COLORES[jugador_actual]}{COLORES['NEGRITA']}TURNO DEL JUGADOR {NOMBRES_JUGADORES[jugador_actual]}{COLORES['RESET']}")
-        input("Presione Enter para lanzar los dados...")
-        
-        self.lanzar_dados()
-        print(f"Dados: {self.dados[0]} y {self.dados[1]}")
+        if dados is None:
+            self.lanzar_dados()
+        else:
+            self.dados = dados
+        self.notificar(EVENTO_DADOS, jugador=jugador_actual, dados=self.dados)
         
         # Verificar si son pares
         es_par = self.verificar_pares()
@@ -348,82 +1326,105 @@ class Juego:
         # Lista para almacenar los valores de los dados disponibles
         valores_dados = self.dados.copy()
         
-        # Si hay un bonus pendiente, agregarlo a los valores disponibles
-        if self.bonus_pendiente > 0:
-            print(f"{COLORES[jugador_actual]}¡Bonus de {self.bonus_pendiente} movimientos disponibles!{COLORES['RESET']}")
-            valores_dados.append(self.bonus_pendiente)
+        # Si hay un bonus pendiente, agregarlo a los valores disponibles.
+        # Mientras no se use, el bonus es siempre el último valor de la lista.
+        valor_bonus = self.bonus_pendiente
+        if valor_bonus > 0:
+            self.notificar(EVENTO_BONUS, jugador=jugador_actual, valor=valor_bonus)
+            valores_dados.append(valor_bonus)
             self.bonus_pendiente = 0
         
+        bloqueo_notificado = False
         while valores_dados:
-            self.mostrar_tablero()
+            if not self.silencioso:
+                self.mostrar_tablero()
             
             # Obtener movimientos posibles
             movimientos_posibles = self.obtener_movimientos_posibles(fichas_jugador, valores_dados)
             
+            # El bloqueo se revisa solo si la instrumentación lo cuenta, y se avisa una vez por turno
+            if (not bloqueo_notificado and self.contar_bloqueos
+                    and self.bloqueo_quita_movimientos(fichas_jugador, valores_dados)):
+                self.notificar(EVENTO_BLOQUEO, jugador=jugador_actual)
+                bloqueo_notificado = True
+            
             if not movimientos_posibles:
-                print(f"{COLORES[jugador_actual]}No hay movimientos posibles. Perdiendo turno...{COLORES['RESET']}")
-                valores_dados = []
+                self.notificar(EVENTO_SIN_MOVIMIENTOS, jugador=jugador_actual)
                 break
             
-            # Mostrar movimientos posibles
-            print("\nMovimientos posibles:")
-            for i, (ficha, pasos, indices_dados) in enumerate(movimientos_posibles):
-                dados_usados = [valores_dados[idx] for idx in indices_dados]
-                print(f"{i+1}. Mover ficha {ficha.id_ficha} {pasos} casillas usando {dados_usados}")
-            
-            # Solicitar movimiento al jugador
-            seleccion = input("Seleccione un movimiento (o presione Enter para pasar): ")
-            if not seleccion:
-                valores_dados = []
+            # Pedir la decisión a quien conduce el turno
+            seleccion = yield movimientos_posibles, valores_dados
+            self.notificar(EVENTO_ELECCION, jugador=jugador_actual, indice=seleccion)
+            if seleccion is None:
                 break
             
-            try:
-                seleccion = int(seleccion) - 1
-                if 0 <= seleccion < len(movimientos_posibles):
-                    ficha, pasos, indices_dados = movimientos_posibles[seleccion]
-                    
-                    # Realizar el movimiento
-                    movimiento_exitoso = self.realizar_movimiento(ficha, pasos)
-                    
-                    if movimiento_exitoso:
-                        # Remover los dados usados
-                        indices_dados.sort(reverse=True)
-                        for idx in indices_dados:
-                            valores_dados.pop(idx)
-                    
-                    # Verificar victoria
-                    if self.verificar_victoria(jugador_actual):
-                        return True
-                else:
-                    print("Selección no válida.")
-            except ValueError:
-                print("Por favor, ingrese un número válido.")
+            ficha, pasos, indices_dados = movimientos_posibles[seleccion]
+            
+            # Realizar el movimiento
+            movimiento_exitoso = self.realizar_movimiento(ficha, pasos)
+            
+            if movimiento_exitoso:
+                if valor_bonus and len(valores_dados) - 1 in indices_dados:
+                    self.notificar(EVENTO_BONUS_USADO, jugador=jugador_actual, valor=valor_bonus)
+                    valor_bonus = 0
+                # Remover los dados usados
+                indices_dados.sort(reverse=True)
+                for idx in indices_dados:
+                    valores_dados.pop(idx)
+            
+            # Verificar victoria
+            if self.verificar_victoria(jugador_actual):
+                return True
         
         # Cambiar al siguiente turno si no son pares
         if not es_par:
             self.turno_actual = (self.turno_actual + 1) % self.numero_jugadores
         else:
-            print(f"{COLORES[jugador_actual]}¡Dados pares! Tienes otro turno.{COLORES['RESET']}")
+            self.notificar(EVENTO_TURNO_EXTRA, jugador=jugador_actual)
         
         return False
     
-    def mostrar_tablero(self):
-        self.limpiar_pantalla()
+    def jugar_turno(self, dados=None):
+        jugador_actual = self.jugadores[self.turno_actual]
+        politica = self.politicas[jugador_actual]
+        
+        self.notificar(EVENTO_TURNO, jugador=jugador_actual)
+        politica.antes_de_lanzar(self)
         
+        turno = self.pasos_turno(dados)
+        try:
+            movimientos_posibles, valores_dados = next(turno)
+            while True:
+                seleccion = politica.elegir(self, movimientos_posibles, valores_dados)
+                movimientos_posibles, valores_dados = turno.send(seleccion)
+        except StopIteration as fin:
+            return fin.value
+    
+    def jugar_partida(self, max_turnos=None):
+        # Juega hasta que alguien gane y devuelve el ganador (None si se alcanza max_turnos)
+        while max_turnos is None or self.turnos_jugados < max_turnos:
+            if self.jugar_turno():
+                ganador = self.jugadores[self.turno_actual]
+                self.notificar(EVENTO_VICTORIA, jugador=ganador)
+                return ganador
+        return None
+    
+    def mostrar_tablero(self):
         # Crear representación del tablero
         ancho = 70
+        lineas = []
         
-        # Imprimir encabezado
-        print("=" * ancho)
-        print(f"{' PARQUÉS UN ':=^{ancho}}")
-        print("=" * ancho)
+        # Agregar encabezado
+        lineas.append("=" * ancho)
+        lineas.append(f"{' PARQUÉS UN ':=^{ancho}}")
+        lineas.append("=" * ancho)
         
-        # Imprimir información del turno actual
-        print(f"Turno del jugador: {COLORES[self.turno_actual]}{NOMBRES_JUGADORES[self.turno_actual]}{COLORES['RESET']}")
-        print(f"Dados: {self.dados[0]} y {self.dados[1]}")
-        print("-" * ancho)
+        # Agregar información del turno actual
+        lineas.append(f"Turno del jugador: {COLORES[self.turno_actual]}{NOMBRES_JUGADORES[self.turno_actual]}{COLORES['RESET']}")
+        lineas.append(f"Dados: {self.dados[0]} y {self.dados[1]}")
+        lineas.append("-" * ancho)
         
-        # Imprimir información de cada jugador
+        # Agregar información de cada jugador
         for i in range(self.numero_jugadores):
             fichas_jugador = self.obtener_fichas_jugador(i)
             en_carcel = [f.id_ficha for f in fichas_jugador if f.esta_en_carcel()]
@@ -431,61 +1432,80 @@ class Juego:
             en_llegada = [(f.id_ficha, f.posicion_llegada) for f in fichas_jugador if f.en_recta_final and not f.terminada]
             terminadas = [f.id_ficha for f in fichas_jugador if f.terminada]
             
-            print(f"{COLORES[i]}Jugador {NOMBRES_JUGADORES[i]}:{COLORES['RESET']}")
-            print(f"  En cárcel: {en_carcel}")
-            print(f"  En tablero: {en_tablero}")
-            print(f"  En llegada: {en_llegada}")
-            print(f"  Terminadas: {terminadas}")
+            lineas.append(f"{COLORES[i]}Jugador {NOMBRES_JUGADORES[i]}:{COLORES['RESET']}")
+            lineas.append(f"  En cárcel: {en_carcel}")
+            lineas.append(f"  En tablero: {en_tablero}")
+            lineas.append(f"  En llegada: {en_llegada}")
+            lineas.append(f"  Terminadas: {terminadas}")
         
-        print("-" * ancho)
+        lineas.append("-" * ancho)
         
-        # Imprimir información de las casillas de seguro y salida
-        print("Casillas de seguro:", self.tablero.seguros)
-        print("Casillas de salida:", self.tablero.salidas)
+        # Agregar información de las casillas de seguro y salida
+        lineas.append(f"Casillas de seguro: {self.tablero.seguros}")
+        lineas.append(f"Casillas de salida: {self.tablero.salidas}")
         
-        # Imprimir información de bloqueos
-        bloqueos = []
-        for pos in range(TAMANO_TABLERO):
-            if self.tablero.hay_bloqueo(pos):
-                jugadores = self.tablero.obtener_jugadores_en_casilla(pos)
-                bloqueos.append((pos, jugadores))
+        # Agregar información de bloqueos
+        bloqueos = [(pos, self.tablero.obtener_jugadores_en_casilla(pos)) for pos in self.tablero.casillas_bloqueadas()]
         
         if bloqueos:
-            print("\nBloqueos actuales:")
+            lineas.append("")
+            lineas.append("Bloqueos actuales:")
             for pos, jugadores in bloqueos:
                 jugadores_info = ", ".join([f"{COLORES[j]}{NOMBRES_JUGADORES[j]}({n}){COLORES['RESET']}" for j, n in jugadores.items()])
-                print(f"  Posición {pos}: {jugadores_info}")
+                lineas.append(f"  Posición {pos}: {jugadores_info}")
         
-        print("=" * ancho)
+        lineas.append("=" * ancho)
+        
+        # Escribir el cuadro de una sola vez
+        self.renderizador.dibujar(lineas)
     
     def jugar(self):
         self.limpiar_pantalla()
-        print("""
+        self.renderizador.escribir("""
 ╔═══════════════════════════════════════════╗
 ║                PARQUÉS UN                  ║
 ╚═══════════════════════════════════════════╝
 """)
         
         # Configurar el juego
-        num_jugadores = int(input("Ingrese el número de jugadores (2-4): "))
+        num_jugadores = int(self.renderizador.leer("Ingrese el número de jugadores (2-4): "))
         while num_jugadores < 2 or num_jugadores > 4:
-            num_jugadores = int(input("Número no válido. Ingrese un número entre 2 y 4: "))
+            num_jugadores = int(self.renderizador.leer("Número no válido. Ingrese un número entre 2 y 4: "))
         self.numero_jugadores = num_jugadores
         
         # Configurar modo de juego
-        modo = input("Seleccione el modo de juego:\n1. Modo normal\n2. Modo desarrollador\nOpción: ")
+        modo = self.renderizador.leer("Seleccione el modo de juego:\n1. Modo normal\n2. Modo desarrollador\nOpción: ")
         self.modo_desarrollador = (modo == "2")
+        # El juego pudo crearse ya en modo desarrollador: no se envuelve dos veces
+        manuales = isinstance(self.fuente_dados, DadosManuales)
+        if self.modo_desarrollador and not manuales:
+            self.fuente_dados = DadosManuales(self.renderizador, self.fuente_dados)
+        elif not self.modo_desarrollador and manuales:
+            self.fuente_dados = self.fuente_dados.respaldo
+        
+        # Los últimos asientos pueden ser de la computadora
+        num_computador = int(self.renderizador.leer(f"¿Cuántos jugadores controla la computadora? (0-{num_jugadores - 1}): "))
+        while num_computador < 0 or num_computador >= num_jugadores:
+            num_computador = int(self.renderizador.leer(f"Número no válido. Ingrese un número entre 0 y {num_jugadores - 1}: "))
         
         # Inicializar el juego
-        self.tablero.reiniciar()
+        self.estado.reiniciar()
         self.jugadores = list(range(num_jugadores))
+        # La tabla de finales se usa si ya se generó (python tablas_finales.py)
+        from tablas_finales import abrir_tabla_finales
+        self.tabla_finales = abrir_tabla_finales()
+        self.politicas = [JugadorHumano() for _ in range(num_jugadores - num_computador)]
+        if num_computador:
+            from computador import JugadorComputador
+            self.politicas += [JugadorComputador(tabla_finales=self.tabla_finales) for _ in range(num_computador)]
         self.fichas = []
-        self.turno_actual = 0
+        self.turnos_jugados = 0
         
         for i in range(num_jugadores):
             for j in range(NUMERO_FICHAS):
-                ficha = Ficha(i, j)
+                ficha = Ficha(i, j, self.estado)
                 self.fichas.append(ficha)
+        self.reconstruir_indices()
         
         # Loop principal del juego
         juego_terminado = False
@@ -494,15 +1514,217 @@ class Juego:
             if victoria:
                 self.mostrar_tablero()
                 ganador = self.jugadores[self.turno_actual]
-                print(f"\n{COLORES[ganador]}{COLORES['NEGRITA']}¡EL JUGADOR {NOMBRES_JUGADORES[ganador]} HA GANADO!{COLORES['RESET']}")
+                self.notificar(EVENTO_VICTORIA, jugador=ganador)
                 juego_terminado = True
             
             time.sleep(1)
         
-        print("\nGracias por jugar Parqués UN")
-        input("Presione Enter para salir...")
+        self.renderizador.escribir("\nGracias por jugar Parqués UN")
+        self.renderizador.leer("Presione Enter para salir...")
+
+class Instrumentacion:
+    # Mide tiempo y llamadas de las partes calientes del motor y cuenta eventos de
+    # la partida. Al instrumentar un juego se tapan sus métodos con envolturas en la
+    # propia instancia (la clase no cambia), así que un juego sin instrumentar no
+    # paga nada. Los tiempos son inclusivos: la generación de movimientos incluye
+    # las consultas de bloqueo que hace. Los eventos salen de los oyentes del juego,
+    # no de las fases medidas: bloqueos_encontrados cuenta los turnos en que un
+    # bloqueo le quitó movimientos al jugador (EVENTO_BLOQUEO), con o sin la caché
+    # de movimientos. Una instancia puede acumular muchas partidas.
+    # (fase, atributo del juego que tiene el método o None para el juego, método)
+    FASES = (
+        ("dados", None, "lanzar_dados"),
+        ("movimientos", None, "obtener_movimientos_posibles"),
+        ("bloqueos", "tablero", "hay_bloqueo_en_camino"),
+        ("capturas", None, "buscar_captura"),
+        ("renderizado", None, "mostrar_tablero"),
+    )
+    EVENTOS = ("capturas", "bloqueos_encontrados", "tres_pares", "bonus_usados", "turnos_perdidos")
+
+    def __init__(self):
+        self.partidas = 0
+        self.turnos = 0
+        self.llamadas = {fase: 0 for fase, _, _ in self.FASES}
+        self.segundos = {fase: 0.0 for fase, _, _ in self.FASES}
+        self.eventos = {evento: 0 for evento in self.EVENTOS}
+        # Si el jugador de turno ya movió o perdió el turno
+        self.turno_resuelto = True
+        self.temporizador = None
+
+    def instrumentar(self, juego):
+        for fase, atributo, metodo in self.FASES:
+            objeto = juego if atributo is None else getattr(juego, atributo)
+            setattr(objeto, metodo, self._envolver(fase, getattr(objeto, metodo)))
+        juego.agregar_oyente(self)
+        juego.contar_bloqueos = True
+        self.partidas += 1
+        return juego
+
+    def desinstrumentar(self, juego):
+        for _, atributo, metodo in self.FASES:
+            objeto = juego if atributo is None else getattr(juego, atributo)
+            vars(objeto).pop(metodo, None)
+        if self in juego.oyentes:
+            juego.oyentes.remove(self)
+        juego.contar_bloqueos = False
+
+    def _envolver(self, fase, original):
+        llamadas, segundos = self.llamadas, self.segundos
+        reloj = time.perf_counter
+
+        def envoltura(*args, **kwargs):
+            inicio = reloj()
+            resultado = original(*args, **kwargs)
+            segundos[fase] += reloj() - inicio
+            llamadas[fase] += 1
+            return resultado
+
+        return envoltura
+
+    def __call__(self, evento, datos):
+        # Oyente de eventos del juego
+        if evento == EVENTO_DADOS:
+            self.turnos += 1
+            self.turno_resuelto = False
+        elif evento in (EVENTO_SALIDA, EVENTO_MOVIMIENTO):
+            self.turno_resuelto = True
+        elif evento == EVENTO_SIN_MOVIMIENTOS or (evento == EVENTO_ELECCION and datos["indice"] is None):
+            # Un turno se pierde si termina sin que el jugador haya movido nada
+            if not self.turno_resuelto:
+                self.eventos["turnos_perdidos"] += 1
+                self.turno_resuelto = True
+        elif evento == EVENTO_CAPTURA:
+            self.eventos["capturas"] += 1
+        elif evento == EVENTO_TRES_PARES:
+            self.eventos["tres_pares"] += 1
+        elif evento == EVENTO_BONUS_USADO:
+            self.eventos["bonus_usados"] += 1
+        elif evento == EVENTO_BLOQUEO:
+            self.eventos["bloqueos_encontrados"] += 1
+
+    def combinar(self, otra):
+        # Suma los contadores de otra instrumentación (por ejemplo, de otro proceso)
+        self.partidas += otra.partidas
+        self.turnos += otra.turnos
+        for fase in self.llamadas:
+            self.llamadas[fase] += otra.llamadas[fase]
+            self.segundos[fase] += otra.segundos[fase]
+        for evento in self.eventos:
+            self.eventos[evento] += otra.eventos[evento]
+
+    def instantanea(self):
+        partidas = self.partidas or 1
+        return {
+            "partidas": self.partidas,
+            "turnos": self.turnos,
+            "fases": {
+                fase: {
+                    "llamadas": self.llamadas[fase],
+                    "segundos": self.segundos[fase],
+                    "us_por_llamada": 1e6 * self.segundos[fase] / self.llamadas[fase] if self.llamadas[fase] else 0.0,
+                }
+                for fase in self.llamadas
+            },
+            "eventos": dict(self.eventos),
+            "eventos_por_partida": {evento: valor / partidas for evento, valor in self.eventos.items()},
+        }
+
+    def volcar(self, ruta):
+        # Escribe la instantánea en JSON; se reemplaza el archivo de una vez para que
+        # quien lo lea nunca vea uno a medio escribir
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(self.instantanea(), archivo, indent=2)
+        os.replace(temporal, ruta)
+
+    def volcar_periodicamente(self, ruta, intervalo=10.0):
+        # Vuelca la instantánea cada intervalo segundos en un hilo aparte hasta detener_volcado()
+        def volcar_y_programar(temporizador):
+            # Si se detuvo (o se reprogramó) mientras se esperaba, no se vuelve a programar
+            if self.temporizador is temporizador:
+                self.volcar(ruta)
+                programar()
+
+        def programar():
+            temporizador = threading.Timer(intervalo, lambda: volcar_y_programar(temporizador))
+            temporizador.daemon = True
+            self.temporizador = temporizador
+            temporizador.start()
+
+        self.detener_volcado()
+        programar()
+
+    def detener_volcado(self):
+        temporizador, self.temporizador = self.temporizador, None
+        if temporizador is not None:
+            temporizador.cancel()
+
+def _huella(juego):
+    # Todo lo que aplicar/deshacer debe dejar igual: el estado y sus índices derivados
+    return (
+        juego.estado.a_bytes(),
+        juego.hash,
+        tuple(juego.fichas_terminadas),
+        juego.tablero.bloqueos,
+        tuple(tuple(sorted(f.indice for f in casilla)) for casilla in juego.tablero.fichas_casilla),
+    )
+
+def _verificar_arbol(juego, fichas, valores_dados, profundidad):
+    # Aplica y deshace cada movimiento posible (y los siguientes hasta la profundidad dada)
+    # comprobando que el estado vuelve a ser idéntico byte a byte
+    revisados = 0
+    huella = _huella(juego)
+    for movimiento in juego.obtener_movimientos_posibles(fichas, valores_dados):
+        marca = juego.aplicar(movimiento)
+        if juego.hash != juego.calcular_hash():
+            raise AssertionError(f"Hash incremental incorrecto después de aplicar {movimiento}")
+        if profundidad > 1 and juego.movimiento_valido(marca):
+            restantes = [v for i, v in enumerate(valores_dados) if i not in movimiento[2]]
+            revisados += _verificar_arbol(juego, fichas, restantes, profundidad - 1)
+        juego.deshacer(marca)
+        revisados += 1
+        if _huella(juego) != huella:
+            raise AssertionError(f"aplicar/deshacer de {movimiento} no restauró el estado")
+    return revisados
+
+def verificar_aplicar_deshacer(partidas=10, semilla=0, profundidad=3, max_turnos=2000):
+    # Prueba de propiedad: en posiciones de partidas al azar, aplicar seguido de
+    # deshacer deja el estado idéntico. Devuelve cuántos movimientos se revisaron.
+    azar = random.Random(semilla)
+    revisados = 0
+    for _ in range(partidas):
+        numero_jugadores = azar.randint(2, NUMERO_JUGADORES)
+        dados = DadosAleatorios(azar.getrandbits(64))
+        politicas = [JugadorAleatorio(azar.getrandbits(64)) for _ in range(numero_jugadores)]
+        juego = Juego(numero_jugadores, politicas=politicas, silencioso=True, fuente_dados=dados)
+        while juego.turnos_jugados < max_turnos:
+            turno = juego.pasos_turno()
+            fichas = juego.obtener_fichas_jugador(juego.turno_actual)
+            try:
+                movimientos, valores_dados = next(turno)
+                while True:
+                    revisados += _verificar_arbol(juego, fichas, valores_dados, profundidad)
+                    eleccion = juego.politicas[juego.turno_actual].elegir(juego, movimientos, valores_dados)
+                    movimientos, valores_dados = turno.send(eleccion)
+            except StopIteration as fin:
+                if fin.value:
+                    break
+    return revisados
 
 if __name__ == "__main__":
+    # Torneo de bots: python Proyecto.py torneo aleatorio primero -n 10000
+    if len(sys.argv) > 1 and sys.argv[1] == "torneo":
+        from torneo import principal
+        principal(sys.argv[2:])
+        sys.exit()
+    
+    # Verificación de aplicar/deshacer: python Proyecto.py verificar [partidas]
+    if len(sys.argv) > 1 and sys.argv[1] == "verificar":
+        partidas = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+        revisados = verificar_aplicar_deshacer(partidas)
+        print(f"aplicar/deshacer verificado en {revisados} movimientos de {partidas} partidas")
+        sys.exit()
+    
     # Intentar configurar la terminal para mostrar colores en Windows
     if platform.system() == 'Windows':
         try:
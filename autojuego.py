@@ -0,0 +1,298 @@
+# Datos de autojuego: partidas sin interfaz entre bots en varios procesos, con una
+# fila por decisión (estado, dados, movimiento elegido y resultado de la partida)
+# para ajustar heurísticas de movimiento.
+#
+#   python autojuego.py datos/ computador aleatorio -n 10000
+#
+# Cada fila es un vector de ANCHO enteros (TIPO) con las columnas de COLUMNAS. Las
+# fichas se describen desde el jugador que decide: progreso_r_f es el progreso de la
+# ficha f del jugador que juega r asientos después (0 = el que decide), con
+# PROGRESO_CARCEL, 0-67 casillas recorridas desde su salida, 68-75 en la recta final,
+# PROGRESO_META, o PROGRESO_AUSENTE si la partida tiene menos jugadores. El
+# resultado (ganador y turnos_restantes) se completa cuando termina la partida.
+#
+# Cada proceso acumula las filas en un bloque de FILAS_BLOQUE y lo copia a un
+# fragmento .npy mapeado en memoria (numpy.lib.format.open_memmap) de hasta
+# FILAS_FRAGMENTO filas; al terminar un lote el último fragmento se recorta a las
+# filas escritas. manifiesto.json lista los fragmentos terminados y se reemplaza de
+# una vez después de cada lote, así se puede leer mientras la generación sigue
+# (ver leer_fragmentos). La memoria no depende del número de partidas: un proceso
+# guarda solo las filas de la partida en curso y un bloque.
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from numpy.lib.format import open_memmap, write_array_header_1_0, dtype_to_descr
+
+from Proyecto import Juego, Jugador, NUMERO_JUGADORES, NUMERO_FICHAS, TAMANO_TABLERO, TAMANO_LLEGADA, SALIDAS
+from torneo import crear_politica, semilla_partida, POLITICAS, FUENTES_DADOS, MAX_TURNOS
+
+TIPO = np.int32
+COLUMNAS = (
+    # Partida y decisión
+    ["partida", "turno", "jugador", "jugadores", "politica", "dado1", "dado2", "valor1", "valor2", "valor3",
+     "pares", "opciones", "eleccion", "ficha", "pasos", "valores_usados"]
+    # Estado desde el jugador que decide
+    + [f"progreso_{r}_{f}" for r in range(NUMERO_JUGADORES) for f in range(NUMERO_FICHAS)]
+    # Resultado: 1 si el jugador que decide ganó, 0 si perdió, -1 si nadie ganó
+    + ["ganador", "turnos_restantes"]
+)
+COLUMNA = {nombre: i for i, nombre in enumerate(COLUMNAS)}
+ANCHO = len(COLUMNAS)
+
+PROGRESO_AUSENTE = -2
+PROGRESO_CARCEL = -1
+PROGRESO_META = TAMANO_TABLERO + TAMANO_LLEGADA
+SIN_GANADOR = -1
+
+FILAS_BLOQUE = 4096
+FILAS_FRAGMENTO = 1 << 16
+MANIFIESTO = "manifiesto.json"
+
+def progreso(ficha):
+    if ficha.terminada:
+        return PROGRESO_META
+    posicion = ficha.posicion
+    if posicion == -1:
+        return PROGRESO_CARCEL
+    if posicion == -2:
+        return TAMANO_TABLERO + ficha.posicion_llegada
+    return (posicion - SALIDAS[ficha.id_jugador]) % TAMANO_TABLERO
+
+def codificar_decision(juego, partida, politica, movimientos, valores_dados, eleccion):
+    # Fila sin las columnas del resultado
+    jugador = juego.turno_actual
+    valores = valores_dados + [0] * (3 - len(valores_dados))
+    if eleccion is None:
+        ficha, pasos, usados = -1, 0, 0
+    else:
+        ficha, pasos, indices = movimientos[eleccion]
+        ficha, usados = ficha.id_ficha, sum(1 << indice for indice in indices)
+    fila = [partida, juego.turnos_jugados, jugador, juego.numero_jugadores, politica, *juego.dados, *valores,
+            juego.pares_consecutivos, len(movimientos), -1 if eleccion is None else eleccion, ficha, pasos, usados]
+    for r in range(NUMERO_JUGADORES):
+        if r < juego.numero_jugadores:
+            fila.extend(progreso(f) for f in juego.obtener_fichas_jugador((jugador + r) % juego.numero_jugadores))
+        else:
+            fila.extend([PROGRESO_AUSENTE] * NUMERO_FICHAS)
+    return fila
+
+class Registrador(Jugador):
+    # Envuelve la política de un asiento y guarda una fila por cada decisión suya
+    def __init__(self, politica, participante, partida, filas):
+        self.politica = politica
+        self.participante = participante
+        self.partida = partida
+        self.filas = filas
+
+    def antes_de_lanzar(self, juego):
+        self.politica.antes_de_lanzar(juego)
+
+    def elegir(self, juego, movimientos, valores_dados):
+        eleccion = self.politica.elegir(juego, movimientos, valores_dados)
+        self.filas.append(codificar_decision(juego, self.partida, self.participante, movimientos, valores_dados,
+                                             eleccion))
+        return eleccion
+
+def _cabecera_npy(filas):
+    salida = io.BytesIO()
+    write_array_header_1_0(salida, {"descr": dtype_to_descr(np.dtype(TIPO)), "fortran_order": False,
+                                    "shape": (filas, ANCHO)})
+    return salida.getvalue()
+
+class EscritorFragmentos:
+    # Escribe filas en fragmentos prefijo-NNN.npy de hasta filas_fragmento filas
+    def __init__(self, directorio, prefijo, filas_fragmento=FILAS_FRAGMENTO, filas_bloque=FILAS_BLOQUE):
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.filas_fragmento = filas_fragmento
+        self.bloque = np.empty((filas_bloque, ANCHO), dtype=TIPO)
+        self.en_bloque = 0
+        self.fragmento = None
+        self.en_fragmento = 0
+        self.fragmentos = []  # [archivo, filas]
+
+    def agregar(self, filas):
+        filas = np.asarray(filas, dtype=TIPO).reshape(-1, ANCHO)
+        while len(filas):
+            cantidad = min(len(filas), len(self.bloque) - self.en_bloque)
+            self.bloque[self.en_bloque:self.en_bloque + cantidad] = filas[:cantidad]
+            self.en_bloque += cantidad
+            filas = filas[cantidad:]
+            if self.en_bloque == len(self.bloque):
+                self.vaciar()
+
+    def vaciar(self):
+        # Copia el bloque a los fragmentos, abriendo uno nuevo cuando se llena el actual
+        escritas = 0
+        while escritas < self.en_bloque:
+            if self.fragmento is None:
+                archivo = f"{self.prefijo}-{len(self.fragmentos):03d}.npy"
+                self.fragmento = open_memmap(os.path.join(self.directorio, archivo), mode="w+", dtype=TIPO,
+                                             shape=(self.filas_fragmento, ANCHO))
+                self.fragmentos.append([archivo, 0])
+                self.en_fragmento = 0
+            cantidad = min(self.en_bloque - escritas, self.filas_fragmento - self.en_fragmento)
+            self.fragmento[self.en_fragmento:self.en_fragmento + cantidad] = self.bloque[escritas:escritas + cantidad]
+            self.en_fragmento += cantidad
+            self.fragmentos[-1][1] = self.en_fragmento
+            escritas += cantidad
+            if self.en_fragmento == self.filas_fragmento:
+                self._cerrar_fragmento()
+        self.en_bloque = 0
+        if self.fragmento is not None:
+            self.fragmento.flush()
+
+    def _cerrar_fragmento(self):
+        self.fragmento.flush()
+        inicio = self.fragmento.offset
+        self.fragmento = None
+        archivo, filas = self.fragmentos[-1]
+        if filas == self.filas_fragmento:
+            return
+        # Dejar en la cabecera las filas escritas y cortar el resto del archivo. La
+        # cabecera de numpy tiene relleno, así que cabe en el mismo espacio.
+        cabecera = _cabecera_npy(filas)
+        if len(cabecera) != inicio:
+            return
+        with open(os.path.join(self.directorio, archivo), "r+b") as salida:
+            salida.write(cabecera)
+            salida.truncate(inicio + filas * ANCHO * np.dtype(TIPO).itemsize)
+
+    def cerrar(self):
+        self.vaciar()
+        if self.fragmento is not None:
+            self._cerrar_fragmento()
+        return [tuple(fragmento) for fragmento in self.fragmentos]
+
+def generar_lote(directorio, nombres, semilla, inicio, cantidad, rotar=True, max_turnos=MAX_TURNOS,
+                 dados="aleatorio", filas_fragmento=FILAS_FRAGMENTO):
+    # Función del proceso trabajador: juega las partidas [inicio, inicio + cantidad) y
+    # devuelve los fragmentos escritos como [(archivo, filas)]
+    numero_jugadores = len(nombres)
+    fuente_dados = FUENTES_DADOS[dados](semilla)
+    escritor = EscritorFragmentos(directorio, f"lote-{inicio:09d}", filas_fragmento)
+    for indice in range(inicio, inicio + cantidad):
+        semilla_juego = semilla_partida(semilla, indice)
+        desplazamiento = indice % numero_jugadores if rotar else 0
+        participantes = [(asiento + desplazamiento) % numero_jugadores for asiento in range(numero_jugadores)]
+        filas = []
+        politicas = [
+            Registrador(crear_politica(nombres[participante], f"{semilla_juego}:{asiento}"), participante, indice,
+                        filas)
+            for asiento, participante in enumerate(participantes)
+        ]
+        juego = Juego(numero_jugadores, politicas=politicas, silencioso=True, fuente_dados=fuente_dados.partida(indice))
+        ganador = juego.jugar_partida(max_turnos=max_turnos)
+        for fila in filas:
+            if ganador is None:
+                fila.append(SIN_GANADOR)
+            else:
+                fila.append(int(fila[COLUMNA["jugador"]] == ganador))
+            fila.append(juego.turnos_jugados - fila[COLUMNA["turno"]])
+        escritor.agregar(filas)
+    return escritor.cerrar()
+
+def escribir_manifiesto(directorio, manifiesto):
+    ruta = os.path.join(directorio, MANIFIESTO)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(manifiesto, archivo, indent=1)
+        archivo.write("\n")
+    os.replace(temporal, ruta)
+
+def leer_manifiesto(directorio):
+    with open(os.path.join(directorio, MANIFIESTO), encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+def leer_fragmentos(directorio):
+    # Fragmentos terminados como arreglos de solo lectura mapeados en memoria
+    for fragmento in leer_manifiesto(directorio)["fragmentos"]:
+        datos = np.load(os.path.join(directorio, fragmento["archivo"]), mmap_mode="r")
+        yield datos[:fragmento["filas"]]
+
+def generar(directorio, nombres, partidas, procesos=None, semilla=0, lote=100, rotar=True, max_turnos=MAX_TURNOS,
+            dados="aleatorio", filas_fragmento=FILAS_FRAGMENTO, al_progreso=None):
+    # Reparte lotes de partidas entre procesos y agrega al manifiesto los fragmentos de
+    # cada lote a medida que terminan
+    if not 2 <= len(nombres) <= NUMERO_JUGADORES:
+        raise ValueError(f"Se necesitan entre 2 y {NUMERO_JUGADORES} políticas")
+    for nombre in nombres:
+        if nombre not in POLITICAS:
+            raise ValueError(f"Política desconocida: {nombre}")
+    if dados not in FUENTES_DADOS:
+        raise ValueError(f"Fuente de dados desconocida: {dados}")
+
+    os.makedirs(directorio, exist_ok=True)
+    procesos = procesos or os.cpu_count() or 1
+    manifiesto = {
+        "columnas": COLUMNAS,
+        "tipo": np.dtype(TIPO).name,
+        "politicas": list(nombres),
+        "semilla": semilla,
+        "dados": dados,
+        "partidas": 0,
+        "filas": 0,
+        "terminado": False,
+        "fragmentos": [],
+    }
+    escribir_manifiesto(directorio, manifiesto)
+    siguiente = 0
+    pendientes = {}  # futuro -> (primera partida, cantidad)
+
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        while True:
+            # Solo unos pocos lotes en vuelo, como en torneo.jugar_torneo
+            while len(pendientes) < 2 * procesos and siguiente < partidas:
+                cantidad = min(lote, partidas - siguiente)
+                futuro = ejecutor.submit(generar_lote, directorio, nombres, semilla, siguiente, cantidad, rotar,
+                                         max_turnos, dados, filas_fragmento)
+                pendientes[futuro] = (siguiente, cantidad)
+                siguiente += cantidad
+            if not pendientes:
+                break
+
+            terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                primera, cantidad = pendientes.pop(futuro)
+                for archivo, filas in futuro.result():
+                    manifiesto["fragmentos"].append({"archivo": archivo, "filas": filas, "partidas": [primera, cantidad]})
+                    manifiesto["filas"] += filas
+                manifiesto["partidas"] += cantidad
+            escribir_manifiesto(directorio, manifiesto)
+            if al_progreso is not None:
+                al_progreso(manifiesto)
+
+    manifiesto["terminado"] = True
+    escribir_manifiesto(directorio, manifiesto)
+    return manifiesto
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera datos de autojuego de Parqués en fragmentos .npy")
+    parser.add_argument("directorio", help="directorio de los fragmentos y del manifiesto")
+    parser.add_argument("politicas", nargs="+", choices=sorted(POLITICAS), help="una política por asiento (2 a 4)")
+    parser.add_argument("-n", "--partidas", type=int, default=1000, help="número de partidas a jugar")
+    parser.add_argument("-p", "--procesos", type=int, help="procesos trabajadores (por defecto, todos los núcleos)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--lote", type=int, default=100, help="partidas por tarea de cada proceso")
+    parser.add_argument("--sin-rotar", action="store_true", help="no rotar los asientos entre partidas")
+    parser.add_argument("--dados", choices=sorted(FUENTES_DADOS), default="aleatorio")
+    args = parser.parse_args(argumentos)
+
+    def progreso(manifiesto):
+        print(f"\r{manifiesto['partidas']} partidas, {manifiesto['filas']} filas...", end="", flush=True)
+
+    inicio = time.perf_counter()
+    manifiesto = generar(args.directorio, args.politicas, args.partidas, args.procesos, args.semilla, args.lote,
+                         not args.sin_rotar, dados=args.dados, al_progreso=progreso)
+    segundos = time.perf_counter() - inicio
+    print()
+    print(f"{manifiesto['partidas']} partidas y {manifiesto['filas']} filas en {len(manifiesto['fragmentos'])} "
+          f"fragmentos ({manifiesto['filas'] / segundos:.0f} filas/s)")
+
+if __name__ == "__main__":
+    principal()
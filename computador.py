@@ -0,0 +1,327 @@
+# Jugador controlado por la computadora: expectimax con profundización iterativa
+# y un presupuesto de tiempo estricto por movimiento.
+#
+# En cada turno el jugador que mueve elige un plan completo (Juego.iterar_planes_turno:
+# el orden en que usa cada dado, la suma y el bonus, sin los planes equivalentes);
+# al terminar el turno hay un nodo de azar con las 21 tiradas distintas de dos dados.
+# El jugador de la computadora maximiza su valoración y supone que los rivales la
+# minimizan (búsqueda paranoica). La profundidad se cuenta en turnos completos
+# después del turno actual. El plan elegido en la primera decisión del turno se
+# sigue en las demás sin volver a buscar.
+import sys
+import time
+from collections import OrderedDict
+
+from Proyecto import Juego, Jugador, DadosAleatorios, TAMANO_TABLERO, TAMANO_LLEGADA
+from tablas_finales import es_carrera
+
+# Las 21 tiradas distintas (d1 <= d2) con su peso sobre 36
+TIRADAS = [(d1, d2, 1 if d1 == d2 else 2) for d1 in range(1, 7) for d2 in range(d1, 7)]
+
+# Valor de una victoria; mayor que cualquier diferencia de valoración
+VICTORIA = 100000.0
+
+# Valoración de cada ficha según cuánto ha avanzado
+PROGRESO_META = TAMANO_TABLERO + TAMANO_LLEGADA + 10
+BONUS_SEGURO = 3
+
+class TiempoAgotado(Exception):
+    pass
+
+class TablaTransposicion:
+    # Tabla LRU acotada: clave de la posición -> (profundidad, valor)
+    def __init__(self, capacidad=200000):
+        self.capacidad = capacidad
+        self.entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def buscar(self, clave, profundidad):
+        entrada = self.entradas.get(clave)
+        if entrada is None or entrada[0] < profundidad:
+            self.fallos += 1
+            return None
+        self.entradas.move_to_end(clave)
+        self.aciertos += 1
+        return entrada[1]
+
+    def guardar(self, clave, profundidad, valor):
+        self.entradas[clave] = (profundidad, valor)
+        self.entradas.move_to_end(clave)
+        if len(self.entradas) > self.capacidad:
+            self.entradas.popitem(last=False)
+
+    def limpiar(self):
+        self.entradas.clear()
+
+def progreso_ficha(juego, ficha):
+    # 0 en la cárcel, 1 en la salida, 68 en la entrada de la recta final y
+    # PROGRESO_META al terminar
+    if ficha.terminada:
+        return PROGRESO_META
+    if ficha.esta_en_carcel():
+        return 0
+    if ficha.en_recta_final:
+        return TAMANO_TABLERO + 1 + ficha.posicion_llegada
+    entrada = juego.tablero.obtener_entrada_llegada(ficha.id_jugador)
+    progreso = TAMANO_TABLERO - (entrada - ficha.posicion) % TAMANO_TABLERO
+    if juego.tablero.es_especial(ficha.posicion):
+        progreso += BONUS_SEGURO
+    return progreso
+
+def evaluar(juego, jugador):
+    # Progreso propio menos el del rival más adelantado
+    puntajes = [sum(progreso_ficha(juego, ficha) for ficha in juego.obtener_fichas_jugador(j))
+                for j in range(juego.numero_jugadores)]
+    propio = puntajes[jugador]
+    rivales = [p for j, p in enumerate(puntajes) if j != jugador]
+    return propio - max(rivales) if rivales else propio
+
+class JugadorComputador(Jugador):
+    costosa = True
+
+    def __init__(self, tiempo_ms=50, profundidad_maxima=8, capacidad_tabla=200000, tabla_finales=None):
+        self.tiempo_ms = tiempo_ms
+        self.profundidad_maxima = profundidad_maxima
+        # Tabla de finales (TablaFinales) para jugar las carreras a casa sin buscar
+        self.tabla_finales = tabla_finales
+        # La tabla se conserva entre jugadas: las decisiones siguientes del mismo
+        # turno ya se evaluaron al buscar la primera
+        self.tabla = TablaTransposicion(capacidad_tabla)
+        self.jugador = None
+        self.limite = 0.0
+        self.nodos = 0
+        # Pasos que faltan del plan elegido, como (índice de ficha, pasos, índices de
+        # dados), y el turno al que pertenecen
+        self.plan = []
+        self.turno_plan = None
+        # Métricas acumuladas
+        self.nodos_totales = 0
+        self.segundos_totales = 0.0
+        self.jugadas = 0
+        self.jugadas_tabla = 0
+        self.profundidad_alcanzada = 0
+
+    def elegir(self, juego, movimientos, valores_dados):
+        inicio = time.perf_counter()
+        # Se reserva una parte del presupuesto para copiar la partida y responder
+        self.limite = inicio + self.tiempo_ms * 0.8 / 1000
+        self.nodos = 0
+        sugerencia = None
+        if self.tabla_finales is not None and es_carrera(juego, juego.turno_actual):
+            sugerencia = self.tabla_finales.sugerir(juego, movimientos, valores_dados)
+        if sugerencia is not None:
+            eleccion = sugerencia[0]
+            self.jugadas_tabla += 1
+            self.plan = []
+        else:
+            eleccion = self.seguir_plan(juego, movimientos)
+            if eleccion is None:
+                eleccion = self.buscar(juego, movimientos, valores_dados)
+        self.nodos_totales += self.nodos
+        self.segundos_totales += time.perf_counter() - inicio
+        self.jugadas += 1
+        return eleccion
+
+    def seguir_plan(self, juego, movimientos):
+        # Índice del siguiente paso del plan, si el plan es de este turno y el paso
+        # sigue entre los movimientos posibles
+        if not self.plan or self.turno_plan != juego.turnos_jugados:
+            return None
+        paso = self.plan.pop(0)
+        for i, (ficha, pasos, indices) in enumerate(movimientos):
+            if (ficha.indice, pasos, tuple(indices)) == paso:
+                return i
+        self.plan = []
+        return None
+
+    def buscar(self, juego, movimientos, valores_dados):
+        # La búsqueda trabaja sobre una copia, así puede abandonarse en cualquier
+        # momento sin dejar la partida a medio deshacer
+        copia = juego.clonar()
+        self.jugador = copia.turno_actual
+        # Si el plazo se acaba enumerando la raíz, la búsqueda no pasó de profundidad 0
+        self.profundidad_alcanzada = 0
+        es_par = copia.dados[0] == copia.dados[1]
+        # Los planes de la raíz se enumeran bajo el mismo plazo y se valoran a
+        # profundidad 0 a medida que salen; si se acaba el tiempo se elige entre los
+        # que alcanzaron a salir
+        planes = []
+        valores = {}
+        completa = False
+        # Sin ningún plan todavía no se corta: siempre hay uno para jugar
+        def al_expandir():
+            if planes:
+                self.revisar_limite()
+
+        generador = copia.iterar_planes_turno(valores_dados, permitir_pasar=False, al_expandir=al_expandir)
+        try:
+            for plan in generador:
+                planes.append(plan)
+                valores[len(planes) - 1] = self.valor_final_plan(copia, self.jugador, es_par, 0)
+                self.revisar_limite()
+            completa = True
+        except TiempoAgotado:
+            pass
+        finally:
+            generador.close()
+        if not planes:
+            return 0
+        orden = sorted(valores, key=lambda i: -valores[i])
+        mejor = orden[0]
+
+        if completa and len(planes) > 1 and abs(valores[mejor]) < VICTORIA:
+            for profundidad in range(1, self.profundidad_maxima + 1):
+                valores = {}
+                try:
+                    for i in orden:
+                        valores[i] = self.valor_plan(copia, self.jugador, planes[i], es_par, profundidad)
+                except TiempoAgotado:
+                    break
+                # Se ordenan los planes para que el mejor se busque primero en la siguiente iteración
+                orden.sort(key=lambda i: -valores[i])
+                mejor = orden[0]
+                self.profundidad_alcanzada = profundidad
+                if abs(valores[mejor]) >= VICTORIA:
+                    break
+
+        # El primer paso se juega ahora y los demás en las siguientes decisiones del turno
+        primero, *resto = planes[mejor]
+        self.plan = [(ficha.indice, pasos, tuple(indices)) for ficha, pasos, indices in resto]
+        self.turno_plan = juego.turnos_jugados
+        paso = (primero[0].indice, primero[1], tuple(primero[2]))
+        for i, (ficha, pasos, indices) in enumerate(movimientos):
+            if (ficha.indice, pasos, tuple(indices)) == paso:
+                return i
+        return 0
+
+    def revisar_limite(self):
+        if time.perf_counter() > self.limite:
+            raise TiempoAgotado()
+
+    def consultar_reloj(self):
+        # Se consulta en cada nodo: leer el reloj cuesta mucho menos que expandir uno
+        self.nodos += 1
+        self.revisar_limite()
+
+    def valor_plan(self, juego, jugador, plan, es_par, profundidad):
+        marcas = [juego.aplicar(movimiento) for movimiento in plan]
+        valor = self.valor_final_plan(juego, jugador, es_par, profundidad)
+        for marca in reversed(marcas):
+            juego.deshacer(marca)
+        return valor
+
+    def valor_final_plan(self, juego, jugador, es_par, profundidad):
+        # Valor de la posición al terminar el plan de un turno
+        if juego.verificar_victoria(jugador):
+            return VICTORIA if jugador == self.jugador else -VICTORIA
+        return self.valor_fin_turno(juego, jugador, es_par, profundidad)
+
+    def valor_decision(self, juego, jugador, valores_dados, es_par, profundidad):
+        # Nodo de decisión al comenzar un turno: el jugador elige entre los planes
+        # completos con estos valores
+        self.consultar_reloj()
+        clave = (juego.hash, jugador, tuple(sorted(valores_dados)), juego.bonus_pendiente, es_par, self.jugador)
+        valor = self.tabla.buscar(clave, profundidad)
+        if valor is not None:
+            return valor
+
+        maximizar = jugador == self.jugador
+        # Cada plan se evalúa en la posición en que lo deja el generador; si se acaba
+        # el tiempo, cerrar el generador deshace lo aplicado. El reloj se revisa en
+        # cada plan y en cada estado que expande el generador.
+        planes = juego.iterar_planes_turno(valores_dados, jugador, permitir_pasar=False,
+                                           al_expandir=self.revisar_limite)
+        try:
+            for _ in planes:
+                self.revisar_limite()
+                v = self.valor_final_plan(juego, jugador, es_par, profundidad)
+                if valor is None or (v > valor if maximizar else v < valor):
+                    valor = v
+        finally:
+            planes.close()
+        self.tabla.guardar(clave, profundidad, valor)
+        return valor
+
+    def valor_fin_turno(self, juego, jugador, es_par, profundidad):
+        if profundidad == 0:
+            return evaluar(juego, self.jugador)
+        # Con pares vuelve a lanzar el mismo jugador
+        siguiente = jugador if es_par else (jugador + 1) % juego.numero_jugadores
+        return self.valor_azar(juego, siguiente, profundidad - 1)
+
+    def valor_azar(self, juego, jugador, profundidad):
+        # Promedio sobre las 21 tiradas; el bonus pendiente se suma a los valores
+        # como en pasos_turno. No se modela el castigo por tres pares.
+        bonus = juego.bonus_pendiente
+        turno = juego.turno_actual
+        dados = juego.dados
+        juego.bonus_pendiente = 0
+        juego.turno_actual = jugador
+        total = 0.0
+        try:
+            for d1, d2, peso in TIRADAS:
+                # Los dados deciden si la última ficha movida distingue los planes
+                juego.dados = [d1, d2]
+                valores_dados = [d1, d2, bonus] if bonus else [d1, d2]
+                total += peso * self.valor_decision(juego, jugador, valores_dados, d1 == d2, profundidad)
+        finally:
+            juego.bonus_pendiente = bonus
+            juego.turno_actual = turno
+            juego.dados = dados
+        return total / 36
+
+    def nodos_por_segundo(self):
+        return self.nodos_totales / self.segundos_totales if self.segundos_totales else 0.0
+
+    def estadisticas(self):
+        return {
+            "jugadas": self.jugadas,
+            "jugadas_tabla": self.jugadas_tabla,
+            "nodos": self.nodos_totales,
+            "nodos_por_segundo": self.nodos_por_segundo(),
+            "ms_por_jugada": 1000 * self.segundos_totales / self.jugadas if self.jugadas else 0.0,
+            "profundidad_alcanzada": self.profundidad_alcanzada,
+            "tabla": {"aciertos": self.tabla.aciertos, "fallos": self.tabla.fallos, "tamano": len(self.tabla.entradas)},
+        }
+
+def verificar_presupuesto(partidas=6, semilla=0, tiempo_ms=50, numero_jugadores=4, max_turnos=2000):
+    # Juega partidas entre computadores y mide cada llamada a elegir. Devuelve los
+    # tiempos en milisegundos, ordenados, y cuántas jugadas pasaron de tiempo_ms
+    # porque el sistema dejó de ejecutar el proceso en medio de ellas; si alguna
+    # pasa por otra causa, falla.
+    tiempos = []
+    detenidas = 0
+
+    class Medido(JugadorComputador):
+        def elegir(self, juego, movimientos, valores_dados):
+            nonlocal detenidas
+            inicio, cpu = time.perf_counter(), time.thread_time()
+            eleccion = super().elegir(juego, movimientos, valores_dados)
+            ms = (time.perf_counter() - inicio) * 1000
+            tiempos.append(ms)
+            if ms > tiempo_ms:
+                ejecutando = (time.thread_time() - cpu) * 1000
+                if ejecutando > tiempo_ms:
+                    raise AssertionError(f"una jugada tardó {ms:.1f} ms con un presupuesto de {tiempo_ms} ms")
+                detenidas += 1
+            return eleccion
+
+    for partida in range(partidas):
+        politicas = [Medido(tiempo_ms=tiempo_ms) for _ in range(numero_jugadores)]
+        juego = Juego(numero_jugadores, politicas=politicas, silencioso=True,
+                      fuente_dados=DadosAleatorios(f"{semilla}:{partida}"))
+        while not juego.jugar_turno() and juego.turnos_jugados < max_turnos:
+            pass
+    tiempos.sort()
+    return tiempos, detenidas
+
+if __name__ == "__main__":
+    # Verificación del presupuesto: python computador.py [partidas] [tiempo_ms]
+    partidas = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    tiempo_ms = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    tiempos, detenidas = verificar_presupuesto(partidas, tiempo_ms=tiempo_ms)
+    print(f"{len(tiempos)} jugadas: p50 {tiempos[len(tiempos) // 2]:.1f} ms, "
+          f"p99 {tiempos[int(len(tiempos) * 0.99)]:.1f} ms, máximo {tiempos[-1]:.1f} ms (presupuesto {tiempo_ms} ms)")
+    if detenidas:
+        print(f"{detenidas} jugadas pasaron del presupuesto mientras el sistema no ejecutaba el proceso")
@@ -0,0 +1,223 @@
+# Almacén de instantáneas de partidas en curso, para seguirlas después de un cierre
+# o una caída del proceso.
+#
+# Archivo: CABECERA y luego registros de TAMANO_REGISTRO bytes que solo se agregan
+# al final: id de la partida (uint64), banderas, etiqueta (uint16 libre para quien
+# guarda, por ejemplo la configuración de la mesa), Juego.instantanea() y un CRC32
+# del registro. Guardar otra vez la misma partida agrega un registro nuevo; al abrir
+# el archivo se recorre una vez y el índice en memoria (id -> desplazamiento) se
+# queda con el último registro de cada partida. Descartar una partida agrega un
+# registro con BORRADA. compactar() reescribe el archivo con los registros vigentes.
+#
+# El archivo se mapea en memoria y crece al doble cuando se llena, así que guardar
+# es copiar unos bytes al mapa y restaurar es leerlos y reconstruir la partida. Lo
+# escrito en el mapa sobrevive a una caída del proceso; para sobrevivir a una del
+# sistema hay que llamar a sincronizar(). Un registro a medio escribir no pasa la
+# prueba del CRC, y al abrir el archivo se descarta junto con lo que le sigue.
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+import zlib
+
+from Proyecto import Juego, JugadorAleatorio, DadosAleatorios, TAMANO_INSTANTANEA
+
+MAGIA = b"PQIN"
+VERSION = 1
+# magia, versión, tamaño de la instantánea, tamaño del registro
+CABECERA = struct.Struct("<4sBBH")
+INICIO_REGISTROS = 16
+
+BORRADA = 1
+
+# id, banderas, etiqueta, instantánea; relleno hasta que el registro con el CRC
+# ocupe un múltiplo de 16 bytes
+_CAMPOS = f"<QBH{TAMANO_INSTANTANEA}s"
+TAMANO_REGISTRO = -(-(struct.calcsize(_CAMPOS) + 4) // 16) * 16
+CUERPO = struct.Struct(f"{_CAMPOS}{TAMANO_REGISTRO - 4 - struct.calcsize(_CAMPOS)}x")
+CRC = struct.Struct("<I")
+
+CAPACIDAD_INICIAL = 1024  # Registros
+
+class AlmacenInstantaneas:
+    def __init__(self, ruta, capacidad_inicial=CAPACIDAD_INICIAL):
+        self.ruta = ruta
+        self.capacidad_inicial = capacidad_inicial
+        self.archivo = None
+        self.mapa = None
+        self._abrir()
+
+    def _abrir(self):
+        nuevo = not os.path.exists(self.ruta) or os.path.getsize(self.ruta) == 0
+        self.archivo = open(self.ruta, "w+b" if nuevo else "r+b")
+        if nuevo:
+            self.archivo.write(CABECERA.pack(MAGIA, VERSION, TAMANO_INSTANTANEA, TAMANO_REGISTRO))
+            self.archivo.truncate(INICIO_REGISTROS + TAMANO_REGISTRO * self.capacidad_inicial)
+        self.mapa = mmap.mmap(self.archivo.fileno(), 0)
+        if CABECERA.unpack_from(self.mapa) != (MAGIA, VERSION, TAMANO_INSTANTANEA, TAMANO_REGISTRO):
+            self.cerrar()
+            raise ValueError(f"{self.ruta} no es un almacén de instantáneas compatible")
+        self._indexar()
+
+    def _indexar(self):
+        # Último registro válido de cada partida; el final es el primer registro que
+        # no pasa la prueba del CRC (el espacio sin usar está en ceros)
+        self.indice = {}
+        mapa = self.mapa
+        desplazamiento = INICIO_REGISTROS
+        while desplazamiento + TAMANO_REGISTRO <= len(mapa):
+            cuerpo = mapa[desplazamiento:desplazamiento + CUERPO.size]
+            if zlib.crc32(cuerpo) != CRC.unpack_from(mapa, desplazamiento + CUERPO.size)[0]:
+                break
+            id_partida = int.from_bytes(cuerpo[:8], "little")
+            if cuerpo[8] & BORRADA:
+                self.indice.pop(id_partida, None)
+            else:
+                self.indice[id_partida] = desplazamiento
+            desplazamiento += TAMANO_REGISTRO
+        self.final = desplazamiento
+
+    def __len__(self):
+        return len(self.indice)
+
+    def __contains__(self, id_partida):
+        return id_partida in self.indice
+
+    def __iter__(self):
+        return iter(list(self.indice))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+    def _agregar(self, id_partida, banderas, etiqueta, instantanea):
+        if self.final + TAMANO_REGISTRO > len(self.mapa):
+            # resize también agranda el archivo; lo nuevo queda en ceros
+            self.mapa.resize(INICIO_REGISTROS + 2 * (len(self.mapa) - INICIO_REGISTROS))
+        cuerpo = CUERPO.pack(id_partida, banderas, etiqueta, instantanea)
+        desplazamiento = self.final
+        self.mapa[desplazamiento:desplazamiento + CUERPO.size] = cuerpo
+        CRC.pack_into(self.mapa, desplazamiento + CUERPO.size, zlib.crc32(cuerpo))
+        self.final += TAMANO_REGISTRO
+        return desplazamiento
+
+    def guardar(self, id_partida, juego, etiqueta=0):
+        self.indice[id_partida] = self._agregar(id_partida, 0, etiqueta, juego.instantanea())
+
+    def descartar(self, id_partida):
+        if self.indice.pop(id_partida, None) is not None:
+            self._agregar(id_partida, BORRADA, 0, bytes(TAMANO_INSTANTANEA))
+
+    def leer(self, id_partida):
+        # (instantánea, etiqueta) de la partida; KeyError si no está
+        desplazamiento = self.indice[id_partida]
+        _, _, etiqueta, instantanea = CUERPO.unpack_from(self.mapa, desplazamiento)
+        return instantanea, etiqueta
+
+    def restaurar(self, id_partida, juego=None, **opciones):
+        # Deja la partida guardada en juego, o en uno nuevo creado con las opciones de Juego
+        instantanea, _ = self.leer(id_partida)
+        if juego is None:
+            return Juego.desde_instantanea(instantanea, **opciones)
+        juego.restaurar_instantanea(instantanea)
+        return juego
+
+    def sincronizar(self):
+        self.mapa.flush()
+
+    def compactar(self):
+        # Reescribe el archivo solo con el último registro de cada partida. Se escribe
+        # aparte y se reemplaza de una vez, así una interrupción no pierde nada.
+        temporal = self.ruta + ".tmp"
+        registros = max(self.capacidad_inicial, len(self.indice))
+        with open(temporal, "wb") as archivo:
+            archivo.write(CABECERA.pack(MAGIA, VERSION, TAMANO_INSTANTANEA, TAMANO_REGISTRO))
+            archivo.write(bytes(INICIO_REGISTROS - CABECERA.size))
+            for desplazamiento in self.indice.values():
+                archivo.write(self.mapa[desplazamiento:desplazamiento + TAMANO_REGISTRO])
+            archivo.truncate(INICIO_REGISTROS + TAMANO_REGISTRO * registros)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        self.cerrar()
+        os.replace(temporal, self.ruta)
+        self._abrir()
+
+    def cerrar(self):
+        if self.mapa is not None:
+            self.mapa.flush()
+            self.mapa.close()
+            self.mapa = None
+        if self.archivo is not None:
+            self.archivo.close()
+            self.archivo = None
+
+def jugar_con_puntos(almacen, partidas, semilla):
+    # Turnos jugados y segundos de partidas al azar, guardando cada turno si hay almacén
+    turnos = 0
+    inicio = time.perf_counter()
+    for id_partida in range(partidas):
+        juego = Juego(2, politicas=[JugadorAleatorio(f"{semilla}:{id_partida}:{i}") for i in range(2)],
+                      silencioso=True, fuente_dados=DadosAleatorios(f"{semilla}:{id_partida}"))
+        while not juego.jugar_turno():
+            if almacen is not None:
+                almacen.guardar(id_partida, juego)
+        turnos += juego.turnos_jugados
+    return turnos, time.perf_counter() - inicio
+
+def prueba(ruta, partidas, consultas=100000, partidas_turnos=200, semilla=0):
+    # Llena el almacén con partidas y mide cuánto cuesta guardar y restaurar una (en
+    # microsegundos), y cuánto se demora un turno guardando o no la partida en cada uno
+    azar = random.Random(semilla)
+    juego = Juego(2, politicas=[JugadorAleatorio(semilla), JugadorAleatorio(semilla + 1)], silencioso=True,
+                  fuente_dados=DadosAleatorios(semilla))
+    instantaneas = []
+    while not juego.jugar_turno():
+        instantaneas.append(juego.instantanea())
+    with AlmacenInstantaneas(ruta) as almacen:
+        for id_partida in range(partidas):
+            juego.restaurar_instantanea(instantaneas[id_partida % len(instantaneas)])
+            almacen.guardar(id_partida, juego)
+        inicio = time.perf_counter()
+        for id_partida in range(partidas):
+            almacen.guardar(id_partida, juego)
+        guardar = (time.perf_counter() - inicio) * 1e6 / partidas
+        inicio = time.perf_counter()
+        for _ in range(consultas):
+            almacen.restaurar(azar.randrange(partidas), juego)
+        restaurar = (time.perf_counter() - inicio) * 1e6 / consultas
+        turnos, sin_guardar = jugar_con_puntos(None, partidas_turnos, semilla)
+        _, guardando = jugar_con_puntos(almacen, partidas_turnos, semilla)
+        return {"partidas": len(almacen), "bytes": os.path.getsize(ruta),
+                "guardar_us": guardar, "restaurar_us": restaurar,
+                "turno_us": sin_guardar * 1e6 / turnos, "turno_guardando_us": guardando * 1e6 / turnos}
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Almacén de instantáneas de partidas de Parqués")
+    parser.add_argument("archivo")
+    parser.add_argument("--mostrar", type=int, metavar="ID", help="mostrar el tablero de una partida guardada")
+    parser.add_argument("--compactar", action="store_true", help="dejar solo el último registro de cada partida")
+    parser.add_argument("--prueba", type=int, metavar="N", help="guardar N partidas y medir guardar y restaurar")
+    args = parser.parse_args(argumentos)
+
+    if args.prueba:
+        for nombre, valor in prueba(args.archivo, args.prueba).items():
+            print(f"  {nombre:<20} {valor:>12.2f}" if isinstance(valor, float) else f"  {nombre:<20} {valor:>12}")
+        return
+    with AlmacenInstantaneas(args.archivo) as almacen:
+        if args.compactar:
+            antes = os.path.getsize(args.archivo)
+            almacen.compactar()
+            print(f"{len(almacen)} partidas; {antes} -> {os.path.getsize(args.archivo)} bytes")
+        elif args.mostrar is not None:
+            juego = almacen.restaurar(args.mostrar, silencioso=True)
+            juego.mostrar_tablero()
+            print(f"Turno {juego.turnos_jugados}, juega el jugador {juego.turno_actual + 1}, dados {juego.dados}")
+        else:
+            print(f"{len(almacen)} partidas guardadas en {args.archivo}")
+
+if __name__ == "__main__":
+    principal()
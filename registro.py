@@ -0,0 +1,359 @@
+# Registro binario compacto de partidas y reproducción con búsqueda por turno.
+#
+# Formato: el archivo empieza con CABECERA y luego una secuencia de registros:
+#   INICIO_PARTIDA, número de jugadores             (2 bytes)
+#   CLAVE, turnos jugados (uint32), estado compacto (1 + 4 + TAMANO_ESTADO_COMPACTO bytes)
+#   turno: dados, elecciones..., FIN_TURNO | eventos (2 bytes + 1 por elección)
+# Los dados van en un byte (0-35), cada elección es el índice del movimiento
+# elegido (o PASAR) y el último byte marca los eventos del turno (FIN_TURNO con
+# los 6 bits de BITS_EVENTOS, 0xC0-0xFF). Un registro empieza con los dados o con
+# un marcador, así que los marcadores van justo después de los códigos de dados
+# (0x24 y 0x25), fuera del rango de los fines de turno.
+# Cada cierto número de turnos se guarda una clave con el estado completo para
+# poder reconstruir cualquier turno sin reproducir la partida desde el principio.
+# El lector mapea el archivo en memoria, así una partida se reconstruye desde su
+# clave sin leer el resto del archivo.
+import argparse
+import mmap
+import random
+import re
+import struct
+import time
+
+from Proyecto import (
+    Juego, JugadorAleatorio, EstadoJuego, DadosAleatorios,
+    NUMERO_JUGADORES, TAMANO_ESTADO_COMPACTO, OFFSET_DADOS,
+    EVENTO_DADOS, EVENTO_ELECCION, EVENTO_CAPTURA, EVENTO_LLEGADA, EVENTO_TRES_PARES,
+    EVENTO_SIN_MOVIMIENTOS, EVENTO_TURNO_EXTRA, EVENTO_VICTORIA,
+)
+
+CABECERA = b"PRQ\x02"
+INICIO_PARTIDA = 0x24
+CLAVE = 0x25
+PASAR = 0xBF
+FIN_TURNO = 0xC0
+MAX_ELECCION = PASAR - 1
+
+# Bit de cada evento en el byte de fin de turno
+BITS_EVENTOS = {
+    EVENTO_CAPTURA: 1,
+    EVENTO_LLEGADA: 2,
+    EVENTO_TRES_PARES: 4,
+    EVENTO_SIN_MOVIMIENTOS: 8,
+    EVENTO_TURNO_EXTRA: 16,
+    EVENTO_VICTORIA: 32,
+}
+
+_TURNOS_CLAVE = struct.Struct("<I")
+
+# Una racha de turnos seguidos (dados, elecciones, fin de turno). Al indexar se
+# salta cada racha completa y se cuentan sus turnos sin recorrerla byte a byte.
+_RACHA_TURNOS = re.compile(rb"(?:[\x00-\x23][\x00-\xbf]*[\xc0-\xff])+")
+_BYTES_NO_FIN = bytes(range(FIN_TURNO))
+
+def codificar_dados(dados):
+    d1, d2 = dados
+    if not (1 <= d1 <= 6 and 1 <= d2 <= 6):
+        raise ValueError(f"Dados fuera de rango: {dados}")
+    return (d1 - 1) * 6 + (d2 - 1)
+
+def decodificar_dados(codigo):
+    return [codigo // 6 + 1, codigo % 6 + 1]
+
+def nombres_eventos(banderas):
+    return [evento for evento, bit in BITS_EVENTOS.items() if banderas & bit]
+
+class EscritorRegistro:
+    # Oyente que escribe cada turno de la partida en un archivo binario abierto
+    def __init__(self, archivo, intervalo_claves=128):
+        self.archivo = archivo
+        self.intervalo_claves = intervalo_claves
+        self.juego = None
+        self.turno = None  # Bytes del turno en curso
+        self.jugador = None
+        self.banderas = 0
+        self.dados_previos = [0, 0]
+        self.bytes_escritos = 0
+        self.turnos_escritos = 0
+        self._escribir(CABECERA)
+
+    def _escribir(self, contenido):
+        self.archivo.write(contenido)
+        self.bytes_escritos += len(contenido)
+
+    def grabar(self, juego):
+        # Empieza a grabar una partida nueva
+        self.terminar_turno()
+        if self.juego is not None and self in self.juego.oyentes:
+            self.juego.oyentes.remove(self)
+        self.juego = juego
+        juego.agregar_oyente(self)
+        self._escribir(bytes((INICIO_PARTIDA, juego.numero_jugadores)))
+        self.dados_previos = juego.dados
+
+    def __call__(self, evento, datos):
+        if evento == EVENTO_DADOS:
+            self.terminar_turno()
+            # El estado se toma justo después de lanzar, con los dados del turno
+            # anterior: así queda igual que al empezar el turno
+            turnos_previos = self.juego.turnos_jugados - 1
+            if turnos_previos % self.intervalo_claves == 0:
+                estado = self.juego.estado.clonar()
+                estado.datos[OFFSET_DADOS] = self.dados_previos[0]
+                estado.datos[OFFSET_DADOS + 1] = self.dados_previos[1]
+                self._escribir(bytes((CLAVE,)) + _TURNOS_CLAVE.pack(turnos_previos) + estado.a_bytes_compactos())
+            self.turno = bytearray((codificar_dados(datos["dados"]),))
+            self.dados_previos = list(datos["dados"])
+            self.jugador = datos["jugador"]
+            self.banderas = 0
+        elif evento == EVENTO_ELECCION:
+            indice = datos["indice"]
+            if indice is None:
+                self.turno.append(PASAR)
+            elif 0 <= indice <= MAX_ELECCION:
+                self.turno.append(indice)
+            else:
+                raise ValueError(f"Índice de movimiento fuera de rango: {indice}")
+        elif evento in BITS_EVENTOS and self.turno is not None:
+            self.banderas |= BITS_EVENTOS[evento]
+            if evento == EVENTO_VICTORIA:
+                self.terminar_turno()
+
+    def terminar_turno(self):
+        if self.turno is None:
+            return
+        # La victoria se marca aunque nadie emita EVENTO_VICTORIA (por ejemplo,
+        # si la partida se maneja con pasos_turno)
+        if self.juego.verificar_victoria(self.jugador):
+            self.banderas |= BITS_EVENTOS[EVENTO_VICTORIA]
+        self.turno.append(FIN_TURNO | self.banderas)
+        self._escribir(self.turno)
+        self.turnos_escritos += 1
+        self.turno = None
+
+    def cerrar(self):
+        self.terminar_turno()
+        self.archivo.flush()
+
+class Turno:
+    __slots__ = ("numero", "dados", "elecciones", "banderas")
+
+    def __init__(self, numero, dados, elecciones, banderas):
+        self.numero = numero
+        self.dados = dados
+        self.elecciones = elecciones
+        self.banderas = banderas
+
+class PartidaRegistrada:
+    def __init__(self, numero_jugadores, inicio):
+        self.numero_jugadores = numero_jugadores
+        self.inicio = inicio
+        self.turnos = 0
+        # (turnos jugados, posición del estado en el contenido, posición del turno siguiente)
+        self.claves = []
+
+class LectorRegistro:
+    # contenido: ruta del archivo (se mapea en memoria) o los bytes del registro
+    def __init__(self, contenido):
+        self.mapa = None
+        if isinstance(contenido, str):
+            with open(contenido, "rb") as archivo:
+                try:
+                    self.mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Archivo vacío: no se puede mapear
+                    raise ValueError("El archivo no es un registro de partidas")
+            contenido = self.mapa
+        if contenido[:len(CABECERA)] != CABECERA:
+            self.cerrar()
+            raise ValueError("El archivo no es un registro de partidas")
+        self.contenido = contenido
+        self.partidas = []
+        try:
+            self._indexar()
+        except ValueError:
+            self.cerrar()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+    def cerrar(self):
+        if self.mapa is not None:
+            self.mapa.close()
+            self.mapa = None
+
+    def _indexar(self):
+        # Una pasada por el archivo para encontrar partidas y claves
+        contenido = self.contenido
+        i = len(CABECERA)
+        partida = None
+        while i < len(contenido):
+            byte = contenido[i]
+            if byte == INICIO_PARTIDA:
+                if i + 2 > len(contenido):
+                    raise ValueError(f"Registro truncado en el byte {i}")
+                partida = PartidaRegistrada(contenido[i + 1], i + 2)
+                self.partidas.append(partida)
+                i += 2
+                continue
+            if partida is None:
+                raise ValueError(f"Registro dañado en el byte {i}: falta el inicio de la partida")
+            if byte == CLAVE:
+                inicio_estado = i + 1 + _TURNOS_CLAVE.size
+                if inicio_estado + TAMANO_ESTADO_COMPACTO > len(contenido):
+                    raise ValueError(f"Registro truncado en el byte {i}")
+                turnos, = _TURNOS_CLAVE.unpack_from(contenido, i + 1)
+                i = inicio_estado + TAMANO_ESTADO_COMPACTO
+                partida.claves.append((turnos, inicio_estado, i))
+            else:
+                racha = _RACHA_TURNOS.match(contenido, i)
+                if racha is None:
+                    raise ValueError(f"Registro dañado o truncado en el byte {i}")
+                partida.turnos += len(racha.group().translate(None, _BYTES_NO_FIN))
+                i = racha.end()
+
+    def turnos(self, numero_partida, desde=0):
+        # Recorre los turnos de una partida a partir de la posición dada
+        partida = self.partidas[numero_partida]
+        contenido = self.contenido
+        i = desde or partida.inicio
+        numero = None
+        while i < len(contenido):
+            byte = contenido[i]
+            if byte == INICIO_PARTIDA:
+                return
+            if byte == CLAVE:
+                numero, = _TURNOS_CLAVE.unpack_from(contenido, i + 1)
+                i += 1 + _TURNOS_CLAVE.size + TAMANO_ESTADO_COMPACTO
+                continue
+            fin = i + 1
+            while contenido[fin] < FIN_TURNO:
+                fin += 1
+            elecciones = [None if e == PASAR else e for e in contenido[i + 1:fin]]
+            numero += 1
+            yield Turno(numero, decodificar_dados(byte), elecciones, contenido[fin] & ~FIN_TURNO)
+            i = fin + 1
+
+    def reconstruir(self, numero_partida, turnos_jugados=None):
+        # Devuelve un Juego (silencioso) con la partida después de turnos_jugados
+        # turnos; sin turnos_jugados, al final de la partida
+        partida = self.partidas[numero_partida]
+        if turnos_jugados is None:
+            turnos_jugados = partida.turnos
+        if not 0 <= turnos_jugados <= partida.turnos:
+            raise ValueError(f"La partida tiene {partida.turnos} turnos")
+
+        juego = Juego(partida.numero_jugadores, silencioso=True)
+        if not partida.claves:
+            return juego
+
+        # La última clave que no pasa del turno pedido
+        clave = partida.claves[0]
+        for candidata in partida.claves:
+            if candidata[0] > turnos_jugados:
+                break
+            clave = candidata
+        turnos_clave, inicio_estado, siguiente = clave
+
+        estado = EstadoJuego.desde_bytes_compactos(self.contenido[inicio_estado:inicio_estado + TAMANO_ESTADO_COMPACTO])
+        juego.restaurar_estado(estado)
+        juego.turnos_jugados = turnos_clave
+        if turnos_clave == turnos_jugados:
+            return juego
+
+        for turno in self.turnos(numero_partida, siguiente - 1 - _TURNOS_CLAVE.size - TAMANO_ESTADO_COMPACTO):
+            reproducir_turno(juego, turno)
+            if turno.numero == turnos_jugados:
+                break
+        return juego
+
+_SIN_ELECCION = object()
+
+def reproducir_turno(juego, turno, verificar=True):
+    # Juega el turno con los dados y las elecciones registradas
+    banderas = [0]
+
+    def anotar(evento, datos):
+        banderas[0] |= BITS_EVENTOS.get(evento, 0)
+
+    juego.agregar_oyente(anotar)
+    try:
+        pasos = juego.pasos_turno(turno.dados)
+        elecciones = iter(turno.elecciones)
+        victoria = False
+        try:
+            next(pasos)
+            while True:
+                # Si el turno pide más decisiones que las registradas el registro
+                # está dañado; no debe confundirse con el fin del turno
+                eleccion = next(elecciones, _SIN_ELECCION)
+                if eleccion is _SIN_ELECCION:
+                    pasos.close()
+                    raise ValueError(f"El turno {turno.numero} está incompleto: faltan elecciones")
+                pasos.send(eleccion)
+        except StopIteration as fin:
+            victoria = fin.value
+        if next(elecciones, _SIN_ELECCION) is not _SIN_ELECCION:
+            raise ValueError(f"El turno {turno.numero} tiene más elecciones de las que se usaron")
+    finally:
+        juego.oyentes.remove(anotar)
+    if victoria:
+        banderas[0] |= BITS_EVENTOS[EVENTO_VICTORIA]
+    if verificar and banderas[0] != turno.banderas:
+        raise ValueError(f"El turno {turno.numero} no se reproduce igual: eventos "
+                         f"{nombres_eventos(banderas[0])} en lugar de {nombres_eventos(turno.banderas)}")
+    return victoria
+
+def grabar_partidas(ruta, partidas, numero_jugadores=NUMERO_JUGADORES, semilla=0, intervalo_claves=128):
+    azar = random.Random(semilla)
+    with open(ruta, "wb") as archivo:
+        escritor = EscritorRegistro(archivo, intervalo_claves)
+        for _ in range(partidas):
+            dados = DadosAleatorios(azar.getrandbits(64))
+            politicas = [JugadorAleatorio(azar.getrandbits(64)) for _ in range(numero_jugadores)]
+            juego = Juego(numero_jugadores, politicas=politicas, silencioso=True, fuente_dados=dados)
+            escritor.grabar(juego)
+            juego.jugar_partida()
+        escritor.cerrar()
+    return escritor
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Registro binario de partidas de Parqués")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    grabar = subcomandos.add_parser("grabar", help="jugar partidas al azar y grabarlas")
+    grabar.add_argument("archivo")
+    grabar.add_argument("-n", "--partidas", type=int, default=100)
+    grabar.add_argument("-j", "--jugadores", type=int, default=NUMERO_JUGADORES)
+    grabar.add_argument("-s", "--semilla", type=int, default=0)
+    grabar.add_argument("--intervalo", type=int, default=128, help="turnos entre estados completos")
+    reproducir = subcomandos.add_parser("reproducir", help="reconstruir una partida en un turno")
+    reproducir.add_argument("archivo")
+    reproducir.add_argument("-p", "--partida", type=int, default=0)
+    reproducir.add_argument("-t", "--turno", type=int, help="turnos jugados (por defecto, el final)")
+    args = parser.parse_args(argumentos)
+
+    if args.comando == "grabar":
+        inicio = time.perf_counter()
+        escritor = grabar_partidas(args.archivo, args.partidas, args.jugadores, args.semilla, args.intervalo)
+        segundos = time.perf_counter() - inicio
+        print(f"{args.partidas} partidas, {escritor.turnos_escritos} turnos, {escritor.bytes_escritos} bytes "
+              f"({escritor.bytes_escritos / max(escritor.turnos_escritos, 1):.2f} bytes/turno) en {segundos:.2f} s")
+        return
+
+    inicio = time.perf_counter()
+    lector = LectorRegistro(args.archivo)
+    indexado = time.perf_counter()
+    juego = lector.reconstruir(args.partida, args.turno)
+    fin = time.perf_counter()
+    juego.silencioso = False
+    juego.mostrar_tablero()
+    print(f"Partida {args.partida} de {len(lector.partidas)}, turno {juego.turnos_jugados} "
+          f"de {lector.partidas[args.partida].turnos}")
+    print(f"Índice en {1000 * (indexado - inicio):.1f} ms, reconstrucción en {1000 * (fin - indexado):.1f} ms")
+
+if __name__ == "__main__":
+    principal()
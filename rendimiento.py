@@ -0,0 +1,331 @@
+# Pruebas de rendimiento del motor con semillas y posiciones fijas.
+#
+# Cada métrica se mide varias veces y se guarda la mejor repetición, que es la
+# menos afectada por el resto de la máquina. Los resultados se escriben en JSON
+# para poder comparar corridas entre commits:
+#
+#   python rendimiento.py -o base.json
+#   python rendimiento.py --comparar base.json --umbral 0.15
+#
+# Con --comparar el programa termina con código 1 si alguna métrica empeoró más
+# que el umbral (por ejemplo 0.15 = 15 % más lenta).
+import argparse
+import gc
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from Proyecto import Juego, JugadorAleatorio, DadosAleatorios, Renderizador, BONUS_CAPTURA
+from instantaneas import AlmacenInstantaneas
+
+SEMILLA = 2024
+NUMERO_JUGADORES_PRUEBA = 4
+# Mitad de partida: casi todas las fichas fuera de la cárcel y ninguna terminada
+TURNOS_MEDIO = 60
+# Final: algún jugador ya tiene tres fichas en la meta
+TERMINADAS_FINAL = 3
+PARTIDAS_PRUEBA = 20
+MAX_TURNOS = 20000
+
+# Las 21 tiradas distintas de dos dados
+TIRADAS = [[d1, d2] for d1 in range(1, 7) for d2 in range(d1, 7)]
+
+def crear_juego(semilla):
+    politicas = [JugadorAleatorio(f"{semilla}:{i}") for i in range(NUMERO_JUGADORES_PRUEBA)]
+    return Juego(NUMERO_JUGADORES_PRUEBA, politicas=politicas, silencioso=True, fuente_dados=DadosAleatorios(semilla))
+
+def crear_posiciones(semilla=SEMILLA):
+    # Posiciones representativas tomadas de partidas al azar. Si la partida termina
+    # antes de llegar a alguna, se prueba con la semilla siguiente.
+    while True:
+        juego = crear_juego(semilla)
+        terminada = False
+        while juego.turnos_jugados < TURNOS_MEDIO and not terminada:
+            terminada = juego.jugar_turno()
+        medio = juego.guardar_estado()
+        while max(juego.fichas_terminadas) < TERMINADAS_FINAL and not terminada:
+            terminada = juego.jugar_turno()
+        if not terminada:
+            return {"medio": medio, "final": juego.guardar_estado()}
+        semilla += 1
+
+def buscar_captura(semilla=SEMILLA):
+    # Primera posición de la partida en la que el jugador de turno puede capturar:
+    # devuelve (estado, índice de la ficha, pasos)
+    juego = crear_juego(semilla)
+    while True:
+        for ficha in juego.obtener_fichas_jugador(juego.turno_actual):
+            if ficha.esta_en_carcel() or ficha.en_recta_final or ficha.terminada:
+                continue
+            for pasos in range(1, 13):
+                if not juego.ficha_puede_moverse(ficha, pasos):
+                    continue
+                marca = juego.aplicar((ficha, pasos))
+                capturada = juego.ficha_capturada(marca)
+                juego.deshacer(marca)
+                if capturada is not None:
+                    return juego.guardar_estado(), ficha.indice, pasos
+        if juego.jugar_turno():
+            semilla += 1
+            juego = crear_juego(semilla)
+
+def medir_casos(casos, repeticiones):
+    # Microsegundos por operación de cada caso (nombre -> (función, operaciones)) en su
+    # mejor repetición. Las repeticiones se intercalan entre los casos para que un rato
+    # de máquina lenta no castigue solo a uno. Como timeit, se desactiva el recolector
+    # de basura mientras se mide.
+    mejores = {}
+    recolector = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeticiones):
+            for nombre, (funcion, numero) in casos.items():
+                inicio = time.perf_counter()
+                funcion()
+                duracion = (time.perf_counter() - inicio) * 1e6 / numero
+                mejores[nombre] = min(mejores.get(nombre, duracion), duracion)
+    finally:
+        if recolector:
+            gc.enable()
+    return mejores
+
+def metrica(valor, unidad, menor_es_mejor=True):
+    return {"valor": valor, "unidad": unidad, "menor_es_mejor": menor_es_mejor}
+
+def juego_en(estado):
+    juego = Juego(NUMERO_JUGADORES_PRUEBA, politicas=[None] * NUMERO_JUGADORES_PRUEBA, silencioso=True)
+    juego.restaurar_estado(estado)
+    return juego
+
+def caso_movimientos(estado, vueltas=50):
+    # obtener_movimientos_posibles con cada una de las 21 tiradas (sin caché)
+    juego = juego_en(estado)
+    fichas = juego.obtener_fichas_jugador(juego.turno_actual)
+
+    def funcion():
+        for _ in range(vueltas):
+            for valores_dados in TIRADAS:
+                juego.obtener_movimientos_posibles(fichas, valores_dados)
+
+    return funcion, vueltas * len(TIRADAS)
+
+def caso_planes(estado, vueltas=2):
+    # obtener_planes_turno (turnos completos, sin pasar) con cada una de las 21 tiradas
+    juego = juego_en(estado)
+
+    def funcion():
+        for _ in range(vueltas):
+            for valores_dados in TIRADAS:
+                juego.dados = valores_dados
+                juego.obtener_planes_turno(valores_dados, permitir_pasar=False)
+
+    return funcion, vueltas * len(TIRADAS)
+
+def caso_puede_moverse(estado, vueltas=500):
+    # ficha_puede_moverse con un paso del tamaño del bonus por captura
+    juego = juego_en(estado)
+    fichas = [ficha for ficha in juego.fichas
+              if not (ficha.esta_en_carcel() or ficha.en_recta_final or ficha.terminada)]
+
+    def funcion():
+        for _ in range(vueltas):
+            for ficha in fichas:
+                juego.ficha_puede_moverse(ficha, BONUS_CAPTURA)
+
+    return funcion, vueltas * len(fichas)
+
+def casos_captura(vueltas=2000):
+    # realizar_movimiento con captura. Entre movimientos hay que volver a la posición
+    # de partida, así que se mide también restaurar_estado solo (restar dos medidas
+    # ruidosas daría un número poco confiable, por eso se guardan ambas)
+    estado, indice, pasos = buscar_captura()
+    juego = juego_en(estado)
+    ficha = juego.fichas[indice]
+
+    def solo_restaurar():
+        for _ in range(vueltas):
+            juego.restaurar_estado(estado)
+
+    def restaurar_y_mover():
+        for _ in range(vueltas):
+            juego.restaurar_estado(estado)
+            juego.realizar_movimiento(ficha, pasos)
+
+    return (restaurar_y_mover, vueltas), (solo_restaurar, vueltas)
+
+def casos_instantaneas(almacen, posiciones, partidas=100000, vueltas=2000):
+    # Guardar la partida en el almacén y restaurar una al azar entre muchas guardadas
+    juego = juego_en(posiciones["medio"])
+    for id_partida in range(partidas):
+        almacen.guardar(id_partida, juego)
+    azar = random.Random(SEMILLA)
+    ids = [azar.randrange(partidas) for _ in range(vueltas)]
+
+    def guardar():
+        for id_partida in ids:
+            almacen.guardar(id_partida, juego)
+
+    def restaurar():
+        for id_partida in ids:
+            almacen.restaurar(id_partida, juego)
+
+    return (guardar, vueltas), (restaurar, vueltas)
+
+def caso_partidas(turnos, partidas=PARTIDAS_PRUEBA):
+    # Partidas completas sin interfaz entre jugadores al azar; turnos[0] queda con
+    # el total de turnos jugados
+    def funcion():
+        turnos[0] = 0
+        for i in range(partidas):
+            juego = crear_juego(SEMILLA + i)
+            juego.jugar_partida(max_turnos=MAX_TURNOS)
+            turnos[0] += juego.turnos_jugados
+
+    return funcion, partidas
+
+def caso_tablero(posiciones, terminal, vueltas=500):
+    # Construcción y escritura del cuadro de mostrar_tablero. Con terminal se usa el
+    # camino de diferencias alternando entre dos posiciones, así cambian líneas reales.
+    salida = io.StringIO()
+    renderizador = Renderizador(salida)
+    renderizador.terminal = terminal
+    juegos = [juego_en(posiciones["medio"]), juego_en(posiciones["final"])]
+    for juego in juegos:
+        juego.renderizador = renderizador
+
+    def funcion():
+        salida.seek(0)
+        salida.truncate()
+        for _ in range(vueltas):
+            for juego in juegos:
+                juego.mostrar_tablero()
+
+    return funcion, vueltas * len(juegos)
+
+def ejecutar(repeticiones=7):
+    posiciones = crear_posiciones()
+    turnos = [0]
+    captura, restaurar = casos_captura()
+    directorio = tempfile.TemporaryDirectory()
+    almacen = AlmacenInstantaneas(f"{directorio.name}/instantaneas.pqi")
+    guardar_instantanea, restaurar_instantanea = casos_instantaneas(almacen, posiciones)
+    casos = {
+        "movimientos_medio": caso_movimientos(posiciones["medio"]),
+        "movimientos_final": caso_movimientos(posiciones["final"]),
+        "planes_medio": caso_planes(posiciones["medio"]),
+        "planes_final": caso_planes(posiciones["final"]),
+        "puede_moverse_20_medio": caso_puede_moverse(posiciones["medio"]),
+        "puede_moverse_20_final": caso_puede_moverse(posiciones["final"]),
+        "restaurar_y_capturar": captura,
+        "restaurar_estado": restaurar,
+        "guardar_instantanea": guardar_instantanea,
+        "restaurar_instantanea": restaurar_instantanea,
+        "partida": caso_partidas(turnos),
+        "tablero_texto": caso_tablero(posiciones, terminal=False),
+        "tablero_terminal": caso_tablero(posiciones, terminal=True),
+    }
+    try:
+        tiempos = medir_casos(casos, repeticiones)
+    finally:
+        almacen.cerrar()
+        directorio.cleanup()
+    por_partida = tiempos.pop("partida")
+    metricas = {nombre: metrica(valor, "us") for nombre, valor in tiempos.items()}
+    metricas["partidas_por_segundo"] = metrica(1e6 / por_partida, "partidas/s", menor_es_mejor=False)
+    metricas["turnos_por_segundo"] = metrica(1e6 * turnos[0] / (por_partida * PARTIDAS_PRUEBA), "turnos/s",
+                                             menor_es_mejor=False)
+    return metricas
+
+def version_codigo():
+    # Commit actual, si se ejecuta dentro del repositorio
+    try:
+        resultado = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return resultado.stdout.strip() or None
+
+def comparar(base, actual, umbral, nombres=None):
+    # Devuelve filas (nombre, valor base, valor actual, cambio) y las que empeoraron más
+    # que el umbral. El cambio es positivo cuando la métrica empeora.
+    filas = []
+    regresiones = []
+    for nombre, medida in actual.items():
+        if nombre not in base or (nombres and nombre not in nombres):
+            continue
+        anterior, valor = base[nombre]["valor"], medida["valor"]
+        if not anterior or not valor:
+            continue
+        if medida["menor_es_mejor"]:
+            cambio = valor / anterior - 1
+        else:
+            cambio = anterior / valor - 1
+        filas.append((nombre, anterior, valor, cambio))
+        if cambio > umbral:
+            regresiones.append(nombre)
+    return filas, regresiones
+
+def mostrar_metricas(metricas):
+    for nombre, medida in metricas.items():
+        print(f"  {nombre:<28} {medida['valor']:>12.2f} {medida['unidad']}")
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento del motor de Parqués")
+    parser.add_argument("-o", "--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("-r", "--repeticiones", type=int, default=7,
+                        help="repeticiones por métrica (se guarda la mejor)")
+    parser.add_argument("--comparar", metavar="BASE", help="JSON de una corrida anterior")
+    parser.add_argument("--umbral", type=float, default=0.15,
+                        help="empeoramiento relativo tolerado al comparar (0.15 = 15 %%)")
+    parser.add_argument("--metricas", nargs="+", help="métricas a vigilar al comparar (por defecto, todas)")
+    args = parser.parse_args(argumentos)
+    if args.metricas and not args.comparar:
+        parser.error("--metricas solo se usa junto con --comparar")
+
+    # La base se lee antes de medir para no esperar las repeticiones si el nombre está mal
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        faltantes = [nombre for nombre in args.metricas or () if nombre not in base["metricas"]]
+        if faltantes:
+            parser.error(f"métricas que no están en {args.comparar}: {', '.join(faltantes)}")
+
+    resultado = {
+        "commit": version_codigo(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "semilla": SEMILLA,
+        "repeticiones": args.repeticiones,
+        "metricas": ejecutar(args.repeticiones),
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, indent=2)
+            archivo.write("\n")
+
+    if not args.comparar:
+        if not args.salida:
+            print(json.dumps(resultado, indent=2))
+        else:
+            mostrar_metricas(resultado["metricas"])
+        return 0
+
+    faltantes = [nombre for nombre in args.metricas or () if nombre not in resultado["metricas"]]
+    if faltantes:
+        parser.error(f"métricas que esta versión no mide: {', '.join(faltantes)}")
+    filas, regresiones = comparar(base["metricas"], resultado["metricas"], args.umbral, args.metricas)
+    print(f"Comparación con {args.comparar} (commit {base.get('commit')}), umbral {args.umbral:.0%}")
+    for nombre, anterior, valor, cambio in filas:
+        marca = "  REGRESIÓN" if nombre in regresiones else ""
+        print(f"  {nombre:<28} {anterior:>12.2f} -> {valor:>12.2f} {cambio:>+8.1%}{marca}")
+    if regresiones:
+        print(f"{len(regresiones)} métricas empeoraron más de {args.umbral:.0%}: {', '.join(regresiones)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(principal())
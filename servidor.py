@@ -0,0 +1,480 @@
+# Servidor de Parqués: muchas mesas a la vez en un solo bucle de asyncio.
+#
+# Protocolo: una línea JSON por mensaje sobre TCP.
+# Del cliente al servidor (campo "accion"):
+#   {"accion": "crear", "jugadores": 4, "bots": 2, "tiempo_turno": 30}
+#   {"accion": "unirse", "mesa": 1, "asiento": 0}     (sin asiento, el primero libre)
+#   {"accion": "observar", "mesa": 1}
+#   {"accion": "mover", "mesa": 1, "indice": 3}        (indice null para pasar)
+#   {"accion": "mesas"}
+# Del servidor al cliente (campo "tipo"): mesa_creada, unido, observando, mesas,
+# decision (movimientos posibles para el asiento que juega), ack (movimiento
+# recibido y aplicado), evento, tiempo_agotado, fin y error.
+#
+# Los bots ocupan los últimos asientos. La partida empieza cuando todos los
+# asientos humanos están ocupados; si un jugador no responde a tiempo se pasa
+# su turno, y si se desconecta su asiento lo toma un bot. Los bots costosos
+# (Jugador.costosa, como computador) piensan en un hilo aparte, así una búsqueda
+# no detiene las demás mesas ni las conexiones.
+#
+# Con --instantaneas ARCHIVO cada mesa se guarda después de cada turno; al volver a
+# iniciar el servidor las mesas que quedaron a medias se abren de nuevo con el mismo
+# número y esperan a que sus jugadores se unan otra vez.
+import argparse
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Proyecto import Juego, Ficha, DadosAleatorios, NUMERO_JUGADORES, EVENTO_DADOS
+from instantaneas import AlmacenInstantaneas
+from torneo import crear_politica, POLITICAS
+
+# La configuración de la mesa va en la etiqueta de su instantánea:
+# bots en los 4 bits bajos y el índice de la política de los bots en el resto
+NOMBRES_POLITICAS = list(POLITICAS)
+
+PUERTO = 8765
+TIEMPO_TURNO = 30.0
+# Bytes pendientes de enviar a partir de los cuales se desconecta a un espectador lento
+LIMITE_BUFFER = 1 << 20
+
+def a_json(valor):
+    # Los datos de los eventos pueden tener fichas; se envían como [jugador, ficha]
+    if isinstance(valor, Ficha):
+        return [valor.id_jugador, valor.id_ficha]
+    if isinstance(valor, (list, tuple)):
+        return [a_json(v) for v in valor]
+    return valor
+
+class Conexion:
+    # Los mensajes se juntan y se escriben una vez por vuelta del bucle de eventos,
+    # así un movimiento con varios eventos es una sola escritura al socket
+    def __init__(self, escritor):
+        self.escritor = escritor
+        self.abierta = True
+        self.pendientes = []
+
+    def enviar(self, mensaje):
+        if not self.abierta:
+            return
+        if not self.pendientes:
+            asyncio.get_running_loop().call_soon(self.vaciar)
+        self.pendientes.append(json.dumps(mensaje, separators=(",", ":")).encode())
+
+    def vaciar(self):
+        if self.abierta and self.pendientes:
+            self.pendientes.append(b"")
+            self.escritor.write(b"\n".join(self.pendientes))
+        self.pendientes = []
+
+    def saturada(self):
+        return self.escritor.transport.get_write_buffer_size() > LIMITE_BUFFER
+
+    def cerrar(self):
+        if self.abierta:
+            self.abierta = False
+            self.escritor.close()
+
+class Mesa:
+    def __init__(self, servidor, id_mesa, numero_jugadores, bots=0, politica_bots="aleatorio",
+                 tiempo_turno=TIEMPO_TURNO, semilla=None):
+        if not 2 <= numero_jugadores <= NUMERO_JUGADORES:
+            raise ValueError(f"Una mesa tiene entre 2 y {NUMERO_JUGADORES} jugadores")
+        if not 0 <= bots <= numero_jugadores:
+            raise ValueError("Número de bots no válido")
+        if politica_bots not in POLITICAS:
+            raise ValueError(f"Política desconocida: {politica_bots}")
+        # Un tiempo no numérico mataría la tarea de la mesa, y uno negativo agotaría cada turno humano
+        if isinstance(tiempo_turno, bool) or not isinstance(tiempo_turno, (int, float)) or not tiempo_turno > 0:
+            raise ValueError(f"Tiempo de turno no válido: {tiempo_turno!r}")
+        # Se comprueba que la política se puede crear (finales necesita su tabla)
+        # antes de abrir la mesa, no cuando un bot tenga que tomar un asiento
+        try:
+            crear_politica(politica_bots, 0)
+        except OSError as error:
+            raise ValueError(f"No se puede usar la política {politica_bots}: {error}")
+        self.servidor = servidor
+        self.id = id_mesa
+        self.tiempo_turno = tiempo_turno
+        self.politica_bots = politica_bots
+        self.bots = bots
+        self.azar = random.Random(semilla)
+        self.juego = Juego(numero_jugadores, politicas=[None] * numero_jugadores, silencioso=True,
+                           fuente_dados=DadosAleatorios(self.azar.getrandbits(64)))
+        self.juego.agregar_oyente(self.al_evento)
+        # Conexión de cada asiento humano; los bots tienen su política en juego.politicas
+        self.asientos = [None] * numero_jugadores
+        for asiento in range(numero_jugadores - bots, numero_jugadores):
+            self.juego.politicas[asiento] = self.nueva_politica_bot()
+        self.espectadores = set()
+        self.completa = asyncio.Event()
+        self.revisar_completa()
+        # Decisión pendiente: (asiento, futuro con el índice elegido, cantidad de movimientos)
+        self.pendiente = None
+        self.terminada = False
+
+    def etiqueta(self):
+        return self.bots | NOMBRES_POLITICAS.index(self.politica_bots) << 4
+
+    def nueva_politica_bot(self):
+        return crear_politica(self.politica_bots, self.azar.getrandbits(64))
+
+    def asientos_humanos(self):
+        return [a for a in range(len(self.asientos)) if self.juego.politicas[a] is None]
+
+    def revisar_completa(self):
+        if all(self.asientos[a] is not None for a in self.asientos_humanos()):
+            self.completa.set()
+
+    def resumen(self):
+        return {
+            "mesa": self.id,
+            "jugadores": self.juego.numero_jugadores,
+            "libres": [a for a in self.asientos_humanos() if self.asientos[a] is None],
+            "turnos": self.juego.turnos_jugados,
+            "espectadores": len(self.espectadores),
+        }
+
+    def conexiones(self):
+        return [c for c in self.asientos if c is not None] + list(self.espectadores)
+
+    def difundir(self, mensaje):
+        for conexion in self.conexiones():
+            conexion.enviar(mensaje)
+        # Un espectador que no lee no puede hacer crecer la memoria del servidor
+        for conexion in [c for c in self.espectadores if c.saturada()]:
+            self.espectadores.discard(conexion)
+            conexion.cerrar()
+
+    def al_evento(self, evento, datos):
+        mensaje = {"tipo": "evento", "mesa": self.id, "evento": evento}
+        for nombre, valor in datos.items():
+            mensaje[nombre] = a_json(valor)
+        if evento == EVENTO_DADOS:
+            mensaje["turno"] = self.juego.turnos_jugados
+        self.difundir(mensaje)
+
+    def unir(self, conexion, asiento=None):
+        libres = [a for a in self.asientos_humanos() if self.asientos[a] is None]
+        if asiento is None:
+            if not libres:
+                raise ValueError("La mesa está completa")
+            asiento = libres[0]
+        elif asiento not in libres:
+            raise ValueError(f"El asiento {asiento} no está libre")
+        self.asientos[asiento] = conexion
+        self.revisar_completa()
+        return asiento
+
+    def observar(self, conexion):
+        self.espectadores.add(conexion)
+
+    def desconectar(self, conexion):
+        self.espectadores.discard(conexion)
+        for asiento, ocupante in enumerate(self.asientos):
+            if ocupante is conexion:
+                # El asiento abandonado lo juega un bot
+                self.asientos[asiento] = None
+                self.juego.politicas[asiento] = self.nueva_politica_bot()
+                if self.pendiente is not None and self.pendiente[0] == asiento and not self.pendiente[1].done():
+                    self.pendiente[1].set_result(None)
+        self.revisar_completa()
+
+    def recibir_movimiento(self, conexion, indice):
+        if self.pendiente is None or self.asientos[self.pendiente[0]] is not conexion:
+            raise ValueError("No es su turno")
+        asiento, futuro, cantidad = self.pendiente
+        valido = isinstance(indice, int) and not isinstance(indice, bool) and 0 <= indice < cantidad
+        if indice is not None and not valido:
+            raise ValueError(f"Índice de movimiento no válido: {indice}")
+        if not futuro.done():
+            futuro.set_result(indice)
+
+    async def elegir(self, asiento, movimientos, valores_dados):
+        politica = self.juego.politicas[asiento]
+        if politica is not None:
+            if politica.costosa:
+                # Mientras tanto la partida no cambia: esta mesa espera la respuesta
+                return await self.servidor.pensar(politica, self.juego, movimientos, valores_dados)
+            return politica.elegir(self.juego, movimientos, valores_dados)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self.pendiente = (asiento, futuro, len(movimientos))
+        self.asientos[asiento].enviar({
+            "tipo": "decision",
+            "mesa": self.id,
+            "turno": self.juego.turnos_jugados,
+            "valores": valores_dados,
+            "movimientos": [[ficha.id_ficha, pasos, indices] for ficha, pasos, indices in movimientos],
+            "limite": self.tiempo_turno,
+        })
+        try:
+            return await asyncio.wait_for(futuro, self.tiempo_turno)
+        except asyncio.TimeoutError:
+            self.difundir({"tipo": "tiempo_agotado", "mesa": self.id, "asiento": asiento})
+            return None
+        finally:
+            self.pendiente = None
+
+    def confirmar(self, asiento, indice):
+        # El ack sale cuando el movimiento ya se aplicó
+        conexion = self.asientos[asiento]
+        if conexion is not None:
+            conexion.enviar({"tipo": "ack", "mesa": self.id, "indice": indice})
+
+    async def jugar(self):
+        self.servidor.guardar_mesa(self)
+        await self.completa.wait()
+        juego = self.juego
+        victoria = False
+        while not victoria:
+            asiento = juego.turno_actual
+            turno = juego.pasos_turno()
+            try:
+                movimientos, valores_dados = next(turno)
+                while True:
+                    indice = await self.elegir(asiento, movimientos, valores_dados)
+                    try:
+                        movimientos, valores_dados = turno.send(indice)
+                    finally:
+                        self.confirmar(asiento, indice)
+            except StopIteration as fin:
+                victoria = fin.value
+            if not victoria:
+                self.servidor.guardar_mesa(self)
+            # Dejar que las otras mesas avancen entre turnos
+            await asyncio.sleep(0)
+        self.terminada = True
+        self.difundir({"tipo": "fin", "mesa": self.id, "ganador": juego.turno_actual, "turnos": juego.turnos_jugados})
+
+class Servidor:
+    def __init__(self, tiempo_turno=TIEMPO_TURNO, instantaneas=None):
+        self.tiempo_turno = tiempo_turno
+        self.mesas = {}
+        self.siguiente_mesa = 1
+        self.tareas = set()
+        self.servidor = None
+        # Almacén donde se guarda cada mesa después de cada turno (ruta, o None para no guardar)
+        self.almacen = AlmacenInstantaneas(instantaneas) if instantaneas else None
+        # Hilo de los bots costosos. Uno solo basta: por el GIL más hilos no piensan
+        # más rápido, y así dos búsquedas no compiten por el mismo presupuesto.
+        self.ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bots")
+
+    async def iniciar(self, host="127.0.0.1", puerto=PUERTO):
+        self.restaurar_mesas()
+        self.servidor = await asyncio.start_server(self.atender, host, puerto, limit=1 << 16)
+        return self.servidor.sockets[0].getsockname()[1]
+
+    async def detener(self):
+        if self.servidor is not None:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+        for tarea in self.tareas:
+            tarea.cancel()
+        self.ejecutor.shutdown(wait=False, cancel_futures=True)
+        if self.almacen is not None:
+            self.almacen.cerrar()
+            self.almacen = None
+
+    def crear_mesa(self, numero_jugadores, bots=0, politica_bots="aleatorio", tiempo_turno=None, id_mesa=None):
+        if id_mesa is None:
+            id_mesa = self.siguiente_mesa
+        mesa = Mesa(self, id_mesa, numero_jugadores, bots, politica_bots,
+                    self.tiempo_turno if tiempo_turno is None else tiempo_turno)
+        self.siguiente_mesa = max(self.siguiente_mesa, id_mesa + 1)
+        self.mesas[mesa.id] = mesa
+        tarea = asyncio.create_task(self.jugar_mesa(mesa))
+        self.tareas.add(tarea)
+        tarea.add_done_callback(self.tareas.discard)
+        return mesa
+
+    async def jugar_mesa(self, mesa):
+        try:
+            await mesa.jugar()
+        finally:
+            self.mesas.pop(mesa.id, None)
+            # Una mesa interrumpida (servidor detenido) se queda guardada para seguirla
+            if mesa.terminada and self.almacen is not None:
+                self.almacen.descartar(mesa.id)
+
+    async def pensar(self, politica, juego, movimientos, valores_dados):
+        return await asyncio.get_running_loop().run_in_executor(self.ejecutor, politica.elegir, juego, movimientos,
+                                                                valores_dados)
+
+    def guardar_mesa(self, mesa):
+        if self.almacen is not None:
+            self.almacen.guardar(mesa.id, mesa.juego, mesa.etiqueta())
+
+    def restaurar_mesas(self):
+        if self.almacen is None:
+            return
+        for id_mesa in self.almacen:
+            instantanea, etiqueta = self.almacen.leer(id_mesa)
+            # El primer byte de la instantánea es el número de jugadores
+            mesa = self.crear_mesa(instantanea[0], etiqueta & 0xF, NOMBRES_POLITICAS[etiqueta >> 4], id_mesa=id_mesa)
+            mesa.juego.restaurar_instantanea(instantanea)
+
+    def buscar_mesa(self, mensaje):
+        mesa = self.mesas.get(mensaje.get("mesa"))
+        if mesa is None:
+            raise ValueError(f"No existe la mesa {mensaje.get('mesa')}")
+        return mesa
+
+    def procesar(self, conexion, mensaje, mesas_conexion):
+        accion = mensaje.get("accion")
+        if accion == "mover":
+            self.buscar_mesa(mensaje).recibir_movimiento(conexion, mensaje.get("indice"))
+        elif accion == "crear":
+            mesa = self.crear_mesa(int(mensaje.get("jugadores", NUMERO_JUGADORES)), int(mensaje.get("bots", 0)),
+                                   mensaje.get("politica_bots", "aleatorio"), mensaje.get("tiempo_turno"))
+            conexion.enviar({"tipo": "mesa_creada", "mesa": mesa.id})
+        elif accion == "unirse":
+            mesa = self.buscar_mesa(mensaje)
+            asiento = mesa.unir(conexion, mensaje.get("asiento"))
+            mesas_conexion.add(mesa)
+            conexion.enviar({"tipo": "unido", "mesa": mesa.id, "asiento": asiento})
+        elif accion == "observar":
+            mesa = self.buscar_mesa(mensaje)
+            mesa.observar(conexion)
+            mesas_conexion.add(mesa)
+            conexion.enviar({"tipo": "observando", **mesa.resumen()})
+        elif accion == "mesas":
+            conexion.enviar({"tipo": "mesas", "mesas": [mesa.resumen() for mesa in self.mesas.values()]})
+        else:
+            raise ValueError(f"Acción desconocida: {accion}")
+
+    async def atender(self, lector, escritor):
+        conexion = Conexion(escritor)
+        mesas_conexion = set()
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                try:
+                    self.procesar(conexion, json.loads(linea), mesas_conexion)
+                except (ValueError, TypeError, AttributeError) as error:
+                    conexion.enviar({"tipo": "error", "mensaje": str(error)})
+                if escritor.transport.get_write_buffer_size() > LIMITE_BUFFER:
+                    await escritor.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for mesa in mesas_conexion:
+                mesa.desconectar(conexion)
+            conexion.cerrar()
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+async def cliente_simulado(host, puerto, latencias, semilla, jugadores=2, bots=1, pausa=0.0,
+                           politica_bots="aleatorio"):
+    # Crea una mesa, se sienta en los asientos humanos y juega al azar hasta el final,
+    # pensando cada movimiento hasta pausa segundos (al azar, para no ir todos a la vez).
+    # Guarda la latencia entre enviar cada movimiento y recibir su ack.
+    azar = random.Random(semilla)
+    lector, escritor = await asyncio.open_connection(host, puerto, limit=1 << 16)
+
+    def enviar(mensaje):
+        escritor.write(json.dumps(mensaje).encode() + b"\n")
+
+    enviar({"accion": "crear", "jugadores": jugadores, "bots": bots, "politica_bots": politica_bots})
+    enviado = None
+    movimientos = 0
+    while True:
+        linea = await lector.readline()
+        if not linea:
+            break
+        mensaje = json.loads(linea)
+        tipo = mensaje["tipo"]
+        if tipo == "mesa_creada":
+            for _ in range(jugadores - bots):
+                enviar({"accion": "unirse", "mesa": mensaje["mesa"]})
+        elif tipo == "decision":
+            if pausa:
+                await asyncio.sleep(azar.uniform(0, pausa))
+            enviado = time.perf_counter()
+            enviar({"accion": "mover", "mesa": mensaje["mesa"], "indice": azar.randrange(len(mensaje["movimientos"]))})
+        elif tipo == "ack" and enviado is not None:
+            latencias.append(time.perf_counter() - enviado)
+            enviado = None
+            movimientos += 1
+        elif tipo == "fin":
+            break
+        elif tipo == "error":
+            raise RuntimeError(mensaje["mensaje"])
+    escritor.close()
+    return movimientos
+
+async def prueba_carga(clientes, host="127.0.0.1", puerto=0, jugadores=2, bots=1, pausa=0.0, semilla=0, externo=False,
+                       instantaneas=None, politica_bots="aleatorio"):
+    # Lanza los clientes a la vez contra un servidor (propio, o externo en host:puerto)
+    servidor = None
+    if not externo:
+        servidor = Servidor(instantaneas=instantaneas)
+        puerto = await servidor.iniciar(host, puerto)
+    latencias = []
+    inicio = time.perf_counter()
+    movimientos = await asyncio.gather(*[
+        cliente_simulado(host, puerto, latencias, f"{semilla}:{i}", jugadores, bots, pausa, politica_bots)
+        for i in range(clientes)
+    ])
+    segundos = time.perf_counter() - inicio
+    if servidor is not None:
+        await servidor.detener()
+    return {
+        "mesas": clientes,
+        "movimientos": sum(movimientos),
+        "segundos": segundos,
+        "movimientos_por_segundo": sum(movimientos) / segundos,
+        "latencia_ms": {
+            "p50": 1000 * percentil(latencias, 50),
+            "p99": 1000 * percentil(latencias, 99),
+            "max": 1000 * max(latencias, default=0.0),
+        },
+    }
+
+async def servir(host, puerto, tiempo_turno, instantaneas=None):
+    servidor = Servidor(tiempo_turno, instantaneas)
+    puerto = await servidor.iniciar(host, puerto)
+    print(f"Servidor de Parqués escuchando en {host}:{puerto}")
+    if servidor.mesas:
+        print(f"{len(servidor.mesas)} mesas restauradas de {instantaneas}")
+    await asyncio.Event().wait()
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Servidor de Parqués con muchas mesas a la vez")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--tiempo-turno", type=float, default=TIEMPO_TURNO, help="segundos para elegir un movimiento")
+    parser.add_argument("--prueba-carga", type=int, metavar="N", help="jugar N mesas con clientes simulados y medir latencias")
+    parser.add_argument("--externo", action="store_true", help="en la prueba de carga, usar un servidor ya iniciado")
+    parser.add_argument("-j", "--jugadores", type=int, default=2, help="jugadores por mesa en la prueba de carga")
+    parser.add_argument("--bots", type=int, default=1, help="bots por mesa en la prueba de carga")
+    parser.add_argument("--politica-bots", default="aleatorio", choices=POLITICAS,
+                        help="política de los bots en la prueba de carga")
+    parser.add_argument("--pausa", type=float, default=0.0,
+                        help="en la prueba de carga, segundos máximos que piensa cada cliente antes de mover")
+    parser.add_argument("--instantaneas", metavar="ARCHIVO",
+                        help="guardar las mesas en cada turno y restaurar al iniciar las que quedaron a medias")
+    args = parser.parse_args(argumentos)
+
+    try:
+        if args.prueba_carga:
+            puerto = args.puerto if args.externo else 0
+            resultado = asyncio.run(prueba_carga(args.prueba_carga, args.host, puerto, args.jugadores, args.bots,
+                                                 args.pausa, externo=args.externo, instantaneas=args.instantaneas,
+                                                 politica_bots=args.politica_bots))
+            print(json.dumps(resultado, indent=2))
+        else:
+            asyncio.run(servir(args.host, args.puerto, args.tiempo_turno, args.instantaneas))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    principal()
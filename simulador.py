@@ -0,0 +1,439 @@
+# Simulador por lotes: avanza miles de partidas a la vez con NumPy.
+# Implementa las mismas reglas que Juego (Ficha.mover, ficha_puede_moverse,
+# capturar_ficha, verificar_pares) con un jugador que elige al azar entre los
+# movimientos posibles, igual que JugadorAleatorio.
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from Proyecto import (
+    Juego, JugadorAleatorio, Tablero, DadosAleatorios,
+    NUMERO_JUGADORES, NUMERO_FICHAS, TAMANO_TABLERO, TAMANO_LLEGADA,
+    SALIDA_FICHAS, BONUS_CAPTURA, BONUS_LLEGADA, EVENTO_CAPTURA,
+)
+
+MAX_TURNOS = 20000
+
+# Distancia usada cuando no hay ningún bloqueo en el camino
+SIN_BLOQUEO = 1000
+
+_tablero = Tablero()
+SALIDAS = np.array(_tablero.salidas, dtype=np.int16)
+ENTRADAS = np.array(_tablero.entradas_llegada, dtype=np.int16)
+ESPECIALES = np.zeros(TAMANO_TABLERO, dtype=bool)
+ESPECIALES[_tablero.seguros + _tablero.salidas] = True
+
+# Columnas por partida de la ocupación del tablero, indexada por posición + 2
+COLUMNAS_OCUPACION = TAMANO_TABLERO + 2
+
+# Opciones de movimiento por ficha: usar el valor 0, 1 o 2, o la suma de todos
+OPCIONES = 4
+OPCION_SUMA = 3
+
+# Los movimientos posibles de una partida caben en una máscara de 16 bits
+# (ficha * OPCIONES + opción). Estas tablas dan cuántos bits hay en cada máscara
+# y la posición del r-ésimo bit, para elegir un movimiento sin recorrer la máscara.
+def _crear_tablas_mascara():
+    bits = ((np.arange(1 << 16)[:, None] >> np.arange(16)) & 1).astype(bool)
+    conteo = bits.sum(axis=1).astype(np.uint8)
+    acumulado = np.cumsum(bits, axis=1)
+    seleccion = np.zeros((1 << 16, 16), dtype=np.uint8)
+    for r in range(16):
+        seleccion[:, r] = np.argmax(acumulado > r, axis=1)
+    return conteo, seleccion.ravel()
+
+CONTEO_BITS, SELECCION_BIT = _crear_tablas_mascara()
+
+# Máscara de movimientos cuando un 5 obliga a sacar fichas, indexada por
+# (fichas en la cárcel como 4 bits) * OPCIONES + opción que da el 5
+MASCARA_SALIDA = np.array([
+    sum(1 << (ficha * OPCIONES + opcion) for ficha in range(NUMERO_FICHAS) if carcel >> ficha & 1)
+    for carcel in range(1 << NUMERO_FICHAS) for opcion in range(OPCIONES)
+], dtype=np.uint16)
+
+# Multiplicar un entero de 16 bits por este número lo copia en las cuatro palabras
+# de un entero de 64 bits
+CUATRO_VECES = np.uint64(0x0001000100010001)
+
+def repetir_cuatro(valores):
+    # Cada valor de un arreglo int16 contiguo repetido cuatro veces seguidas (tantas
+    # como fichas y como opciones), mucho más rápido que np.repeat o que difundir
+    # una columna contra una matriz de 4 columnas
+    return (valores.view(np.uint16).astype(np.uint64) * CUATRO_VECES).view(np.int16)
+
+# Por opción, los bits de los valores que quedan antes y después del valor usado
+# en la fila de 64 bits de valores de una partida
+VALORES_ANTES = np.array([0, 0xFFFF, 0xFFFFFFFF, 0], dtype=np.uint64)
+VALORES_DESPUES = ~VALORES_ANTES
+VALORES_DESPUES[OPCION_SUMA] = 0
+
+# Arreglos con una fila por partida del lote
+ESTADO = ("posicion", "llegada", "terminada", "turno", "pares", "bonus", "ultima", "valores", "es_par",
+          "debe_lanzar", "turnos", "capturas", "activa", "ocupacion")
+
+class SimuladorLotes:
+    def __init__(self, numero_jugadores=NUMERO_JUGADORES, tamano_lote=4096, semilla=None, max_turnos=MAX_TURNOS):
+        self.numero_jugadores = numero_jugadores
+        self.tamano_completo = tamano_lote
+        self.max_turnos = max_turnos
+        self.azar = np.random.default_rng(semilla)
+        self.crear_estado(tamano_lote)
+
+    def crear_estado(self, k):
+        n = self.numero_jugadores
+        self.tamano_lote = k
+        forma = (k, n, NUMERO_FICHAS)
+        self.posicion = np.full(forma, -1, dtype=np.int16)  # -1 cárcel, -2 recta final
+        self.llegada = np.full(forma, -1, dtype=np.int16)
+        self.terminada = np.zeros(forma, dtype=bool)
+        self.turno = np.zeros(k, dtype=np.int64)
+        self.pares = np.zeros(k, dtype=np.int16)
+        self.bonus = np.zeros(k, dtype=np.int16)
+        self.ultima = np.full(k, -1, dtype=np.int64)  # id_jugador * NUMERO_FICHAS + id_ficha
+        # Valores de dados (y bonus) que quedan por usar en el turno, al principio y
+        # seguidos de ceros; la última columna siempre es cero
+        self.valores = np.zeros((k, OPCIONES), dtype="<i2")
+        # filas_valores es la misma memoria con cada fila como un entero de 64 bits (el
+        # valor 0 en los 16 bits bajos), para cambiar los valores de una partida en una
+        # sola operación
+        self.es_par = np.zeros(k, dtype=bool)
+        self.debe_lanzar = np.ones(k, dtype=bool)
+        self.turnos = np.zeros(k, dtype=np.int64)
+        self.capturas = np.zeros(k, dtype=np.int64)
+        self.activa = np.zeros(k, dtype=bool)
+        # Fichas en cada casilla del tablero, indexada por posición + 2 (las columnas
+        # de la cárcel y la recta final quedan siempre en cero). Como en una casilla
+        # común dos rivales no conviven (el que llega captura), una casilla con dos o
+        # más fichas es un bloqueo.
+        self.ocupacion = np.zeros((k, COLUMNAS_OCUPACION), dtype=np.uint8)
+        self.indices()
+
+    def indices(self):
+        # Vistas e índices que dependen del tamaño del lote
+        self.filas_turno = np.arange(self.tamano_lote) * self.numero_jugadores
+        self.filas_valores = self.valores.view("<u8").ravel()
+
+    def compactar(self):
+        # Deja en el lote solo las partidas activas, en el mismo orden, para que las
+        # ranuras vacías del final no paguen cada operación del paso
+        activas = np.nonzero(self.activa)[0]
+        for nombre in ESTADO:
+            setattr(self, nombre, getattr(self, nombre)[activas])
+        self.tamano_lote = activas.size
+        self.indices()
+
+    def reiniciar(self, ranuras):
+        self.posicion[ranuras] = -1
+        self.llegada[ranuras] = -1
+        self.terminada[ranuras] = False
+        self.turno[ranuras] = 0
+        self.pares[ranuras] = 0
+        self.bonus[ranuras] = 0
+        self.ultima[ranuras] = -1
+        self.valores[ranuras] = 0
+        self.ocupacion[ranuras] = 0
+        self.es_par[ranuras] = False
+        self.debe_lanzar[ranuras] = True
+        self.turnos[ranuras] = 0
+        self.capturas[ranuras] = 0
+        self.activa[ranuras] = True
+
+    def lanzar_dados(self):
+        # Equivalente a lanzar_dados + verificar_pares + agregar el bonus pendiente
+        g = np.nonzero(self.activa & self.debe_lanzar)[0]
+        if g.size == 0:
+            return
+        dados = self.azar.integers(1, 7, size=(g.size, 2), dtype=np.int16)
+        self.turnos[g] += 1
+
+        par = dados[:, 0] == dados[:, 1]
+        pares = (self.pares[g] + 1) * par
+        ultima = self.ultima[g]
+        # ultima ya es jugador * NUMERO_FICHAS + ficha: el índice plano sale directo
+        indice = g * (self.numero_jugadores * NUMERO_FICHAS) + np.maximum(ultima, 0)
+        castigo = par & (pares == 3) & (ultima >= 0) & ~self.terminada.ravel()[indice]
+        if castigo.any():
+            c = indice[castigo]
+            anterior = self.posicion.ravel()[c]
+            self.ocupacion.ravel()[g[castigo] * COLUMNAS_OCUPACION + 2 + anterior] -= anterior >= 0
+            self.posicion.ravel()[c] = -1
+            self.llegada.ravel()[c] = -1
+            pares[castigo] = 0
+        self.pares[g] = pares
+        self.es_par[g] = par
+
+        dados = dados.astype(np.uint64)
+        bonus = self.bonus[g].astype(np.uint64)
+        self.filas_valores[g] = dados[:, 0] | dados[:, 1] << np.uint64(16) | bonus << np.uint64(32)
+        self.bonus[g] = 0
+        self.debe_lanzar[g] = False
+
+    def movimientos_posibles(self):
+        # Devuelve, por partida, una máscara de 16 bits con los movimientos que
+        # generaría obtener_movimientos_posibles (bit ficha * OPCIONES + opción),
+        # los pasos de cada opción y la distancia de cada ficha a su entrada.
+        # Las máscaras se aplican multiplicando por booleanos y los módulos se hacen
+        # sumando: np.where y % cuestan varias veces más que el resto del paso.
+        turno = self.turno
+        fila = self.filas_turno + turno
+        pos = np.take(self.posicion.reshape(-1, NUMERO_FICHAS), fila, axis=0)
+        lleg = np.take(self.llegada.reshape(-1, NUMERO_FICHAS), fila, axis=0)
+
+        # Los valores que quedan van al principio, así que la suma es la de la fila
+        valores = self.valores
+        pasos = valores.copy()
+        pasos[:, OPCION_SUMA] = valores[:, 0] + valores[:, 1] + valores[:, 2]
+        opcion_valida = pasos > 0
+        opcion_valida[:, OPCION_SUMA] = (valores[:, 1] > 0) & (valores[:, 0] != valores[:, 1])
+        # Las opciones no válidas piden más pasos de los que cualquier ficha puede dar
+        pasos += ~opcion_valida * np.int16(SIN_BLOQUEO + 1)
+
+        # Una ficha que terminó sigue en la recta final, sin pasos por dar
+        carcel = pos == -1
+        recta = pos == -2
+        pista = pos >= 0
+
+        # Pasos libres antes del primer bloqueo en el camino de cada ficha: dos fichas
+        # del mismo jugador, o dos fichas cualesquiera en un seguro o una salida.
+        # Los bloqueos son pocos, así que solo se recorren las casillas bloqueadas.
+        libres = np.full((self.tamano_lote, NUMERO_FICHAS), SIN_BLOQUEO, dtype=np.int16)
+        plana = np.flatnonzero(self.ocupacion >= 2)
+        if plana.size:
+            g, columna = np.divmod(plana, COLUMNAS_OCUPACION)
+            desfase = repetir_cuatro((columna - 3).astype(np.int16)).reshape(-1, NUMERO_FICHAS) - pos[g]
+            desfase += (desfase < 0) * np.int16(TAMANO_TABLERO)
+            inicio = np.flatnonzero(np.diff(g, prepend=-1))
+            libres[g[inicio]] = np.minimum.reduceat(desfase, inicio, axis=0)
+
+        # Máximo de pasos que puede dar cada ficha: en la recta final no puede pasarse
+        # de la llegada, y en el tablero tampoco puede saltar un bloqueo. En la cárcel
+        # el tope es -1, que no se da en el tablero ni en la recta.
+        distancia = repetir_cuatro(ENTRADAS[turno]).reshape(-1, NUMERO_FICHAS) - pos
+        distancia += (distancia < 0) * np.int16(TAMANO_TABLERO)
+        tope = (recta * (np.int16(TAMANO_LLEGADA - 1) - lleg)
+                + pista * np.minimum(libres, distancia + np.int16(TAMANO_LLEGADA - 1)) - carcel)
+        tope_opcion = repetir_cuatro(tope)
+        pasos_opcion = np.tile(pasos, (1, NUMERO_FICHAS))
+        legal = pasos_opcion <= tope_opcion
+        legal |= (tope_opcion == -1) & (pasos_opcion == SALIDA_FICHAS)
+
+        # Si hay fichas en la cárcel y sale un 5 (o suman 5), solo se puede sacar fichas
+        es_cinco = valores == SALIDA_FICHAS
+        hay_cinco = es_cinco[:, 0] | es_cinco[:, 1] | es_cinco[:, 2]
+        forzado = ((carcel[:, 0] | carcel[:, 1] | carcel[:, 2] | carcel[:, 3])
+                   & (hay_cinco | (pasos[:, OPCION_SUMA] == SALIDA_FICHAS)))
+        # Empaquetar la matriz aplanada es mucho más rápido que hacerlo por filas
+        mascara = np.packbits(legal.ravel(), bitorder="little").view("<u2")
+        f = np.nonzero(forzado)[0]
+        if f.size:
+            opcion_cinco = np.where(hay_cinco[f], es_cinco[f].argmax(axis=1), OPCION_SUMA)
+            en_carcel = np.packbits(carcel[f], axis=1, bitorder="little")[:, 0]
+            mascara[f] = MASCARA_SALIDA[en_carcel.astype(np.intp) * OPCIONES + opcion_cinco]
+        mascara *= self.activa
+        return mascara, pasos, distancia
+
+    def paso(self):
+        # Avanza cada partida activa una decisión: lanza si hace falta y hace un movimiento
+        # elegido al azar. Devuelve las ranuras de las partidas que terminaron.
+        self.lanzar_dados()
+        mascara, pasos, distancia = self.movimientos_posibles()
+
+        k = self.tamano_lote
+        numero = np.take(CONTEO_BITS, mascara)
+        sin_movimientos = self.activa & (numero == 0)
+        fin_turno = sin_movimientos.copy()
+        ganada = np.zeros(k, dtype=bool)
+
+        g = np.nonzero(numero > 0)[0]
+        if g.size:
+            azar = (self.azar.random(g.size) * numero[g]).astype(np.intp)
+            eleccion = np.take(SELECCION_BIT, mascara[g].astype(np.intp) * 16 + azar)
+            ficha = (eleccion // OPCIONES).astype(np.intp)
+            opcion = (eleccion - ficha * OPCIONES).astype(np.intp)
+            jugador = self.turno[g]
+            llego = self.mover(g, jugador, ficha, opcion, pasos[g, opcion], distancia[g, ficha])
+
+            # Solo puede ganar quien acaba de llevar una ficha a la meta
+            l = g[llego]
+            ganada[l] = self.terminada[l, jugador[llego]].all(axis=1)
+            fin_turno[g] |= (self.filas_valores[g] == 0) & ~ganada[g]
+
+        # Cambiar de turno si no son pares
+        t = np.nonzero(fin_turno)[0]
+        turno = self.turno[t] + ~self.es_par[t]
+        turno -= (turno == self.numero_jugadores) * self.numero_jugadores
+        self.turno[t] = turno
+        self.debe_lanzar[t] = True
+
+        agotada = self.activa & ~ganada & (self.turnos >= self.max_turnos) & self.debe_lanzar
+        terminadas = np.nonzero(ganada | agotada)[0]
+        self.activa[terminadas] = False
+        return terminadas, ganada[terminadas]
+
+    def mover(self, g, jugador, ficha, opcion, pasos, distancia):
+        # Equivalente a realizar_movimiento para una ficha por partida. Devuelve en
+        # qué partidas la ficha llegó a la meta.
+        indice = (g * self.numero_jugadores + jugador) * NUMERO_FICHAS + ficha
+        posiciones, llegadas, ocupacion = self.posicion.ravel(), self.llegada.ravel(), self.ocupacion.ravel()
+        pos = posiciones[indice]
+        lleg = llegadas[indice]
+        carcel = pos == -1
+        recta = pos == -2
+        pista = pos >= 0
+
+        entra = pista & (distancia <= pasos)
+        avanza = pista & ~entra
+        destino = pos + pasos
+        destino -= (destino >= TAMANO_TABLERO) * np.int16(TAMANO_TABLERO)
+        destino *= avanza
+        en_recta = recta | entra
+        nueva_pos = carcel * SALIDAS[jugador] + destino - en_recta * np.int16(2)
+        # Una ficha del tablero tiene llegada -1, así que al entrar queda en pasos - distancia
+        nueva_lleg = lleg + recta * pasos + entra * (pasos - distancia + np.int16(1))
+        llego = en_recta & (nueva_lleg == TAMANO_LLEGADA - 1)
+
+        fila = g * COLUMNAS_OCUPACION + 2
+        ocupacion[fila + pos] -= pista
+        ocupacion[fila + nueva_pos] += nueva_pos >= 0
+        posiciones[indice] = nueva_pos
+        llegadas[indice] = nueva_lleg
+        self.terminada.ravel()[indice[llego]] = True
+        self.bonus[g] += llego * np.int16(BONUS_LLEGADA)
+        ultima = self.ultima[g]
+        self.ultima[g] = ultima + ~llego * (jugador * NUMERO_FICHAS + ficha - ultima)
+
+        # Capturar la primera ficha rival que esté en la casilla de destino; solo se
+        # busca donde la casilla tenía otra ficha antes de llegar
+        c = np.nonzero(avanza & ~ESPECIALES[destino] & (ocupacion[fila + destino] > 1))[0]
+        if c.size:
+            partidas = g[c]
+            rivales = ((self.posicion[partidas] == destino[c][:, None, None])
+                       & (np.arange(self.numero_jugadores)[None, :, None] != jugador[c][:, None, None]))
+            rivales = rivales.reshape(c.size, -1)
+            captura = rivales.any(axis=1)
+            if captura.any():
+                partidas = partidas[captura]
+                primera = rivales[captura].argmax(axis=1)
+                self.posicion[partidas, primera // NUMERO_FICHAS, primera % NUMERO_FICHAS] = -1
+                self.llegada[partidas, primera // NUMERO_FICHAS, primera % NUMERO_FICHAS] = -1
+                ocupacion[fila[c][captura] + destino[c][captura]] -= 1
+                self.bonus[partidas] += BONUS_CAPTURA
+                self.capturas[partidas] += 1
+
+        # Quitar el valor usado corriendo los siguientes 16 bits hacia abajo; la suma
+        # los usa todos
+        filas = self.filas_valores[g]
+        self.filas_valores[g] = (filas & VALORES_ANTES[opcion]) | (filas >> np.uint64(16) & VALORES_DESPUES[opcion])
+        return llego
+
+    def simular(self, partidas):
+        # Juega el número de partidas indicado rellenando las ranuras a medida que terminan
+        resultados = ResultadosSimulacion(self.numero_jugadores)
+        if self.tamano_lote < self.tamano_completo:
+            self.crear_estado(self.tamano_completo)
+        iniciadas = min(partidas, self.tamano_lote)
+        self.activa[:] = False
+        self.reiniciar(np.arange(iniciadas))
+        while self.activa.any():
+            terminadas, ganadas = self.paso()
+            if terminadas.size == 0:
+                continue
+            ganadores = np.where(ganadas, self.turno[terminadas], -1)
+            resultados.agregar(ganadores, self.turnos[terminadas], self.capturas[terminadas])
+            nuevas = terminadas[:max(0, partidas - iniciadas)]
+            if nuevas.size:
+                self.reiniciar(nuevas)
+                iniciadas += nuevas.size
+            elif 2 * np.count_nonzero(self.activa) <= self.tamano_lote:
+                # Ya no quedan partidas por empezar
+                self.compactar()
+        return resultados
+
+class ResultadosSimulacion:
+    def __init__(self, numero_jugadores):
+        self.partidas = 0
+        self.victorias = np.zeros(numero_jugadores, dtype=np.int64)
+        self.sin_ganador = 0
+        self.suma_turnos = 0
+        self.suma_cuadrados_turnos = 0
+        self.capturas = 0
+
+    def agregar(self, ganadores, turnos, capturas):
+        ganadores = np.asarray(ganadores)
+        turnos = np.asarray(turnos, dtype=np.int64)
+        self.partidas += ganadores.size
+        self.victorias += np.bincount(ganadores[ganadores >= 0], minlength=self.victorias.size)
+        self.sin_ganador += int((ganadores < 0).sum())
+        self.suma_turnos += int(turnos.sum())
+        self.suma_cuadrados_turnos += int((turnos * turnos).sum())
+        self.capturas += int(np.sum(capturas))
+
+    def resumen(self):
+        n = max(self.partidas, 1)
+        media = self.suma_turnos / n
+        varianza = max(self.suma_cuadrados_turnos / n - media * media, 0.0)
+        return {
+            "partidas": self.partidas,
+            "tasas": (self.victorias / n).tolist(),
+            "sin_ganador": self.sin_ganador,
+            "turnos_media": media,
+            "turnos_desviacion": math.sqrt(varianza),
+            "capturas_por_partida": self.capturas / n,
+        }
+
+def simular_escalar(partidas, numero_jugadores=NUMERO_JUGADORES, semilla=None, max_turnos=MAX_TURNOS):
+    # Las mismas estadísticas usando Juego, para comparar distribuciones
+    resultados = ResultadosSimulacion(numero_jugadores)
+    azar = random.Random(semilla)
+    for _ in range(partidas):
+        dados = DadosAleatorios(azar.getrandbits(64))
+        politicas = [JugadorAleatorio(azar.getrandbits(64)) for _ in range(numero_jugadores)]
+        juego = Juego(numero_jugadores, politicas=politicas, silencioso=True, fuente_dados=dados)
+        capturas = [0]
+
+        def contar_capturas(evento, datos):
+            if evento == EVENTO_CAPTURA:
+                capturas[0] += 1
+
+        juego.agregar_oyente(contar_capturas)
+        ganador = juego.jugar_partida(max_turnos=max_turnos)
+        resultados.agregar([-1 if ganador is None else ganador], [juego.turnos_jugados], capturas[0])
+    return resultados
+
+def mostrar(nombre, resumen, segundos):
+    tasas = " ".join(f"{t:.4f}" for t in resumen["tasas"])
+    print(f"{nombre}: {resumen['partidas']} partidas en {segundos:.2f} s "
+          f"({resumen['partidas'] / segundos:.0f} partidas/s)")
+    print(f"  victorias por asiento: {tasas}  sin ganador: {resumen['sin_ganador']}")
+    print(f"  turnos: media {resumen['turnos_media']:.2f}, desviación {resumen['turnos_desviacion']:.2f}")
+    print(f"  capturas por partida: {resumen['capturas_por_partida']:.3f}")
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Simulación de Parqués por lotes con NumPy")
+    parser.add_argument("-n", "--partidas", type=int, default=100000)
+    parser.add_argument("-j", "--jugadores", type=int, default=NUMERO_JUGADORES)
+    parser.add_argument("-k", "--lote", type=int, default=8192, help="partidas que avanzan a la vez")
+    parser.add_argument("-s", "--semilla", type=int, default=0)
+    parser.add_argument("--comparar", type=int, metavar="N",
+                        help="jugar también N partidas con el motor escalar y mostrar ambas distribuciones")
+    args = parser.parse_args(argumentos)
+
+    inicio = time.perf_counter()
+    simulador = SimuladorLotes(args.jugadores, args.lote, args.semilla)
+    resumen = simulador.simular(args.partidas).resumen()
+    segundos = time.perf_counter() - inicio
+    mostrar("Lotes", resumen, segundos)
+    por_segundo = resumen["partidas"] / segundos
+
+    if args.comparar:
+        inicio = time.perf_counter()
+        resumen = simular_escalar(args.comparar, args.jugadores, args.semilla).resumen()
+        segundos = time.perf_counter() - inicio
+        mostrar("Escalar", resumen, segundos)
+        print(f"Aceleración: {por_segundo / (resumen['partidas'] / segundos):.1f}x")
+
+if __name__ == "__main__":
+    principal()
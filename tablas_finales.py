@@ -0,0 +1,385 @@
+# Tabla de finales: cuando un jugador tiene todas sus fichas cerca de casa y corre
+# solo hacia la meta, cuántos turnos le faltan en promedio y cuál es la mejor jugada
+# con cada tirada.
+#
+# Cada ficha se describe por su distancia a la meta: 0 si terminó, 7 - k en la
+# casilla k de la recta final y t + 7 a t casillas de la entrada de su recta final.
+# Una ficha a distancia d solo puede avanzar p <= d pasos (Ficha.mover rechaza que
+# se pase). La tabla cubre las posiciones en que todas las fichas del jugador están
+# a DISTANCIA_MAXIMA o menos. Como las fichas son intercambiables, una posición es
+# la lista ordenada de distancias y su índice en la tabla es su rango en el sistema
+# combinatorio, que se calcula en O(1).
+#
+# Modelo: en cada turno se lanzan dos dados y se pueden usar ambos, uno o ninguno,
+# o la suma en una sola ficha si son distintos, como en pasos_turno. Un lanzamiento
+# con pares no cuenta como turno porque el jugador vuelve a lanzar. No hay rivales
+# (ni capturas ni bloqueos) y no se modelan el bonus por llegar ni los tres pares.
+#
+# Archivo: cabecera, un float32 por posición con los turnos esperados y un byte por
+# posición y tirada (d1 <= d2) con la mejor jugada. Se genera por capas según la
+# suma de distancias: cada capa solo depende de las anteriores, sus posiciones se
+# reparten entre procesos y la cabecera guarda cuántas capas están completas, así
+# que una generación interrumpida continúa donde quedó.
+import argparse
+import itertools
+import math
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Proyecto import NUMERO_FICHAS, TAMANO_TABLERO, TAMANO_LLEGADA
+
+# Hasta 17 casillas antes de la entrada (un cuarto del tablero) más la recta final:
+# 24 con TAMANO_LLEGADA = 8, es decir 20475 posiciones de cuatro fichas
+DISTANCIA_MAXIMA = 17 + TAMANO_LLEGADA - 1
+RUTA_TABLA_FINALES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "finales.ptf")
+
+# Las 21 tiradas distintas (d1 <= d2) con su peso sobre 36
+TIRADAS = [(d1, d2, 1 if d1 == d2 else 2) for d1 in range(1, 7) for d2 in range(d1, 7)]
+INDICE_TIRADA = {(d1, d2): i for i, (d1, d2, _) in enumerate(TIRADAS)}
+
+MAGIA = b"PQTF"
+VERSION = 1
+# magia, versión, fichas, distancia máxima, capas completas
+CABECERA = struct.Struct("<4sBBHI")
+TURNOS = struct.Struct("<f")
+
+# Jugada para una tirada (d1 <= d2), en un byte:
+# 0 = pasar; SUMA | i = la suma en la ficha i; si no, (i + 1) * 5 + (j + 1) con i la
+# ficha que usa d1 y j la que usa d2 (-1 = ese dado no se usa). Las fichas se numeran
+# por su lugar en la lista ordenada de distancias.
+PASAR = 0
+SUMA = 0x80
+
+_BINOMIALES = [[math.comb(n, k) for k in range(NUMERO_FICHAS + 1)] for n in range(256 + NUMERO_FICHAS)]
+
+def numero_posiciones(distancia_maxima):
+    return math.comb(distancia_maxima + NUMERO_FICHAS, NUMERO_FICHAS)
+
+def numero_capas(distancia_maxima):
+    return distancia_maxima * NUMERO_FICHAS + 1
+
+def rango(distancias):
+    # Rango de una lista ordenada de distancias entre todas las de su tamaño
+    return sum(_BINOMIALES[d + i][i + 1] for i, d in enumerate(distancias))
+
+def codificar_jugada(ficha_menor, ficha_mayor, suma=False):
+    if suma:
+        return SUMA | ficha_menor
+    return (ficha_menor + 1) * 5 + ficha_mayor + 1
+
+def decodificar_jugada(jugada):
+    # (ficha que usa d1, ficha que usa d2, ficha que usa la suma), -1 si no se usa
+    if jugada & SUMA:
+        return -1, -1, jugada & ~SUMA
+    return jugada // 5 - 1, jugada % 5 - 1, -1
+
+def _candidatas(distancias):
+    # Una ficha sin terminar por cada distancia distinta (las demás darían lo mismo)
+    vistas = set()
+    candidatas = []
+    for i, d in enumerate(distancias):
+        if d and d not in vistas:
+            vistas.add(d)
+            candidatas.append(i)
+    return candidatas
+
+def sucesores(distancias, dado1, dado2):
+    # Posiciones (ordenadas) a las que se llega usando al menos un dado, con la jugada.
+    # Entre fichas a la misma distancia solo se prueba la primera.
+    resultado = {}
+    candidatas = _candidatas(distancias)
+    for i in [-1] + candidatas:
+        despues = list(distancias)
+        if i >= 0:
+            if dado1 > despues[i]:
+                continue
+            despues[i] -= dado1
+        for j in [-1] + _candidatas(despues):
+            if j < 0 and i < 0:
+                continue
+            final = list(despues)
+            if j >= 0:
+                if dado2 > final[j]:
+                    continue
+                final[j] -= dado2
+            resultado.setdefault(tuple(sorted(final)), codificar_jugada(i, j))
+    if dado1 != dado2:
+        for i in candidatas:
+            if dado1 + dado2 <= distancias[i]:
+                final = list(distancias)
+                final[i] -= dado1 + dado2
+                resultado.setdefault(tuple(sorted(final)), codificar_jugada(i, -1, suma=True))
+    return resultado
+
+def resolver_posicion(distancias, turnos):
+    # Turnos esperados y jugada por tirada para una posición, dada la función
+    # turnos(rango) de las posiciones con menor suma de distancias
+    jugadas = bytearray(len(TIRADAS))
+    if not any(distancias):
+        return 0.0, jugadas
+    mejores = []
+    for t, (dado1, dado2, _) in enumerate(TIRADAS):
+        mejor = math.inf
+        for siguiente, jugada in sucesores(distancias, dado1, dado2).items():
+            valor = turnos(rango(siguiente))
+            if valor < mejor:
+                mejor, jugadas[t] = valor, jugada
+        mejores.append(mejor)
+
+    # Pasar deja la misma posición, así que su valor es la incógnita: se busca el
+    # conjunto de tiradas con las que conviene pasar hasta que sea consistente
+    pasar = {t for t, mejor in enumerate(mejores) if mejor == math.inf}
+    for _ in range(len(TIRADAS) + 1):
+        fijo = 0.0
+        peso_pasar = 0
+        for t, (dado1, dado2, peso) in enumerate(TIRADAS):
+            fijo += peso * (0 if dado1 == dado2 else 1)
+            if t in pasar:
+                peso_pasar += peso
+            else:
+                fijo += peso * mejores[t]
+        valor = fijo / (36 - peso_pasar)
+        nuevo = {t for t, mejor in enumerate(mejores) if mejor >= valor}
+        if nuevo == pasar:
+            break
+        pasar = nuevo
+    for t in pasar:
+        jugadas[t] = PASAR
+    return valor, jugadas
+
+# Tabla abierta en cada proceso trabajador
+_tabla_trabajador = None
+
+def _iniciar_trabajador(ruta):
+    global _tabla_trabajador
+    _tabla_trabajador = TablaFinales(ruta, completa=False)
+
+def _resolver_tarea(posiciones):
+    tabla = _tabla_trabajador
+    return [(rango(distancias),) + resolver_posicion(distancias, tabla.turnos_rango) for distancias in posiciones]
+
+def _crear_archivo(ruta, distancia_maxima):
+    posiciones = numero_posiciones(distancia_maxima)
+    with open(ruta, "wb") as archivo:
+        archivo.write(CABECERA.pack(MAGIA, VERSION, NUMERO_FICHAS, distancia_maxima, 0))
+        archivo.truncate(CABECERA.size + posiciones * (TURNOS.size + len(TIRADAS)))
+
+def _leer_cabecera(ruta):
+    try:
+        with open(ruta, "rb") as archivo:
+            return CABECERA.unpack(archivo.read(CABECERA.size))
+    except (OSError, struct.error):
+        return None
+
+def generar(ruta=RUTA_TABLA_FINALES, distancia_maxima=DISTANCIA_MAXIMA, procesos=None, tamano_tarea=64,
+            al_progreso=None):
+    # Genera (o continúa) la tabla en ruta. Devuelve cuántas capas se calcularon ahora.
+    cabecera = _leer_cabecera(ruta)
+    if cabecera is None or cabecera[:4] != (MAGIA, VERSION, NUMERO_FICHAS, distancia_maxima):
+        _crear_archivo(ruta, distancia_maxima)
+        capas_completas = 0
+    else:
+        capas_completas = cabecera[4]
+
+    capas = [[] for _ in range(numero_capas(distancia_maxima))]
+    for distancias in itertools.combinations_with_replacement(range(distancia_maxima + 1), NUMERO_FICHAS):
+        capas[sum(distancias)].append(distancias)
+    inicio_jugadas = CABECERA.size + TURNOS.size * numero_posiciones(distancia_maxima)
+
+    with open(ruta, "r+b") as archivo, \
+            mmap.mmap(archivo.fileno(), 0) as mapa, \
+            ProcessPoolExecutor(max_workers=procesos or os.cpu_count() or 1,
+                                initializer=_iniciar_trabajador, initargs=(ruta,)) as ejecutor:
+        for suma in range(capas_completas, len(capas)):
+            capa = capas[suma]
+            tareas = [capa[i:i + tamano_tarea] for i in range(0, len(capa), tamano_tarea)]
+            for resultados in ejecutor.map(_resolver_tarea, tareas):
+                for indice, valor, jugadas in resultados:
+                    TURNOS.pack_into(mapa, CABECERA.size + TURNOS.size * indice, valor)
+                    desplazamiento = inicio_jugadas + len(TIRADAS) * indice
+                    mapa[desplazamiento:desplazamiento + len(TIRADAS)] = jugadas
+            # Primero los datos y después la cabecera: si se interrumpe antes, la capa
+            # se vuelve a calcular
+            mapa.flush()
+            CABECERA.pack_into(mapa, 0, MAGIA, VERSION, NUMERO_FICHAS, distancia_maxima, suma + 1)
+            mapa.flush()
+            if al_progreso is not None:
+                al_progreso(suma + 1, len(capas))
+    return len(capas) - capas_completas
+
+def distancia_meta(juego, ficha):
+    # Distancia de la ficha a la meta (None si está en la cárcel)
+    if ficha.terminada:
+        return 0
+    if ficha.esta_en_carcel():
+        return None
+    if ficha.en_recta_final:
+        return TAMANO_LLEGADA - 1 - ficha.posicion_llegada
+    entrada = juego.tablero.obtener_entrada_llegada(ficha.id_jugador)
+    return (entrada - ficha.posicion) % TAMANO_TABLERO + TAMANO_LLEGADA - 1
+
+def es_carrera(juego, jugador, alcance=12):
+    # Si el jugador corre solo: ninguna ficha en la cárcel, ningún bloqueo entre sus
+    # fichas del tablero y su entrada, y ningún rival a menos de alcance casillas
+    # detrás de ellas (no las puede capturar con una tirada normal)
+    for ficha in juego.obtener_fichas_jugador(jugador):
+        if ficha.terminada or ficha.en_recta_final:
+            continue
+        if ficha.esta_en_carcel():
+            return False
+        entrada = juego.tablero.obtener_entrada_llegada(jugador)
+        if juego.tablero.hay_bloqueo_en_camino(ficha.posicion, (entrada - ficha.posicion) % TAMANO_TABLERO):
+            return False
+        for atras in range(1, alcance + 1):
+            casilla = (ficha.posicion - atras) % TAMANO_TABLERO
+            if any(otra.id_jugador != jugador for otra in juego.tablero.obtener_fichas_en_casilla(casilla)):
+                return False
+    return True
+
+class TablaFinales:
+    # Consulta la tabla directamente sobre el archivo mapeado en memoria: no se carga
+    # nada al heap y cada consulta lee un par de bytes
+    def __init__(self, ruta=RUTA_TABLA_FINALES, completa=True):
+        with open(ruta, "rb") as archivo:
+            self.mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, version, fichas, self.distancia_maxima, capas = CABECERA.unpack_from(self.mapa)
+        if (magia, version, fichas) != (MAGIA, VERSION, NUMERO_FICHAS):
+            raise ValueError(f"{ruta} no es una tabla de finales compatible")
+        if completa and capas < numero_capas(self.distancia_maxima):
+            raise ValueError(f"La tabla {ruta} está incompleta ({capas} de {numero_capas(self.distancia_maxima)} capas); "
+                             f"vuelva a ejecutar la generación para continuarla")
+        self.inicio_jugadas = CABECERA.size + TURNOS.size * numero_posiciones(self.distancia_maxima)
+
+    def cerrar(self):
+        self.mapa.close()
+
+    def turnos_rango(self, indice):
+        return TURNOS.unpack_from(self.mapa, CABECERA.size + TURNOS.size * indice)[0]
+
+    def turnos(self, distancias):
+        # Turnos esperados para terminar desde una lista de distancias
+        return self.turnos_rango(rango(sorted(distancias)))
+
+    def jugada(self, distancias, dado1, dado2):
+        # Mejor jugada (codificada) para las distancias ordenadas y la tirada
+        if dado1 > dado2:
+            dado1, dado2 = dado2, dado1
+        return self.mapa[self.inicio_jugadas + len(TIRADAS) * rango(distancias) + INDICE_TIRADA[dado1, dado2]]
+
+    def posicion_jugador(self, juego, jugador):
+        # Fichas del jugador ordenadas por distancia y sus distancias, o None si
+        # alguna está fuera de la tabla
+        pares = []
+        for ficha in juego.obtener_fichas_jugador(jugador):
+            distancia = distancia_meta(juego, ficha)
+            if distancia is None or distancia > self.distancia_maxima:
+                return None
+            pares.append((distancia, ficha.indice))
+        pares.sort()
+        return [d for d, _ in pares], [i for _, i in pares]
+
+    def sugerir(self, juego, movimientos, valores_dados):
+        # Índice del mejor movimiento de la lista (None = pasar) y los turnos esperados,
+        # o None si la posición no está en la tabla. Con los dos dados sin usar se lee
+        # la jugada guardada; con otros valores (un dado, el bonus) se prueban las
+        # continuaciones con los turnos esperados de la tabla.
+        posicion = self.posicion_jugador(juego, juego.turno_actual)
+        if posicion is None:
+            return None
+        distancias, fichas = posicion
+        if len(valores_dados) == 2 and list(valores_dados) == juego.dados:
+            eleccion = self._eleccion_guardada(juego, distancias, movimientos, valores_dados)
+            if eleccion is not False:
+                return eleccion, self.turnos_rango(rango(distancias))
+
+        mejor, eleccion = self.turnos_rango(rango(distancias)), None
+        for i, (ficha, pasos, indices) in enumerate(movimientos):
+            nuevas = list(distancias)
+            lugar = fichas.index(ficha.indice)
+            if pasos > nuevas[lugar]:
+                continue
+            nuevas[lugar] -= pasos
+            restantes = [v for k, v in enumerate(valores_dados) if k not in indices]
+            valor = self._mejor_continuacion(nuevas, restantes)
+            if valor < mejor:
+                mejor, eleccion = valor, i
+        return eleccion, mejor
+
+    def _eleccion_guardada(self, juego, distancias, movimientos, valores_dados):
+        # Primer movimiento de la jugada guardada, o False si no está entre los posibles
+        dado1, dado2 = sorted(valores_dados)
+        ficha1, ficha2, ficha_suma = decodificar_jugada(self.jugada(distancias, dado1, dado2))
+        if ficha1 < 0 and ficha2 < 0 and ficha_suma < 0:
+            return None
+        buscados = [(distancias[ficha_suma], dado1 + dado2)] if ficha_suma >= 0 else []
+        buscados += [(distancias[ficha], dado) for ficha, dado in ((ficha1, dado1), (ficha2, dado2)) if ficha >= 0]
+        for i, (ficha, pasos, _) in enumerate(movimientos):
+            if (distancia_meta(juego, ficha), pasos) in buscados:
+                return i
+        return False
+
+    def _mejor_continuacion(self, distancias, valores):
+        # Menores turnos esperados usando los valores que quedan en cualquier orden (o no usándolos)
+        mejor = self.turnos_rango(rango(sorted(distancias)))
+        for k, valor in enumerate(valores):
+            restantes = valores[:k] + valores[k + 1:]
+            for lugar, distancia in enumerate(distancias):
+                if 0 < valor <= distancia:
+                    nuevas = list(distancias)
+                    nuevas[lugar] -= valor
+                    mejor = min(mejor, self._mejor_continuacion(nuevas, restantes))
+        return mejor
+
+_TABLAS_ABIERTAS = {}
+
+def abrir_tabla_finales(ruta=RUTA_TABLA_FINALES, obligatoria=False):
+    # Tabla compartida por todo el proceso, o None si no existe (y no es obligatoria)
+    if ruta not in _TABLAS_ABIERTAS:
+        try:
+            _TABLAS_ABIERTAS[ruta] = TablaFinales(ruta)
+        except (OSError, ValueError):
+            if obligatoria:
+                raise
+            return None
+    return _TABLAS_ABIERTAS[ruta]
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera la tabla de finales de Parqués")
+    parser.add_argument("archivo", nargs="?", default=RUTA_TABLA_FINALES)
+    parser.add_argument("-d", "--distancia", type=int, default=DISTANCIA_MAXIMA,
+                        help="distancia máxima a la meta de las fichas incluidas")
+    parser.add_argument("-p", "--procesos", type=int, help="procesos trabajadores (por defecto, todos los núcleos)")
+    parser.add_argument("--consultar", nargs=NUMERO_FICHAS, type=int, metavar="D",
+                        help="mostrar los turnos esperados y las jugadas para estas distancias")
+    args = parser.parse_args(argumentos)
+
+    if args.consultar:
+        tabla = TablaFinales(args.archivo)
+        distancias = sorted(args.consultar)
+        print(f"Distancias {distancias}: {tabla.turnos(distancias):.3f} turnos esperados")
+        for dado1, dado2, _ in TIRADAS:
+            ficha1, ficha2, ficha_suma = decodificar_jugada(tabla.jugada(distancias, dado1, dado2))
+            if ficha_suma >= 0:
+                texto = f"suma {dado1 + dado2} en la ficha a distancia {distancias[ficha_suma]}"
+            else:
+                partes = [f"{dado} en la ficha a distancia {distancias[ficha]}"
+                          for ficha, dado in ((ficha1, dado1), (ficha2, dado2)) if ficha >= 0]
+                texto = ", ".join(partes) or "pasar"
+            print(f"  {dado1} y {dado2}: {texto}")
+        return
+
+    def progreso(capas, total):
+        print(f"\rCapa {capas} de {total}...", end="", flush=True)
+
+    inicio = time.perf_counter()
+    calculadas = generar(args.archivo, args.distancia, args.procesos, al_progreso=progreso)
+    print()
+    print(f"{calculadas} capas calculadas en {time.perf_counter() - inicio:.1f} s; "
+          f"{numero_posiciones(args.distancia)} posiciones en {args.archivo} "
+          f"({os.path.getsize(args.archivo)} bytes)")
+
+if __name__ == "__main__":
+    principal()
@@ -0,0 +1,14 @@
+# La caché de movimientos respeta su capacidad también después de cambiarla
+from Proyecto import CacheMovimientos
+
+
+def test_redimensionar_descarta_las_entradas_menos_usadas():
+    cache = CacheMovimientos(4)
+    for clave in range(4):
+        cache.guardar(clave, [clave])
+    cache.obtener(0)
+    cache.redimensionar(2)
+    assert len(cache.entradas) == 2
+    assert list(cache.entradas) == [3, 0]
+    cache.guardar(4, [4])
+    assert list(cache.entradas) == [0, 4]
@@ -0,0 +1,21 @@
+# La profundidad que informa el jugador es la de su última búsqueda
+from Proyecto import Juego, DadosAleatorios
+from computador import JugadorComputador
+
+
+def test_sin_tiempo_la_profundidad_alcanzada_es_cero():
+    profundidades = []
+
+    class Medido(JugadorComputador):
+        def buscar(self, juego, movimientos, valores_dados):
+            # Valor de una búsqueda anterior que no debe sobrevivir a esta
+            self.profundidad_alcanzada = 7
+            eleccion = super().buscar(juego, movimientos, valores_dados)
+            profundidades.append(self.profundidad_alcanzada)
+            return eleccion
+
+    juego = Juego(2, politicas=[Medido(tiempo_ms=0), Medido(tiempo_ms=0)], silencioso=True,
+                  fuente_dados=DadosAleatorios(3))
+    juego.jugar_partida(60)
+    assert profundidades
+    assert set(profundidades) == {0}
@@ -0,0 +1,37 @@
+# La revisión de bloqueos por turno solo corre con la instrumentación puesta
+from Proyecto import Juego, JugadorAleatorio, Instrumentacion, DadosAleatorios
+
+
+def crear_juego():
+    juego = Juego(4, politicas=[JugadorAleatorio(i) for i in range(4)], silencioso=True,
+                  fuente_dados=DadosAleatorios(7))
+    revisiones = []
+    original = juego.bloqueo_quita_movimientos
+
+    def contar(*args):
+        revisiones.append(args)
+        return original(*args)
+
+    juego.bloqueo_quita_movimientos = contar
+    return juego, revisiones
+
+
+def test_un_oyente_cualquiera_no_activa_la_revision_de_bloqueos():
+    juego, revisiones = crear_juego()
+    eventos = []
+    juego.agregar_oyente(lambda evento, datos: eventos.append(evento))
+    juego.jugar_partida(300)
+    assert eventos and not revisiones
+
+
+def test_la_instrumentacion_cuenta_bloqueos_y_deja_de_hacerlo_al_quitarla():
+    juego, revisiones = crear_juego()
+    perfil = Instrumentacion()
+    perfil.instrumentar(juego)
+    juego.jugar_partida(300)
+    assert revisiones
+    assert perfil.eventos["bloqueos_encontrados"] > 0
+    perfil.desinstrumentar(juego)
+    revisiones.clear()
+    juego.jugar_partida(300)
+    assert not revisiones
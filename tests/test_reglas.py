@@ -0,0 +1,48 @@
+# Reglas del juego que se corrigieron aparte del resto de los cambios
+from Proyecto import Juego, TAMANO_LLEGADA
+
+
+def colocar_en_entrada(juego, ficha):
+    # Deja la ficha en la entrada de su recta final, registrada en el tablero
+    ficha.posicion = juego.tablero.obtener_entrada_llegada(ficha.id_jugador)
+    juego.tablero.agregar_ficha(ficha)
+
+
+def test_ficha_que_entra_en_la_ultima_casilla_de_la_llegada_termina():
+    juego = Juego(2, silencioso=True)
+    ficha = juego.obtener_fichas_jugador(0)[0]
+    colocar_en_entrada(juego, ficha)
+    assert juego.realizar_movimiento(ficha, TAMANO_LLEGADA - 1)
+    assert ficha.terminada
+
+
+def test_ficha_que_entra_antes_de_la_ultima_casilla_sigue_en_juego():
+    juego = Juego(2, silencioso=True)
+    ficha = juego.obtener_fichas_jugador(0)[0]
+    colocar_en_entrada(juego, ficha)
+    assert juego.realizar_movimiento(ficha, TAMANO_LLEGADA - 2)
+    assert ficha.en_recta_final and not ficha.terminada
+
+
+def test_tres_pares_no_regresan_a_la_carcel_una_ficha_terminada():
+    juego = Juego(2, silencioso=True)
+    ficha = juego.obtener_fichas_jugador(0)[0]
+    colocar_en_entrada(juego, ficha)
+    juego.realizar_movimiento(ficha, TAMANO_LLEGADA - 1)
+    juego.ultima_ficha_movida = ficha
+    juego.pares_consecutivos = 2
+    juego.dados = [3, 3]
+    assert juego.verificar_pares()
+    assert ficha.terminada and ficha.en_recta_final
+    assert ficha.posicion_llegada == TAMANO_LLEGADA - 1
+
+
+def test_tres_pares_regresan_a_la_carcel_la_ultima_ficha_movida():
+    juego = Juego(2, silencioso=True)
+    ficha = juego.obtener_fichas_jugador(0)[0]
+    colocar_en_entrada(juego, ficha)
+    juego.ultima_ficha_movida = ficha
+    juego.pares_consecutivos = 2
+    juego.dados = [3, 3]
+    assert juego.verificar_pares()
+    assert ficha.esta_en_carcel()
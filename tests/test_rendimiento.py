@@ -0,0 +1,35 @@
+# --metricas solo acepta nombres que existen en la base y en la corrida actual
+import json
+
+import pytest
+
+import rendimiento
+
+
+def guardar_base(tmp_path, metricas):
+    ruta = tmp_path / "base.json"
+    ruta.write_text(json.dumps({"commit": None, "metricas": metricas}), encoding="utf-8")
+    return str(ruta)
+
+
+def test_metrica_que_no_esta_en_la_base_se_rechaza(tmp_path, capsys):
+    base = guardar_base(tmp_path, {"turnos_por_segundo": {"valor": 1.0, "unidad": "turnos/s",
+                                                          "menor_es_mejor": False}})
+    with pytest.raises(SystemExit) as salida:
+        rendimiento.principal(["--comparar", base, "--metricas", "turnos_por_segundo", "turnos_por_segundoo"])
+    assert salida.value.code == 2
+    assert "turnos_por_segundoo" in capsys.readouterr().err
+
+
+def test_metrica_que_la_corrida_actual_no_mide_se_rechaza(tmp_path, capsys):
+    base = guardar_base(tmp_path, {"metrica_retirada": {"valor": 1.0, "unidad": "us", "menor_es_mejor": True}})
+    with pytest.raises(SystemExit) as salida:
+        rendimiento.principal(["-r", "1", "--comparar", base, "--metricas", "metrica_retirada"])
+    assert salida.value.code == 2
+    assert "metrica_retirada" in capsys.readouterr().err
+
+
+def test_metricas_sin_comparar_se_rechaza():
+    with pytest.raises(SystemExit) as salida:
+        rendimiento.principal(["--metricas", "turnos_por_segundo"])
+    assert salida.value.code == 2
@@ -0,0 +1,38 @@
+# El servidor rechaza con un mensaje de error las mesas con parámetros no válidos
+import asyncio
+import json
+
+from servidor import Servidor
+
+
+async def crear_mesa(mensaje):
+    servidor = Servidor()
+    puerto = await servidor.iniciar(puerto=0)
+    try:
+        lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+        escritor.write((json.dumps({"accion": "crear", "jugadores": 2, "bots": 2, **mensaje}) + "\n").encode())
+        await escritor.drain()
+        respuesta = json.loads(await asyncio.wait_for(lector.readline(), 5))
+        escritor.close()
+        return respuesta, len(servidor.mesas)
+    finally:
+        await servidor.detener()
+
+
+def test_tiempo_turno_no_numerico_se_rechaza():
+    respuesta, mesas = asyncio.run(crear_mesa({"tiempo_turno": "x"}))
+    assert respuesta["tipo"] == "error" and "tiempo" in respuesta["mensaje"].lower()
+    assert mesas == 0
+
+
+def test_tiempo_turno_negativo_o_booleano_se_rechaza():
+    for tiempo in (-1, 0, True):
+        respuesta, mesas = asyncio.run(crear_mesa({"tiempo_turno": tiempo}))
+        assert respuesta["tipo"] == "error"
+        assert mesas == 0
+
+
+def test_tiempo_turno_valido_crea_la_mesa():
+    respuesta, mesas = asyncio.run(crear_mesa({"tiempo_turno": 0.5}))
+    assert respuesta["tipo"] == "mesa_creada"
+    assert mesas == 1
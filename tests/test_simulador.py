@@ -0,0 +1,27 @@
+# El simulador por lotes juega exactamente las mismas partidas para una semilla
+import pytest
+
+pytest.importorskip("numpy")
+
+from simulador import SimuladorLotes
+
+
+@pytest.mark.parametrize("jugadores, lote, partidas, victorias, suma_turnos, capturas", [
+    # Resultados de la versión que calculaba los movimientos con np.where y módulos
+    (4, 256, 600, [171, 148, 153, 128], 113647, 12384),
+    (2, 64, 300, [135, 165], 29827, 1063),
+])
+def test_resultados_fijos_por_semilla(jugadores, lote, partidas, victorias, suma_turnos, capturas):
+    resultados = SimuladorLotes(jugadores, lote, semilla=1).simular(partidas)
+    assert resultados.partidas == partidas and resultados.sin_ganador == 0
+    assert resultados.victorias.tolist() == victorias
+    assert resultados.suma_turnos == suma_turnos
+    assert resultados.capturas == capturas
+
+
+def test_simular_de_nuevo_usa_el_lote_completo():
+    # Al final de cada simulación el lote se compacta; la siguiente lo recupera
+    simulador = SimuladorLotes(4, 64, semilla=2)
+    simulador.simular(100)
+    assert simulador.tamano_lote < 64
+    assert simulador.simular(100).partidas == 100
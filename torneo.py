@@ -0,0 +1,312 @@
+import argparse
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from Proyecto import (
+    Juego, JugadorAleatorio, JugadorPrimero, DadosAleatorios, DadosNumpy,
+    EVENTO_CAPTURA, NUMERO_JUGADORES, CACHE_MOVIMIENTOS, Instrumentacion,
+)
+from computador import JugadorComputador
+from tablas_finales import abrir_tabla_finales
+
+# Máximo de turnos antes de dar una partida por abandonada
+MAX_TURNOS = 20000
+
+# Políticas disponibles para el torneo (nombre -> constructor con semilla)
+POLITICAS = {
+    "aleatorio": lambda semilla: JugadorAleatorio(semilla),
+    "primero": lambda semilla: JugadorPrimero(),
+    "computador": lambda semilla: JugadorComputador(),
+    # El mismo bot con la tabla de finales (hay que generarla antes)
+    "finales": lambda semilla: JugadorComputador(tabla_finales=abrir_tabla_finales(obligatoria=True)),
+}
+
+# Fuentes de dados disponibles (nombre -> constructor con semilla). Cada partida usa
+# el subflujo de su índice, así se reproduce igual en cualquier proceso.
+FUENTES_DADOS = {
+    "aleatorio": DadosAleatorios,
+    "numpy": DadosNumpy,
+}
+
+def crear_politica(nombre, semilla):
+    if nombre not in POLITICAS:
+        raise ValueError(f"Política desconocida: {nombre}")
+    return POLITICAS[nombre](semilla)
+
+def semilla_partida(semilla, indice):
+    # Cada partida tiene su propia semilla, así el resultado no depende
+    # de cuántos procesos haya ni de qué proceso la juegue
+    return f"{semilla}:{indice}"
+
+class Estadisticas:
+    # Acumulador de resultados que se puede combinar entre procesos.
+    # Guarda solo sumas, así que la memoria no crece con el número de partidas.
+    def __init__(self, numero_participantes):
+        self.partidas = 0
+        self.victorias = [0] * numero_participantes
+        self.sin_ganador = 0
+        self.capturas = 0
+        # Media y suma de cuadrados de la duración (algoritmo de Welford)
+        self.media_turnos = 0.0
+        self.m2_turnos = 0.0
+        self.min_turnos = None
+        self.max_turnos = None
+        # Consultas a la caché de movimientos (si se usa)
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+        # Contadores de Instrumentacion (si se pidió el perfil)
+        self.perfil = None
+
+    def agregar_partida(self, ganador, turnos, capturas):
+        self.partidas += 1
+        if ganador is None:
+            self.sin_ganador += 1
+        else:
+            self.victorias[ganador] += 1
+        self.capturas += capturas
+        delta = turnos - self.media_turnos
+        self.media_turnos += delta / self.partidas
+        self.m2_turnos += delta * (turnos - self.media_turnos)
+        self.min_turnos = turnos if self.min_turnos is None else min(self.min_turnos, turnos)
+        self.max_turnos = turnos if self.max_turnos is None else max(self.max_turnos, turnos)
+
+    def combinar(self, otra):
+        if otra.partidas == 0:
+            return
+        total = self.partidas + otra.partidas
+        delta = otra.media_turnos - self.media_turnos
+        self.m2_turnos += otra.m2_turnos + delta * delta * self.partidas * otra.partidas / total
+        self.media_turnos += delta * otra.partidas / total
+        self.partidas = total
+        self.victorias = [a + b for a, b in zip(self.victorias, otra.victorias)]
+        self.sin_ganador += otra.sin_ganador
+        self.capturas += otra.capturas
+        self.cache_aciertos += otra.cache_aciertos
+        self.cache_fallos += otra.cache_fallos
+        if otra.perfil is not None:
+            if self.perfil is None:
+                self.perfil = Instrumentacion()
+            self.perfil.combinar(otra.perfil)
+        for nombre, funcion in (("min_turnos", min), ("max_turnos", max)):
+            mio, suyo = getattr(self, nombre), getattr(otra, nombre)
+            setattr(self, nombre, suyo if mio is None else funcion(mio, suyo))
+
+    def tasa_victoria(self, participante):
+        if self.partidas == 0:
+            return 0.0
+        return self.victorias[participante] / self.partidas
+
+    def intervalo(self, participante, z):
+        # Intervalo de Wilson para la tasa de victorias
+        n = self.partidas
+        if n == 0:
+            return 0.0, 1.0
+        p = self.tasa_victoria(participante)
+        denominador = 1 + z * z / n
+        centro = (p + z * z / (2 * n)) / denominador
+        semiancho = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominador
+        return centro - semiancho, centro + semiancho
+
+    def semiancho_maximo(self, z):
+        anchos = [self.intervalo(i, z) for i in range(len(self.victorias))]
+        return max((alto - bajo) / 2 for bajo, alto in anchos)
+
+    def desviacion_turnos(self):
+        if self.partidas < 2:
+            return 0.0
+        return math.sqrt(self.m2_turnos / (self.partidas - 1))
+
+    def resumen(self, nombres, z):
+        return {
+            "partidas": self.partidas,
+            "sin_ganador": self.sin_ganador,
+            "participantes": [
+                {
+                    "politica": nombre,
+                    "victorias": self.victorias[i],
+                    "tasa": self.tasa_victoria(i),
+                    "intervalo": self.intervalo(i, z),
+                }
+                for i, nombre in enumerate(nombres)
+            ],
+            "turnos": {
+                "media": self.media_turnos,
+                "desviacion": self.desviacion_turnos(),
+                "min": self.min_turnos,
+                "max": self.max_turnos,
+            },
+            "capturas_por_partida": self.capturas / self.partidas if self.partidas else 0.0,
+            "cache": {"aciertos": self.cache_aciertos, "fallos": self.cache_fallos},
+            "perfil": self.perfil.instantanea() if self.perfil is not None else None,
+        }
+
+def jugar_lote(nombres, semilla, inicio, cantidad, rotar=True, max_turnos=MAX_TURNOS, cache=0, perfil=False,
+               dados="aleatorio"):
+    # Función del proceso trabajador: juega las partidas [inicio, inicio + cantidad).
+    # Con cache > 0 las partidas del proceso comparten una caché de movimientos de ese tamaño.
+    # Con perfil se instrumentan las partidas y los contadores viajan en las estadísticas.
+    numero_jugadores = len(nombres)
+    estadisticas = Estadisticas(numero_jugadores)
+    if perfil:
+        estadisticas.perfil = Instrumentacion()
+    fuente_dados = FUENTES_DADOS[dados](semilla)
+    cache_movimientos = None
+    if cache:
+        cache_movimientos = CACHE_MOVIMIENTOS
+        cache_movimientos.redimensionar(cache)
+        aciertos, fallos = cache_movimientos.aciertos, cache_movimientos.fallos
+    for indice in range(inicio, inicio + cantidad):
+        semilla_juego = semilla_partida(semilla, indice)
+        # Rotar los asientos para que ninguna política tenga siempre la ventaja de empezar
+        desplazamiento = indice % numero_jugadores if rotar else 0
+        participantes = [(asiento + desplazamiento) % numero_jugadores for asiento in range(numero_jugadores)]
+        politicas = [
+            crear_politica(nombres[participante], f"{semilla_juego}:{asiento}")
+            for asiento, participante in enumerate(participantes)
+        ]
+        juego = Juego(numero_jugadores, politicas=politicas, silencioso=True, fuente_dados=fuente_dados.partida(indice))
+        juego.cache_movimientos = cache_movimientos
+        capturas = [0]
+
+        def contar_capturas(evento, datos):
+            if evento == EVENTO_CAPTURA:
+                capturas[0] += 1
+
+        juego.agregar_oyente(contar_capturas)
+        if estadisticas.perfil is not None:
+            estadisticas.perfil.instrumentar(juego)
+        ganador = juego.jugar_partida(max_turnos=max_turnos)
+        estadisticas.agregar_partida(
+            None if ganador is None else participantes[ganador],
+            juego.turnos_jugados,
+            capturas[0],
+        )
+    if cache_movimientos is not None:
+        estadisticas.cache_aciertos = cache_movimientos.aciertos - aciertos
+        estadisticas.cache_fallos = cache_movimientos.fallos - fallos
+    return estadisticas
+
+def jugar_torneo(nombres, partidas=None, procesos=None, semilla=0, lote=100, precision=None,
+                 confianza=0.95, minimo_partidas=1000, rotar=True, max_turnos=MAX_TURNOS, cache=0, al_progreso=None,
+                 perfil=None, intervalo_perfil=10.0, dados="aleatorio"):
+    # Reparte lotes de partidas entre procesos y combina los resultados a medida que llegan.
+    # Con precision se detiene cuando todos los intervalos de confianza tienen
+    # un semiancho menor o igual a ese valor. Con perfil (una ruta) se instrumentan las
+    # partidas y los contadores acumulados se vuelcan a ese archivo cada intervalo_perfil
+    # segundos y al terminar.
+    if not 2 <= len(nombres) <= NUMERO_JUGADORES:
+        raise ValueError(f"Se necesitan entre 2 y {NUMERO_JUGADORES} políticas")
+    if partidas is None and precision is None:
+        raise ValueError("Indique el número de partidas o la precisión deseada")
+    if dados not in FUENTES_DADOS:
+        raise ValueError(f"Fuente de dados desconocida: {dados}")
+
+    procesos = procesos or os.cpu_count() or 1
+    z = statistics.NormalDist().inv_cdf((1 + confianza) / 2)
+    total = Estadisticas(len(nombres))
+    if perfil is not None:
+        total.perfil = Instrumentacion()
+        total.perfil.volcar_periodicamente(perfil, intervalo_perfil)
+    siguiente = 0
+    detener = False
+    pendientes = set()
+
+    with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+        while True:
+            # Mantener solo unos pocos lotes en vuelo para no acumular memoria
+            while not detener and len(pendientes) < 2 * procesos and (partidas is None or siguiente < partidas):
+                cantidad = lote if partidas is None else min(lote, partidas - siguiente)
+                pendientes.add(ejecutor.submit(jugar_lote, nombres, semilla, siguiente, cantidad, rotar, max_turnos,
+                                               cache, perfil is not None, dados))
+                siguiente += cantidad
+            if not pendientes:
+                break
+
+            terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                if not futuro.cancelled():
+                    total.combinar(futuro.result())
+            if al_progreso is not None:
+                al_progreso(total)
+
+            if (precision is not None and not detener and total.partidas >= minimo_partidas
+                    and total.semiancho_maximo(z) <= precision):
+                detener = True
+                for futuro in pendientes:
+                    futuro.cancel()
+
+    if perfil is not None:
+        total.perfil.detener_volcado()
+        total.perfil.volcar(perfil)
+    return total.resumen(nombres, z)
+
+def mostrar_resumen(resumen, segundos):
+    print(f"Partidas jugadas: {resumen['partidas']} ({resumen['partidas'] / segundos:.1f} partidas/s)")
+    if resumen["sin_ganador"]:
+        print(f"Partidas sin ganador: {resumen['sin_ganador']}")
+    for i, participante in enumerate(resumen["participantes"]):
+        bajo, alto = participante["intervalo"]
+        print(f"  {i}. {participante['politica']:<12} {participante['tasa']:.4f}  [{bajo:.4f}, {alto:.4f}]")
+    turnos = resumen["turnos"]
+    print(f"Turnos por partida: media {turnos['media']:.1f}, desviación {turnos['desviacion']:.1f}, "
+          f"mín {turnos['min']}, máx {turnos['max']}")
+    print(f"Capturas por partida: {resumen['capturas_por_partida']:.2f}")
+    cache = resumen["cache"]
+    consultas = cache["aciertos"] + cache["fallos"]
+    if consultas:
+        print(f"Caché de movimientos: {cache['aciertos']} aciertos, {cache['fallos']} fallos "
+              f"({cache['aciertos'] / consultas:.1%})")
+    perfil = resumen["perfil"]
+    if perfil is not None:
+        print("Perfil por fase:")
+        for fase, datos in perfil["fases"].items():
+            print(f"  {fase:<12} {datos['llamadas']:>12} llamadas {datos['segundos']:>9.3f} s "
+                  f"{datos['us_por_llamada']:>8.2f} us/llamada")
+        eventos = ", ".join(f"{evento} {valor:.2f}" for evento, valor in perfil["eventos_por_partida"].items())
+        print(f"Eventos por partida: {eventos}")
+
+def principal(argumentos=None):
+    parser = argparse.ArgumentParser(description="Torneo de bots de Parqués en varios procesos")
+    parser.add_argument("politicas", nargs="+", choices=sorted(POLITICAS),
+                        help="una política por asiento (2 a 4)")
+    parser.add_argument("-n", "--partidas", type=int, help="número de partidas a jugar")
+    parser.add_argument("-p", "--procesos", type=int, help="procesos trabajadores (por defecto, todos los núcleos)")
+    parser.add_argument("-s", "--semilla", type=int, default=0)
+    parser.add_argument("--lote", type=int, default=100, help="partidas por tarea")
+    parser.add_argument("--precision", type=float,
+                        help="detenerse cuando el semiancho del intervalo de confianza sea menor a este valor")
+    parser.add_argument("--confianza", type=float, default=0.95)
+    parser.add_argument("--sin-rotar", action="store_true", help="no rotar los asientos entre partidas")
+    parser.add_argument("--cache", type=int, default=0, metavar="N",
+                        help="usar una caché de N listas de movimientos por proceso y mostrar su tasa de aciertos")
+    parser.add_argument("--dados", choices=sorted(FUENTES_DADOS), default="aleatorio",
+                        help="fuente de dados (numpy requiere numpy)")
+    parser.add_argument("--perfil", metavar="ARCHIVO",
+                        help="instrumentar las partidas y volcar los contadores en JSON a este archivo")
+    parser.add_argument("--intervalo-perfil", type=float, default=10.0,
+                        help="segundos entre volcados del perfil")
+    args = parser.parse_args(argumentos)
+
+    if args.partidas is None and args.precision is None:
+        parser.error("indique --partidas o --precision")
+    if not 2 <= len(args.politicas) <= NUMERO_JUGADORES:
+        parser.error(f"se necesitan entre 2 y {NUMERO_JUGADORES} políticas")
+
+    def progreso(estadisticas):
+        print(f"\r{estadisticas.partidas} partidas...", end="", flush=True)
+
+    inicio = time.perf_counter()
+    resumen = jugar_torneo(
+        args.politicas, partidas=args.partidas, procesos=args.procesos, semilla=args.semilla,
+        lote=args.lote, precision=args.precision, confianza=args.confianza,
+        rotar=not args.sin_rotar, cache=args.cache, al_progreso=progreso,
+        perfil=args.perfil, intervalo_perfil=args.intervalo_perfil, dados=args.dados,
+    )
+    print()
+    mostrar_resumen(resumen, time.perf_counter() - inicio)
+
+if __name__ == "__main__":
+    principal()